@@ -1,10 +1,15 @@
 from flask import Flask
 # Removido: from flask_sqlalchemy import SQLAlchemy
 from .models import db # Import db de .models
+from .replicas import replica_binds, attach_write_marker
+from .sharding import shard_binds, get_shard_router
+from .json_provider import get_json_provider_class
+from .profiling import init_profiling
+from .capture import init_capture
 
 # Removido: db = SQLAlchemy() - Será inicializado em models.py
 
-def create_app():
+def create_app(config_overrides=None):
     app = Flask(__name__)
 
     # Configurações do app
@@ -16,14 +21,154 @@ def create_app():
     app.config['AUTHORIZATION_SERVICE_URL'] = 'https://run.mocky.io/v3/5794d450-d2e2-4412-8131-73d0293ac1cc'
     app.config['NOTIFICATION_SERVICE_URL'] = 'https://run.mocky.io/v3/54dc2cf1-3add-45b5-b5a9-6bf7e7f1f4a6'
 
+    # Micro-batching das chamadas ao autorizador (desligado: uma chamada por transferência)
+    app.config['AUTHORIZATION_BATCHING_ENABLED'] = False
+    app.config['AUTHORIZATION_BATCH_URL'] = None # Endpoint de lote; None = chamadas concorrentes em pipeline
+    app.config['AUTHORIZATION_BATCH_MAX_SIZE'] = 32
+    app.config['AUTHORIZATION_BATCH_MAX_WAIT'] = 0.005 # Segundos aguardando mais pedidos para o lote
+    app.config['AUTHORIZATION_BATCH_MAX_IN_FLIGHT'] = 4 # Chamadas de lote simultâneas ao autorizador
+    app.config['AUTHORIZATION_TIMEOUT'] = 5.0
+
+    # Agregação de notificações: primeiro aviso imediato, demais da janela num digest por recebedor
+    app.config['NOTIFICATION_AGGREGATION_ENABLED'] = False
+    app.config['NOTIFICATION_DIGEST_URL'] = None # None = NOTIFICATION_SERVICE_URL
+    app.config['NOTIFICATION_DIGEST_WINDOW'] = 5.0 # Segundos
+    app.config['NOTIFICATION_DIGEST_MAX_EVENTS'] = 500 # Digest enviado antes do fim da janela ao atingir este total
+    app.config['NOTIFICATION_SENDER_LANES'] = 4 # Threads de envio; cada recebedor sempre no mesmo lane (ordem)
+
+    # Admission control (load shedding) para rotas decoradas com @admission_controlled
+    app.config['ADMISSION_ENABLED'] = True
+    app.config['ADMISSION_MAX_CONCURRENCY'] = 32 # Limite máximo de requisições simultâneas por rota
+    app.config['ADMISSION_MIN_CONCURRENCY'] = 1 # Piso do limite adaptativo
+    app.config['ADMISSION_MAX_QUEUE'] = 64 # Requisições que podem aguardar uma vaga
+    app.config['ADMISSION_QUEUE_TIMEOUT'] = 1.0 # Segundos de espera na fila antes do 503
+    app.config['ADMISSION_TARGET_LATENCY'] = 0.5 # Latência (s) acima da qual o limite diminui
+
+    # Limites de velocidade por pagador/IP, verificados antes de qualquer acesso ao banco
+    app.config['RATE_LIMIT_ENABLED'] = False
+    app.config['RATE_LIMIT_BACKEND'] = None # None = InMemoryRateLimitBackend (por processo)
+    app.config['RATE_LIMIT_RULES'] = [
+        # (escopo, métrica, limite, janela em segundos)
+        ('payer', 'count', 10, 60),
+        ('payer', 'amount', '5000.00', 3600),
+        ('ip', 'count', 120, 60),
+    ]
+
+    # Réplicas de leitura (binds replica_0, replica_1, ...) para consultas somente leitura
+    app.config['READ_REPLICA_URIS'] = []
+    app.config['READ_REPLICA_STICKY_SECONDS'] = 5.0 # Leituras vão ao primário logo após escrita da própria conta
+    app.config['READ_REPLICA_MAX_LAG_SECONDS'] = 2.0
+    app.config['READ_REPLICA_LAG_PROBE'] = None # Callable(bind_key) -> atraso em segundos; None = sem medição
+    # Marcador de escrita devolvido ao cliente: leituras seguintes vão ao primário em qualquer worker
+    app.config['READ_REPLICA_WRITE_HEADER'] = 'X-Last-Write'
+    app.config['READ_REPLICA_WRITE_COOKIE'] = 'last_write'
+
+    # Sharding de contas por hash do UUID (binds shard_0, shard_1, ...); vazio = banco único
+    app.config['SHARD_URIS'] = []
+    app.config['SHARD_RECOVERY_GRACE_SECONDS'] = 60 # Idade mínima de uma saga para o sweeper retomá-la
+
+    # Arquivamento de transações antigas em segmentos NDJSON comprimidos
+    app.config['ARCHIVE_DIR'] = None # None = <instance_path>/archive
+    app.config['ARCHIVE_AFTER_DAYS'] = 30 # Transações finalizadas mais antigas que isso saem da tabela quente
+
+    # Agendador de transferências agendadas/recorrentes (thread no processo)
+    app.config['SCHEDULER_ENABLED'] = False
+    app.config['SCHEDULER_WINDOW_SECONDS'] = 300 # Só agendamentos que vencem nesta janela ficam em memória
+    app.config['SCHEDULER_MAX_LOADED'] = 10_000
+    app.config['SCHEDULER_BATCH_SIZE'] = 100
+    app.config['SCHEDULER_POLL_INTERVAL'] = 1.0
+    app.config['SCHEDULER_REFRESH_SECONDS'] = 30 # Recarrega a janela (agendamentos criados por outros processos)
+    app.config['SCHEDULER_LEASE_SECONDS'] = 300 # Execução final sem conclusão após este tempo é recuperada
+
+    # Registros FAILED gravados em lote por uma thread (desligado: commit na própria requisição)
+    app.config['FAILED_WRITER_ENABLED'] = False
+    app.config['FAILED_WRITER_MAX_BUFFER'] = 10_000 # Acima disso os registros vão direto para o arquivo de spill
+    app.config['FAILED_WRITER_BATCH_SIZE'] = 500
+    app.config['FAILED_WRITER_FLUSH_INTERVAL'] = 0.5
+    app.config['FAILED_WRITER_SPILL_PATH'] = None # None = <instance_path>/failed_attempts.ndjson (um arquivo por pid)
+
+    # Modo assíncrono: POST /transactions reserva o saldo, responde 202 e workers finalizam
+    app.config['ASYNC_TRANSFERS_ENABLED'] = False
+    app.config['ASYNC_TRANSFER_WORKERS'] = 8 # Concorrência dos workers, independente da do servidor HTTP
+    app.config['ASYNC_TRANSFER_QUEUE_SIZE'] = 1000 # Fila cheia = 503 antes de reservar
+    app.config['ASYNC_HOLD_TTL_SECONDS'] = 300 # Reservas mais antigas são liberadas pelo sweeper (FAILED)
+    app.config['ASYNC_SWEEP_INTERVAL'] = 30.0
+
+    # Cache em memória das respostas de GET /transactions/<id> para transações finalizadas
+    app.config['TRANSACTION_CACHE_SIZE'] = 10_000
+    app.config['TRANSACTION_CACHE_COMPLETED_TTL'] = 60 # COMPLETED ainda pode ser estornada: max-age curto
+
+    # Profiling por requisição (header ou amostragem); desligado = nenhum hook instalado
+    app.config['ACCOUNT_LOOKUP_TOKEN'] = None # /accounts/lookup exige este valor no header X-Admin-Token; None = desligado
+    app.config['PROFILING_ENABLED'] = False
+    app.config['PROFILING_HEADER'] = 'X-Profile' # Requisições com este header (valor = PROFILING_TOKEN) são perfiladas
+    app.config['PROFILING_TOKEN'] = None # Sem token o header é ignorado e /debug/profiles não existe
+    app.config['PROFILING_SAMPLE_RATE'] = 0.0 # Fração das requisições perfiladas sem header
+    app.config['PROFILING_INTERVAL'] = 0.005 # Segundos entre amostras de pilha
+    app.config['PROFILING_SLOW_QUERY_SECONDS'] = 0.05
+    app.config['PROFILING_MAX_RESULTS'] = 50 # Perfis mantidos para /debug/profiles
+    app.config['PROFILING_OUTPUT_DIR'] = None # Se definido, grava <id>.collapsed para flamegraph/speedscope
+
+    # Captura de tráfego sanitizado (NDJSON gzip rotativo) para replay com `flask replay-traffic`
+    app.config['CAPTURE_ENABLED'] = False
+    app.config['CAPTURE_DIR'] = None # None = <instance_path>/captures
+    app.config['CAPTURE_ENDPOINTS'] = ('main.create_user', 'main.create_transaction', 'main.get_user_balance')
+    app.config['CAPTURE_MAX_FILE_BYTES'] = 64 * 1024 * 1024 # Tamanho (comprimido) em que o segmento é rotacionado
+    app.config['CAPTURE_MAX_FILES'] = 20 # Segmentos mais antigos são apagados
+    app.config['CAPTURE_FLUSH_RECORDS'] = 256
+    app.config['CAPTURE_FLUSH_INTERVAL'] = 5.0
+    app.config['CAPTURE_SALT'] = None # Chave dos pseudônimos de documentos/e-mails; None = aleatória por execução
+
+    # Servidor de produção (flask serve): gunicorn com workers pré-forkados
+    app.config['SERVER_BIND'] = '0.0.0.0:8000'
+    app.config['SERVER_WORKERS'] = None # None = 2 * CPUs + 1
+    app.config['SERVER_THREADS'] = 4 # > 1 usa o worker gthread
+    app.config['SERVER_TIMEOUT'] = 30
+    app.config['SERVER_GRACEFUL_TIMEOUT'] = 30 # Tempo para concluir requisições em andamento no desligamento
+    app.config['SERVER_MAX_REQUESTS'] = 0 # Reciclagem de workers (0 = desligado)
+    app.config['SERVER_MAX_REQUESTS_JITTER'] = 0
+
+    # Serialização JSON (jsonify / request.get_json) com orjson; False = provider da stdlib
+    app.config['JSON_FAST_PROVIDER'] = True
+
+    # Overrides (ex.: testes) aplicados antes de inicializar extensões
+    if config_overrides:
+        app.config.update(config_overrides)
+
+    if app.config['SHARD_URIS']:
+        # Estes modos gravam só no banco principal; com contas nos shards perderiam dinheiro ou registros
+        for option in ('ASYNC_TRANSFERS_ENABLED', 'FAILED_WRITER_ENABLED', 'SCHEDULER_ENABLED'):
+            if app.config.get(option):
+                raise ValueError(f"{option} is not supported with SHARD_URIS.")
+
+    app.json = get_json_provider_class(app.config['JSON_FAST_PROVIDER'])(app)
+
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds.update(replica_binds(app.config['READ_REPLICA_URIS']))
+    binds.update(shard_binds(app.config['SHARD_URIS']))
+    app.config['SQLALCHEMY_BINDS'] = binds
+
     # Inicializa o SQLAlchemy com o app
     db.init_app(app)
 
     with app.app_context(): # Adicionar contexto para db.create_all()
         db.create_all() # Cria tabelas se não existirem
+        if app.config['SHARD_URIS']:
+            get_shard_router().create_all()
+
+    from .commands import register_commands
+    register_commands(app)
+
+    if app.config['SCHEDULER_ENABLED']:
+        from .scheduler import get_transfer_scheduler
+        with app.app_context():
+            get_transfer_scheduler().start()
 
     # Importa e registra as rotas
     from .routes import main
     app.register_blueprint(main)
+    app.after_request(attach_write_marker)
+    init_profiling(app)
+    init_capture(app)
 
     return app
\ No newline at end of file
@@ -0,0 +1,133 @@
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, jsonify, request
+
+
+class AdmissionController:
+    """
+    Per-route concurrency limiter with a bounded wait queue and an adaptive limit.
+
+    Requests beyond the current limit wait in a bounded queue up to `queue_timeout`
+    seconds; if the queue is full or the deadline passes they are rejected so the
+    caller can answer 503 immediately instead of tying up a worker.
+    The limit shrinks multiplicatively when the observed latency (EWMA) exceeds
+    `target_latency` and grows additively while it stays below it.
+    """
+
+    def __init__(self, max_limit=32, min_limit=1, initial_limit=None, max_queue=64,
+                 queue_timeout=1.0, target_latency=0.5, backoff_ratio=0.9, ewma_alpha=0.2):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial_limit if initial_limit is not None else max_limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.backoff_ratio = backoff_ratio
+        self.ewma_alpha = ewma_alpha
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.latency_ewma = None
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    def _has_capacity(self):
+        return self.in_flight < int(self.limit)
+
+    def try_acquire(self):
+        """Returns True when the request may proceed, False when it must be shed."""
+        with self._cond:
+            if self._has_capacity() and self.waiting == 0:
+                self.in_flight += 1
+                return True
+
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+
+            deadline = time.monotonic() + self.queue_timeout
+            self.waiting += 1
+            try:
+                while not self._has_capacity():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        return False
+                    self._cond.wait(remaining)
+                self.in_flight += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self, latency):
+        with self._cond:
+            self.in_flight -= 1
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += self.ewma_alpha * (latency - self.latency_ewma)
+
+            if self.latency_ewma > self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            elif self.in_flight + 1 >= int(self.limit):
+                # Only grow while the limit is actually being used
+                self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+
+            self._cond.notify()
+
+    def retry_after(self):
+        """Seconds a shed client should wait, estimated from queue depth and latency."""
+        latency = self.latency_ewma if self.latency_ewma is not None else self.target_latency
+        backlog = (self.waiting + self.in_flight) / max(int(self.limit), 1)
+        return max(1, math.ceil(latency * backlog))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "latency_ewma": self.latency_ewma,
+                "rejected": self.rejected,
+            }
+
+
+def get_admission_controller(endpoint):
+    controllers = current_app.extensions.setdefault('admission', {})
+    controller = controllers.get(endpoint)
+    if controller is None:
+        config = current_app.config
+        controller = AdmissionController(
+            max_limit=config.get('ADMISSION_MAX_CONCURRENCY', 32),
+            min_limit=config.get('ADMISSION_MIN_CONCURRENCY', 1),
+            max_queue=config.get('ADMISSION_MAX_QUEUE', 64),
+            queue_timeout=config.get('ADMISSION_QUEUE_TIMEOUT', 1.0),
+            target_latency=config.get('ADMISSION_TARGET_LATENCY', 0.5),
+        )
+        controller = controllers.setdefault(endpoint, controller)
+    return controller
+
+
+def admission_controlled(view):
+    """Route decorator: sheds load with 503 + Retry-After once the route is saturated."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config.get('ADMISSION_ENABLED', True):
+            return view(*args, **kwargs)
+
+        controller = get_admission_controller(request.endpoint)
+        if not controller.try_acquire():
+            response = jsonify({"error": "Service overloaded. Please retry later."})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(controller.retry_after())
+            return response
+
+        start = time.monotonic()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            controller.release(time.monotonic() - start)
+    return wrapper
@@ -0,0 +1,228 @@
+import base64
+import copy
+import gzip
+import hashlib
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import delete, select
+
+from .models import db, Transaction, TransactionStatus
+from .sharding import require_unsharded
+
+TERMINAL_STATUSES = (TransactionStatus.COMPLETED, TransactionStatus.FAILED, TransactionStatus.CANCELLED)
+INDEX_FILE = 'index.json'
+
+_index_lock = threading.Lock()
+_index_cache = None
+
+
+class AccountBloom:
+    """Small Bloom filter of the account ids present in a segment (k=3 hashes)."""
+
+    def __init__(self, bits, data=None):
+        self.bits = bits
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_count(cls, count):
+        return cls(max(1024, count * 10)) # ~1% false positives
+
+    def _positions(self, account_id):
+        digest = hashlib.blake2b(account_id.bytes, digest_size=12).digest()
+        return [int.from_bytes(digest[i:i + 4], 'little') % self.bits for i in (0, 4, 8)]
+
+    def add(self, account_id):
+        for pos in self._positions(account_id):
+            self.data[pos // 8] |= 1 << (pos % 8)
+
+    def __contains__(self, account_id):
+        return all(self.data[pos // 8] & (1 << (pos % 8)) for pos in self._positions(account_id))
+
+    def encode(self):
+        return base64.b64encode(bytes(self.data)).decode('ascii')
+
+    @classmethod
+    def decode(cls, bits, encoded):
+        return cls(bits, base64.b64decode(encoded))
+
+
+def get_archive_dir():
+    return current_app.config.get('ARCHIVE_DIR') or os.path.join(current_app.instance_path, 'archive')
+
+
+def load_index(archive_dir=None):
+    """Reads the segment index, re-parsing it only when the file changes."""
+    global _index_cache
+    path = os.path.join(archive_dir or get_archive_dir(), INDEX_FILE)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {"archived_before": None, "segments": []}
+    cached = _index_cache
+    if cached and cached[0] == path and cached[1] == mtime:
+        return cached[2]
+    with open(path) as f:
+        index = json.load(f)
+    _index_cache = (path, mtime, index)
+    return index
+
+
+def _write_atomic(path, data, mode='wb'):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode) as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _row_to_record(row):
+    return {
+        "id": str(row.id),
+        "payer_id": str(row.payer_id),
+        "payee_id": str(row.payee_id),
+        "amount": str(row.amount),
+        "timestamp": row.timestamp.isoformat(),
+        "status": row.status.value,
+    }
+
+
+def archive_transactions(cutoff, batch_size=10_000):
+    """
+    Moves terminal-state transactions older than `cutoff` into gzip NDJSON segments.
+
+    Each batch becomes one segment, written and fsync'ed before the index entry
+    (time range, count, account and transaction id Bloom filters) is published and before the rows are
+    deleted from the hot table. A crash between those steps can leave a row both
+    archived and in the table; readers de-duplicate by transaction id.
+    Returns the number of archived rows.
+    """
+    require_unsharded("Archiving")
+    archive_dir = get_archive_dir()
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = 0
+
+    while True:
+        rows = db.session.execute(
+            select(Transaction)
+            .where(Transaction.timestamp < cutoff, Transaction.status.in_(TERMINAL_STATUSES))
+            .order_by(Transaction.timestamp)
+            .limit(batch_size)
+        ).scalars().all()
+        if not rows:
+            break
+
+        bloom = AccountBloom.for_count(len(rows) * 2)
+        id_bloom = AccountBloom.for_count(len(rows))
+        lines = []
+        for row in rows:
+            bloom.add(row.payer_id)
+            bloom.add(row.payee_id)
+            id_bloom.add(row.id)
+            lines.append(json.dumps(_row_to_record(row), separators=(',', ':')))
+
+        segment_name = f"segment-{rows[0].timestamp:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.ndjson.gz"
+        _write_atomic(os.path.join(archive_dir, segment_name), gzip.compress(("\n".join(lines) + "\n").encode()))
+
+        with _index_lock:
+            # Fresh copy: the cached index handed to readers is never mutated
+            index = copy.deepcopy(load_index(archive_dir))
+            index["segments"].append({
+                "file": segment_name,
+                "min_timestamp": rows[0].timestamp.isoformat(),
+                "max_timestamp": rows[-1].timestamp.isoformat(),
+                "count": len(rows),
+                "bloom_bits": bloom.bits,
+                "bloom": bloom.encode(),
+                "id_bloom_bits": id_bloom.bits,
+                "id_bloom": id_bloom.encode(),
+            })
+            previous = index["archived_before"]
+            if previous is None or cutoff.isoformat() > previous:
+                index["archived_before"] = cutoff.isoformat()
+            _write_atomic(os.path.join(archive_dir, INDEX_FILE), json.dumps(index), mode='w')
+
+        db.session.execute(delete(Transaction).where(Transaction.id.in_([row.id for row in rows])))
+        db.session.commit()
+        archived += len(rows)
+
+    return archived
+
+
+def iter_archived_transactions(account_id=None, since=None, until=None, archive_dir=None):
+    """
+    Streams archived records (dicts with typed values), optionally filtered by
+    account and time range. Segments are skipped using the index's time range
+    and account Bloom filter, so only candidate files are decompressed.
+    """
+    archive_dir = archive_dir or get_archive_dir()
+    since_iso = since.isoformat() if since else None
+    until_iso = until.isoformat() if until else None
+
+    for segment in load_index(archive_dir)["segments"]:
+        if since_iso and segment["max_timestamp"] < since_iso:
+            continue
+        if until_iso and segment["min_timestamp"] >= until_iso:
+            continue
+        if account_id is not None and account_id not in AccountBloom.decode(segment["bloom_bits"], segment["bloom"]):
+            continue
+
+        with gzip.open(os.path.join(archive_dir, segment["file"]), 'rt') as f:
+            for line in f:
+                record = json.loads(line)
+                timestamp = record["timestamp"]
+                if since_iso and timestamp < since_iso:
+                    continue
+                if until_iso and timestamp >= until_iso:
+                    continue
+                payer_id, payee_id = uuid.UUID(record["payer_id"]), uuid.UUID(record["payee_id"])
+                if account_id is not None and account_id not in (payer_id, payee_id):
+                    continue
+                yield {
+                    "id": uuid.UUID(record["id"]),
+                    "payer_id": payer_id,
+                    "payee_id": payee_id,
+                    "amount": Decimal(record["amount"]),
+                    "timestamp": datetime.fromisoformat(timestamp),
+                    "status": TransactionStatus(record["status"]),
+                }
+
+
+def find_archived_transaction(transaction_id, archive_dir=None):
+    """
+    Looks up one archived transaction by id. Only segments whose id Bloom filter
+    may contain it are decompressed (segments written before the filter existed
+    are always read). Returns the record dict or None.
+    """
+    archive_dir = archive_dir or get_archive_dir()
+    target = str(transaction_id)
+    for segment in load_index(archive_dir)["segments"]:
+        if "id_bloom" in segment and transaction_id not in AccountBloom.decode(segment["id_bloom_bits"], segment["id_bloom"]):
+            continue
+        with gzip.open(os.path.join(archive_dir, segment["file"]), 'rt') as f:
+            for line in f:
+                record = json.loads(line)
+                if record["id"] == target:
+                    return {
+                        "id": transaction_id,
+                        "payer_id": uuid.UUID(record["payer_id"]),
+                        "payee_id": uuid.UUID(record["payee_id"]),
+                        "amount": Decimal(record["amount"]),
+                        "status": TransactionStatus(record["status"]),
+                        "timestamp": datetime.fromisoformat(record["timestamp"]),
+                    }
+    return None
+
+
+def reaches_archive(since):
+    """True when a query starting at `since` (None = all history) needs archived data."""
+    archived_before = load_index()["archived_before"]
+    if archived_before is None:
+        return False
+    return since is None or since.isoformat() < archived_before
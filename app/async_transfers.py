@@ -0,0 +1,213 @@
+import queue
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, select, update
+
+from . import services
+from .models import db, User, Merchant, Transaction, TransactionStatus, UserType, FundsHold
+from .replicas import mark_recent_write
+from .reversals import adjust_balances
+from .rollups import record_transactions_bulk
+from .sharding import require_unsharded
+
+_workers_lock = threading.Lock()
+
+
+def accept_transfer(payer_id, payee_id, amount):
+    """
+    Async acceptance: reserves the funds and records a PENDING transaction in one
+    commit, then hands it to the worker pool. The authorizer is never called on
+    the request path. Returns (body, status_code) like execute_transfer.
+    """
+    workers = get_transfer_workers()
+    if workers.full():
+        return {"error": "Transfer queue is full. Try again later."}, 503
+
+    if not User.query.filter_by(id=payer_id, user_type=UserType.COMMON).first():
+        return {"error": "Payer not found or is not a common user."}, 404
+    if db.session.get(User, payee_id) is None and db.session.get(Merchant, payee_id) is None:
+        return {"error": "Payee not found."}, 404
+
+    # Reserva condicional: duas transferências concorrentes não conseguem gastar o mesmo saldo
+    reserved = db.session.execute(
+        update(User)
+        .where(User.id == payer_id, User.balance >= amount)
+        .values(balance=User.balance - amount)
+        .execution_options(synchronize_session=False)
+    )
+    if reserved.rowcount != 1:
+        db.session.rollback()
+        return {"error": "Insufficient balance."}, 400
+
+    transaction = Transaction(payer_id=payer_id, payee_id=payee_id, amount=amount, status=TransactionStatus.PENDING)
+    db.session.add(transaction)
+    db.session.flush()
+    ttl = current_app.config.get('ASYNC_HOLD_TTL_SECONDS', 300)
+    db.session.add(FundsHold(transaction_id=transaction.id, payer_id=payer_id, amount=amount,
+                             expires_at=datetime.utcnow() + timedelta(seconds=ttl)))
+    db.session.commit()
+    mark_recent_write(payer_id)
+
+    # Se a fila encheu entre a verificação e aqui, a reserva expira e o sweeper a libera
+    workers.submit(transaction.id)
+    return {
+        "message": "Transaction accepted.",
+        "transaction_id": str(transaction.id),
+        "status": TransactionStatus.PENDING.value
+    }, 202
+
+
+def _settle(transaction_ids, status):
+    """
+    Moves PENDING transactions to `status` (only those still PENDING, so a
+    worker and the sweeper never both act on one), applies the balance side and
+    drops the holds, in one commit. Returns the rows that changed.
+    """
+    rows = db.session.execute(
+        update(Transaction)
+        .where(Transaction.id.in_(transaction_ids), Transaction.status == TransactionStatus.PENDING)
+        .values(status=status)
+        .returning(Transaction.id, Transaction.payer_id, Transaction.payee_id, Transaction.amount)
+    ).all()
+    if not rows:
+        db.session.rollback()
+        return rows
+
+    deltas = {}
+    for _, payer_id, payee_id, amount in rows:
+        # COMPLETED credita o recebedor; FAILED devolve a reserva ao pagador
+        account_id = payee_id if status == TransactionStatus.COMPLETED else payer_id
+        deltas[account_id] = deltas.get(account_id, 0) + amount
+    adjust_balances(deltas)
+    db.session.execute(delete(FundsHold).where(FundsHold.transaction_id.in_([row.id for row in rows])))
+    now = datetime.utcnow()
+    record_transactions_bulk(db.session, [
+        {"payer_id": payer_id, "payee_id": payee_id, "amount": amount, "status": status, "timestamp": now}
+        for _, payer_id, payee_id, amount in rows
+    ])
+    db.session.commit()
+    mark_recent_write(*deltas)
+    return rows
+
+
+def finalize_transfer(transaction_id):
+    """Worker step: authorizes a PENDING transfer and completes or fails it."""
+    transaction = db.session.get(Transaction, transaction_id)
+    if transaction is None or transaction.status != TransactionStatus.PENDING:
+        return None
+    payer_id, payee_id, amount = transaction.payer_id, transaction.payee_id, transaction.amount
+    db.session.commit() # Não segura a transação de leitura durante a chamada externa
+
+    if not services.authorize_transaction_external(payer_id, payee_id, amount):
+        _settle([transaction_id], TransactionStatus.FAILED)
+        return TransactionStatus.FAILED
+
+    if _settle([transaction_id], TransactionStatus.COMPLETED):
+        services.notify_payee(transaction_id, payee_id, amount)
+        return TransactionStatus.COMPLETED
+    return None
+
+
+def sweep_expired_holds(now=None, batch_size=500):
+    """Fails PENDING transfers whose hold expired (lost queue item, crashed worker) and refunds the payer."""
+    require_unsharded("Async transfer holds")
+    now = now or datetime.utcnow()
+    released = 0
+    while True:
+        expired = db.session.execute(
+            select(FundsHold.transaction_id).where(FundsHold.expires_at <= now).limit(batch_size)
+        ).scalars().all()
+        if not expired:
+            return released
+        rows = _settle(expired, TransactionStatus.FAILED)
+        released += len(rows)
+        if len(rows) < len(expired):
+            # Holds órfãos (transação já finalizada): apenas removidos
+            db.session.execute(delete(FundsHold).where(FundsHold.transaction_id.in_(expired)))
+            db.session.commit()
+
+
+class TransferWorkerPool:
+    """
+    Fixed pool of threads finalizing accepted transfers from a bounded queue,
+    plus a sweeper thread for expired holds. Its size is independent of the
+    HTTP server's concurrency.
+    """
+
+    def __init__(self, app, workers=8, queue_size=1000, sweep_interval=30.0):
+        self.app = app
+        self.sweep_interval = sweep_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._workers = [
+            threading.Thread(target=self._work, name=f'transfer-worker-{i}', daemon=True) for i in range(workers)
+        ]
+        self._sweeper = threading.Thread(target=self._sweep, name='hold-sweeper', daemon=True)
+
+    def start(self):
+        for thread in self._workers:
+            thread.start()
+        self._sweeper.start()
+
+    def full(self):
+        return self._queue.full()
+
+    def submit(self, transaction_id):
+        try:
+            self._queue.put_nowait(transaction_id)
+            return True
+        except queue.Full:
+            return False
+
+    def _work(self):
+        while True:
+            transaction_id = self._queue.get()
+            if transaction_id is None:
+                return
+            with self.app.app_context():
+                try:
+                    finalize_transfer(transaction_id)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Transfer worker: finalizing {transaction_id} failed: {e}")
+                finally:
+                    db.session.remove()
+
+    def _sweep(self):
+        while not self._stop.wait(self.sweep_interval):
+            with self.app.app_context():
+                try:
+                    sweep_expired_holds()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Hold sweeper: sweep failed: {e}")
+                finally:
+                    db.session.remove()
+
+    def stop(self, timeout=5.0):
+        """Lets queued transfers finish, then stops the threads."""
+        self._stop.set()
+        for _ in self._workers:
+            self._queue.put(None)
+        for thread in self._workers + [self._sweeper]:
+            thread.join(timeout)
+
+
+def get_transfer_workers():
+    workers = current_app.extensions.get('transfer_workers')
+    if workers is None:
+        with _workers_lock:
+            workers = current_app.extensions.get('transfer_workers')
+            if workers is None:
+                config = current_app.config
+                workers = TransferWorkerPool(
+                    current_app._get_current_object(),
+                    workers=config.get('ASYNC_TRANSFER_WORKERS', 8),
+                    queue_size=config.get('ASYNC_TRANSFER_QUEUE_SIZE', 1000),
+                    sweep_interval=config.get('ASYNC_SWEEP_INTERVAL', 30.0),
+                )
+                workers.start()
+                current_app.extensions['transfer_workers'] = workers
+    return workers
@@ -0,0 +1,177 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+
+_dispatcher_lock = threading.Lock()
+
+
+class HttpAuthorizer:
+    """
+    HTTP client for the external authorizer over a pooled `requests.Session`.
+
+    Single calls keep the original contract (GET -> {"message": "Autorizado"}).
+    When `batch_url` is set, a batch is POSTed as
+    {"authorizations": [{"payer_id", "payee_id", "amount"}, ...]} and the authorizer
+    answers {"results": [{"message": ...}, ...]} in the same order.
+    """
+
+    def __init__(self, url, batch_url=None, timeout=5.0, pool_size=16):
+        self.url = url
+        self.batch_url = batch_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def supports_batch(self):
+        return bool(self.batch_url)
+
+    def authorize_one(self, payload):
+        try:
+            response = self.session.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json().get("message") == "Autorizado"
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"External Authorizer ({self.url}): Request failed: {e}")
+            return False
+
+    def authorize_batch(self, payloads):
+        try:
+            response = self.session.post(self.batch_url, json={"authorizations": payloads}, timeout=self.timeout)
+            response.raise_for_status()
+            results = response.json().get("results", [])
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"External Authorizer ({self.batch_url}): Batch request failed: {e}")
+            return [False] * len(payloads)
+
+        if len(results) != len(payloads):
+            print(f"External Authorizer ({self.batch_url}): Batch size mismatch ({len(results)} != {len(payloads)})")
+            return [False] * len(payloads)
+        return [isinstance(r, dict) and r.get("message") == "Autorizado" for r in results]
+
+
+class AuthorizationDispatcher:
+    """
+    Coalesces concurrent authorization requests into micro-batches.
+
+    Callers block in `authorize` while a dispatcher thread gathers requests until
+    `max_batch_size` is reached or `max_wait` seconds passed since the first one,
+    then sends them as a single batch call. Up to `max_in_flight` batch calls run
+    concurrently, so throughput is not capped at one batch per round trip.
+    Authorizers without batch support get the batch as pipelined concurrent
+    calls over the pooled connection.
+    Any failure resolves to "not authorized", as the single-call path does.
+    """
+
+    def __init__(self, authorizer, max_batch_size=32, max_wait=0.005, max_workers=8, max_in_flight=4):
+        self.authorizer = authorizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches_sent = 0
+        self._queue = queue.Queue()
+        self._stopped = False
+        # Só coleta o próximo lote quando há vaga: sob carga os lotes esperam na fila e saem cheios
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, max_in_flight), thread_name_prefix='authorizer')
+        self._thread = threading.Thread(target=self._run, name='authorization-dispatcher', daemon=True)
+        self._thread.start()
+
+    def authorize(self, payload, timeout=None):
+        if self._stopped:
+            return False
+        future = Future()
+        self._queue.put((payload, future))
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            return False
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None) # Encerra depois de enviar este lote
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            if self.authorizer.supports_batch:
+                self._in_flight.acquire()
+            batch = self._collect()
+            if batch is None:
+                return
+            if self.authorizer.supports_batch:
+                self._executor.submit(self._send_batch, batch)
+            else:
+                for payload, future in batch:
+                    self._executor.submit(self._send_one, payload, future)
+
+    def _send_batch(self, batch):
+        payloads = [payload for payload, _ in batch]
+        try:
+            results = self.authorizer.authorize_batch(payloads)
+        except Exception as e:
+            print(f"Authorization dispatcher: batch failed: {e}")
+            results = [False] * len(batch)
+        finally:
+            self._in_flight.release()
+        self.batches_sent += 1
+        for (_, future), authorized in zip(batch, results):
+            future.set_result(bool(authorized))
+
+    def _send_one(self, payload, future):
+        try:
+            future.set_result(bool(self.authorizer.authorize_one(payload)))
+        except Exception as e:
+            future.set_exception(e)
+
+    def stop(self, timeout=5.0):
+        """Sends what is already queued, waits for in-flight calls and stops the threads."""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
+
+
+def get_authorization_dispatcher():
+    dispatcher = current_app.extensions.get('authorization_dispatcher')
+    if dispatcher is None:
+        with _dispatcher_lock:
+            dispatcher = current_app.extensions.get('authorization_dispatcher')
+            if dispatcher is None:
+                config = current_app.config
+                authorizer = HttpAuthorizer(
+                    config['AUTHORIZATION_SERVICE_URL'],
+                    batch_url=config.get('AUTHORIZATION_BATCH_URL'),
+                    timeout=config.get('AUTHORIZATION_TIMEOUT', 5.0),
+                )
+                dispatcher = AuthorizationDispatcher(
+                    authorizer,
+                    max_batch_size=config.get('AUTHORIZATION_BATCH_MAX_SIZE', 32),
+                    max_wait=config.get('AUTHORIZATION_BATCH_MAX_WAIT', 0.005),
+                    max_in_flight=config.get('AUTHORIZATION_BATCH_MAX_IN_FLIGHT', 4),
+                )
+                current_app.extensions['authorization_dispatcher'] = dispatcher
+    return dispatcher
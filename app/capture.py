@@ -0,0 +1,212 @@
+import atexit
+import gzip
+import hashlib
+import heapq
+import json
+import os
+import threading
+import time
+
+from flask import current_app, g, request
+
+SEGMENT_PREFIX = 'capture-'
+SEGMENT_SUFFIX = '.ndjson.gz'
+
+# Campos sensíveis: senha some, documentos e e-mails viram pseudônimos estáveis
+REDACTED_KEYS = frozenset({'password', 'password_hash'})
+DOCUMENT_KEYS = frozenset({'document', 'cpf', 'cnpj'})
+DROPPED_KEYS = frozenset({'details'}) # Mensagens de exceção podem conter SQL com valores
+
+_writer_lock = threading.Lock()
+
+
+def pseudonymize(value, salt):
+    """Keyed digest of `value`: equal inputs map to equal pseudonyms within one capture."""
+    return hashlib.blake2b(str(value).encode(), key=salt, digest_size=16).digest()
+
+
+def _pseudo_document(value, salt):
+    # Mantém o formato (só dígitos, mesmo tamanho) para a validação dar o mesmo resultado no replay
+    if not isinstance(value, str) or not value.isdigit():
+        return "[redacted]"
+    digits = int.from_bytes(pseudonymize(value, salt), 'big') % 10 ** len(value)
+    return str(digits).zfill(len(value))
+
+
+def sanitize(data, salt):
+    """Returns a copy of a JSON body safe to store: no passwords, documents, e-mails or names."""
+    if isinstance(data, list):
+        return [sanitize(item, salt) for item in data]
+    if not isinstance(data, dict):
+        return data
+    clean = {}
+    for key, value in data.items():
+        if key in DROPPED_KEYS:
+            continue
+        if key in REDACTED_KEYS:
+            clean[key] = "[redacted]"
+        elif key in DOCUMENT_KEYS:
+            clean[key] = _pseudo_document(value, salt)
+        elif key == 'email' and isinstance(value, str):
+            clean[key] = f"{pseudonymize(value.lower(), salt).hex()[:20]}@capture.invalid"
+        elif key == 'full_name' and isinstance(value, str):
+            clean[key] = "Captured Account"
+        else:
+            clean[key] = sanitize(value, salt)
+    return clean
+
+
+class CaptureWriter:
+    """
+    Appends capture records to rotating gzip NDJSON segments in `directory`.
+
+    Records are buffered and each flush is written as one complete gzip member,
+    so a segment is readable while it is still being written and compresses
+    many records at a time. A segment is closed once it reaches `max_file_bytes`;
+    only the newest `max_files` segments are kept.
+    """
+
+    def __init__(self, directory, max_file_bytes=64 * 1024 * 1024, max_files=20, flush_records=256, flush_interval=5.0):
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.written = 0
+        self._pending = []
+        self._file = None
+        self._segment = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':'), default=str) + "\n"
+        with self._lock:
+            self._pending.append(line.encode())
+            if len(self._pending) >= self.flush_records or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        if self._file is None:
+            self._segment += 1
+            name = f"{SEGMENT_PREFIX}{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self._segment:04d}{SEGMENT_SUFFIX}"
+            self._file = open(os.path.join(self.directory, name), 'ab')
+        self._file.write(gzip.compress(b"".join(self._pending)))
+        self._file.flush()
+        self.written += len(self._pending)
+        self._pending = []
+        if self._file.tell() >= self.max_file_bytes:
+            self._file.close()
+            self._file = None
+            self._prune()
+
+    def _prune(self):
+        segments = list_segments(self.directory)
+        for path in segments[:max(len(segments) - self.max_files, 0)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass # Outro worker já removeu
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def get_capture_dir():
+    return current_app.config.get('CAPTURE_DIR') or os.path.join(current_app.instance_path, 'captures')
+
+
+def get_capture_writer():
+    writer = current_app.extensions.get('capture_writer')
+    if writer is None:
+        with _writer_lock:
+            writer = current_app.extensions.get('capture_writer')
+            if writer is None:
+                # Criado na primeira requisição: com preload_app, cada worker tem o seu arquivo
+                config = current_app.config
+                writer = CaptureWriter(
+                    get_capture_dir(),
+                    max_file_bytes=config.get('CAPTURE_MAX_FILE_BYTES', 64 * 1024 * 1024),
+                    max_files=config.get('CAPTURE_MAX_FILES', 20),
+                    flush_records=config.get('CAPTURE_FLUSH_RECORDS', 256),
+                    flush_interval=config.get('CAPTURE_FLUSH_INTERVAL', 5.0),
+                )
+                atexit.register(writer.close)
+                current_app.extensions['capture_writer'] = writer
+    return writer
+
+
+def list_segments(path):
+    """Capture segment files under `path` (a directory or a single segment), oldest first."""
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        os.path.join(path, name) for name in os.listdir(path)
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+    )
+
+
+def _read_segment(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_capture(path):
+    """Yields the captured records of every segment under `path` in arrival order."""
+    # Cada segmento já está em ordem; segmentos de workers diferentes se intercalam
+    return heapq.merge(*(_read_segment(segment) for segment in list_segments(path)), key=lambda record: record["t"])
+
+
+def _start_capture():
+    if request.endpoint in current_app.config.get('CAPTURE_ENDPOINTS', ()):
+        g.capture_started = (time.time(), time.perf_counter())
+
+
+def _finish_capture(response):
+    started = g.pop('capture_started', None)
+    if started is None:
+        return response
+    wall, perf = started
+    salt = current_app.extensions['capture_salt']
+    body = request.get_json(silent=True) if request.is_json else None
+    response_body = response.get_json(silent=True) if response.is_json else None
+    get_capture_writer().write({
+        "t": wall,
+        "method": request.method,
+        "endpoint": request.endpoint,
+        "path": request.path,
+        "query": request.query_string.decode('latin-1'),
+        "json": request.is_json,
+        "body": sanitize(body, salt),
+        "status": response.status_code,
+        "duration": round(time.perf_counter() - perf, 6),
+        "response": sanitize(response_body, salt),
+    })
+    return response
+
+
+def init_capture(app):
+    """
+    Records sanitized requests to CAPTURE_ENDPOINTS when CAPTURE_ENABLED is set,
+    for later replay (see replay.py). When it is off no hooks are registered.
+    """
+    if not app.config.get('CAPTURE_ENABLED', False):
+        return
+    # Gerada antes do fork (preload_app): todos os workers produzem os mesmos pseudônimos
+    app.extensions['capture_salt'] = (app.config.get('CAPTURE_SALT') or os.urandom(16).hex()).encode()[:64]
+    app.before_request(_start_capture)
+    app.after_request(_finish_capture)
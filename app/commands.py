@@ -0,0 +1,264 @@
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+
+from .archive import archive_transactions
+from .async_transfers import sweep_expired_holds
+from .rollups import rebuild_rollups
+from .settlement import SettlementWindowConflict, run_settlement
+from .reversals import MAX_BATCH_SIZE, cancel_transactions_bulk
+from .scheduler import get_transfer_scheduler
+from .sharding import ShardingUnsupported, get_shard_router, recover_cross_shard_transfers, require_unsharded
+
+
+@click.command('recover-transfers')
+@click.option('--grace-seconds', type=int, default=None, help='Idade mínima das sagas a retomar.')
+def recover_transfers_command(grace_seconds):
+    """Finaliza ou compensa transferências entre shards interrompidas."""
+    router = get_shard_router()
+    if router is None:
+        click.echo("Sharding desabilitado (SHARD_URIS vazio); nada a recuperar.")
+        return
+    if grace_seconds is None:
+        grace_seconds = current_app.config['SHARD_RECOVERY_GRACE_SECONDS']
+    summary = recover_cross_shard_transfers(router, grace_seconds=grace_seconds)
+    click.echo(f"Concluídas: {summary['completed']}, compensadas: {summary['compensated']}")
+
+
+@click.command('archive-transactions')
+@click.option('--older-than-days', type=int, default=None, help='Idade mínima das transações a arquivar.')
+@click.option('--batch-size', type=int, default=10_000, help='Transações por segmento.')
+def archive_transactions_command(older_than_days, batch_size):
+    """Move transações finalizadas antigas para segmentos de arquivo comprimidos."""
+    if older_than_days is None:
+        older_than_days = current_app.config['ARCHIVE_AFTER_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    try:
+        archived = archive_transactions(cutoff, batch_size=batch_size)
+    except ShardingUnsupported as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Transações arquivadas: {archived}")
+
+
+@click.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recalcula as tabelas de rollup a partir das transações (tabela quente e arquivo)."""
+    try:
+        summary = rebuild_rollups()
+    except ShardingUnsupported as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Rollups recalculados: {summary['accounts_days']} conta-dia, {summary['hours']} horas")
+
+
+@click.command('reconcile')
+@click.option('--chunk-size', type=int, default=500_000, help='Transações lidas por lote.')
+@click.option('--output', 'output_path', default='reconciliation_report.csv', help='Arquivo CSV com as divergências.')
+@click.option('--skip-archive', is_flag=True, help='Ignora os segmentos arquivados.')
+def reconcile_command(chunk_size, output_path, skip_archive):
+    """Confere o saldo de cada conta contra o histórico de transações concluídas."""
+    from .reconciliation import reconcile_balances # NumPy só é necessário para este comando
+    try:
+        summary = reconcile_balances(chunk_size=chunk_size, output_path=output_path, include_archive=not skip_archive)
+    except ShardingUnsupported as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Contas verificadas: {summary['accounts']}, divergências: {summary['discrepancies']} (relatório: {output_path})")
+    if summary['orphan_payer_cents']:
+        click.echo(f"Aviso: pagamentos de contas inexistentes somam {summary['orphan_payer_cents']} centavos")
+    if summary['orphan_payee_cents']:
+        click.echo(f"Aviso: recebimentos de contas inexistentes somam {summary['orphan_payee_cents']} centavos")
+    if summary['discrepancies']:
+        raise SystemExit(1)
+
+
+@click.command('settle')
+@click.option('--date', 'day', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Dia (UTC) a liquidar; padrão: ontem.')
+@click.option('--chunk-size', type=int, default=1000, help='Lojistas ajustados por commit.')
+def settle_command(day, chunk_size):
+    """Liquida o volume líquido concluído de cada lojista no dia."""
+    if day is None:
+        day = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    try:
+        summary = run_settlement(day, day + timedelta(days=1), chunk_size=chunk_size)
+    except (SettlementWindowConflict, ShardingUnsupported) as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Lote {summary['batch_id']} ({summary['status']}): {summary['merchants']} lojistas, total {summary['total_amount']}")
+
+
+@click.command('cancel-transactions')
+@click.option('--merchant-id', type=click.UUID, default=None, help='Cancela os pagamentos recebidos por este lojista.')
+@click.option('--start', type=click.DateTime(), default=None, help='Início da janela (inclusive).')
+@click.option('--end', type=click.DateTime(), default=None, help='Fim da janela (exclusive).')
+@click.option('--batch-size', type=click.IntRange(1, MAX_BATCH_SIZE), default=1000, help='Transações por commit.')
+def cancel_transactions_command(merchant_id, start, end, batch_size):
+    """Estorna em massa as transações concluídas que casam com o filtro."""
+    if merchant_id is None and (start is None or end is None):
+        raise click.UsageError("Informe --merchant-id ou --start e --end.")
+
+    def report(cancelled, amount):
+        click.echo(f"... {cancelled} canceladas ({amount})")
+
+    try:
+        summary = cancel_transactions_bulk(merchant_id=merchant_id, start=start, end=end,
+                                           batch_size=batch_size, progress=report)
+    except ShardingUnsupported as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Canceladas: {summary['cancelled']} em {summary['batches']} lotes, total {summary['amount']}")
+
+
+@click.command('run-scheduler')
+def run_scheduler_command():
+    """Executa o agendador de transferências em primeiro plano (processo dedicado)."""
+    try:
+        require_unsharded("Scheduled transfers")
+    except ShardingUnsupported as e:
+        raise click.ClickException(str(e))
+    scheduler = get_transfer_scheduler()
+    click.echo("Agendador de transferências iniciado (Ctrl+C para encerrar).")
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+@click.command('sweep-holds')
+def sweep_holds_command():
+    """Libera reservas expiradas de transferências assíncronas (transação passa a FAILED)."""
+    try:
+        released = sweep_expired_holds()
+    except ShardingUnsupported as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Reservas expiradas liberadas: {released}")
+
+
+@click.command('serve')
+@click.option('--bind', default=None, help='Endereço host:porta (padrão: SERVER_BIND).')
+@click.option('--workers', type=int, default=None, help='Processos (padrão: SERVER_WORKERS ou 2 * CPUs + 1).')
+@click.option('--threads', type=int, default=None, help='Threads por processo (padrão: SERVER_THREADS).')
+def serve_command(bind, workers, threads):
+    """Servidor de produção: gunicorn com workers pré-forkados, aquecidos e drenados no desligamento."""
+    from .server import run_server
+    try:
+        run_server(current_app._get_current_object(), bind=bind, workers=workers, threads=threads)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+
+@click.command('generate-dataset')
+@click.option('--users', type=click.IntRange(1, 99_990_000), default=100_000, help='Usuários comuns.')
+@click.option('--merchants', type=click.IntRange(0), default=5_000, help='Lojistas.')
+@click.option('--transactions', type=click.IntRange(0), default=1_000_000, help='Transações (além dos depósitos iniciais).')
+@click.option('--seed', type=click.IntRange(0, 99), default=42,
+              help='Semente (0-99, parte dos documentos gerados): mesma semente, mesmos dados.')
+@click.option('--days', type=click.IntRange(1), default=90, help='Período coberto pelas transações.')
+@click.option('--end', 'end_date', type=click.DateTime(formats=['%Y-%m-%d']), default='2024-01-01', help='Fim do período (AAAA-MM-DD).')
+@click.option('--zipf-a', type=click.FloatRange(min=1.0, min_open=True), default=1.2, help='Concentração dos lojistas quentes (> 1).')
+@click.option('--batch-size', type=click.IntRange(1), default=50_000, help='Linhas por INSERT em lote.')
+def generate_dataset_command(users, merchants, transactions, seed, days, end_date, zipf_a, batch_size):
+    """Gera um conjunto de dados sintético e determinístico para benchmarks."""
+    from .dataset import DatasetSpec, generate_dataset # NumPy só é necessário para este comando
+    spec = DatasetSpec(users, merchants, transactions, seed=seed, days=days, end=end_date, zipf_a=zipf_a,
+                       batch_size=batch_size)
+    started = time.monotonic()
+    try:
+        summary = generate_dataset(spec, progress=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Gerados {summary['users']} usuários, {summary['merchants']} lojistas e "
+               f"{summary['transactions']} transações em {time.monotonic() - started:.1f}s")
+
+
+@click.command('backfill-identities')
+@click.option('--batch-size', type=click.IntRange(1), default=1000, help='Contas lidas por lote.')
+@click.option('--orphan-grace-seconds', type=click.IntRange(0), default=300,
+              help='Idade mínima de uma identidade sem conta para ser removida (cadastros em andamento).')
+def backfill_identities_command(batch_size, orphan_grace_seconds):
+    """Preenche o índice de identidade (documento/e-mail -> conta) e remove identidades de contas inexistentes."""
+    from .identity import backfill_identities
+    result = backfill_identities(batch_size=batch_size, orphan_grace_seconds=orphan_grace_seconds)
+    click.echo(f"Identidades órfãs removidas: {result['removed']}")
+    click.echo(f"Identidades criadas: {result['inserted']}")
+    for conflict in result["conflicts"]:
+        click.echo(f"  Conflito {conflict['kind']} {conflict['value']}: conta {conflict['account_id']} "
+                   f"(já pertence a {conflict['owner_id']})")
+
+
+def _print_replay_summary(summary):
+    click.echo(f"{'endpoint':<28} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'lag ms':>9} {'mismatch':>8}")
+    for endpoint, row in summary.items():
+        click.echo(f"{endpoint:<28} {row['count']:>7} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+                   f"{row['p99_ms']:>9.2f} {row['max_lag_ms']:>9.2f} {row['mismatches']:>8}")
+
+
+@click.command('replay-traffic')
+@click.argument('capture_path', type=click.Path(exists=True))
+@click.option('--output', 'output_path', type=click.Path(dir_okay=False), default=None, help='Resultados (NDJSON gzip) para compare-replays.')
+@click.option('--speed', type=click.FloatRange(0), default=1.0, help='Multiplicador de velocidade (0 = sem pausas).')
+@click.option('--clients', type=click.IntRange(1), default=16, help='Requisições simultâneas no máximo.')
+@click.option('--target', default=None, help='URL de uma instância já em execução (padrão: instância local deste build).')
+@click.option('--database-uri', default=None,
+              help='Banco da instância local, ex.: cópia do snapshot (padrão: SQLite temporário vazio).')
+@click.option('--authorizer-latency', type=click.FloatRange(0), default=0.0, help='Latência (s) do autorizador falso.')
+def replay_traffic_command(capture_path, output_path, speed, clients, target, database_uri, authorizer_latency):
+    """Reproduz uma captura de tráfego e reporta latência e divergências em relação ao capturado."""
+    from .capture import iter_capture
+    from .replay import local_instance, replay_capture, summarize, unknown_ids, write_results
+    records = list(iter_capture(capture_path))
+    click.echo(f"{len(records)} requisições capturadas")
+    if not target and not database_uri:
+        missing = unknown_ids(records)
+        if missing:
+            # Num banco vazio essas requisições dariam 404 e o relatório acusaria divergências falsas
+            raise click.ClickException(
+                f"{len(missing)} ids usados pela captura não foram criados por ela (ex.: {sorted(missing)[0]}). "
+                "Informe --database-uri com uma cópia do snapshot do banco capturado.")
+    if target:
+        results = replay_capture(records, target, speed=speed, clients=clients)
+    else:
+        with local_instance(database_uri, authorizer_latency) as base_url:
+            results = replay_capture(records, base_url, speed=speed, clients=clients)
+    if output_path:
+        write_results(output_path, results)
+    _print_replay_summary(summarize(results))
+
+
+@click.command('compare-replays')
+@click.argument('baseline_path', type=click.Path(exists=True, dir_okay=False))
+@click.argument('candidate_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--show', type=click.IntRange(0), default=20, help='Divergências listadas.')
+def compare_replays_command(baseline_path, candidate_path, show):
+    """Compara dois replays da mesma captura (ex.: dois builds): latência por rota e resultados divergentes."""
+    from .replay import compare_results, read_results
+    try:
+        comparison = compare_results(read_results(baseline_path), read_results(candidate_path))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{'endpoint':<28} {'p50 base':>9} {'p50 cand':>9} {'p95 base':>9} {'p95 cand':>9} {'Δp95 ms':>9}")
+    for endpoint, row in comparison["endpoints"].items():
+        base, cand = row["baseline"] or {}, row["candidate"] or {}
+        click.echo(f"{endpoint:<28} {base.get('p50_ms', 0):>9.2f} {cand.get('p50_ms', 0):>9.2f} "
+                   f"{base.get('p95_ms', 0):>9.2f} {cand.get('p95_ms', 0):>9.2f} {row['p95_delta_ms'] or 0:>9.2f}")
+    differences = comparison["differences"]
+    click.echo(f"Resultados divergentes: {len(differences)}")
+    for difference in differences[:show]:
+        click.echo(f"  #{difference['seq']} {difference['endpoint']}: {difference['baseline']} -> {difference['candidate']}")
+
+
+def register_commands(app):
+    app.cli.add_command(recover_transfers_command)
+    app.cli.add_command(archive_transactions_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(reconcile_command)
+    app.cli.add_command(settle_command)
+    app.cli.add_command(cancel_transactions_command)
+    app.cli.add_command(run_scheduler_command)
+    app.cli.add_command(sweep_holds_command)
+    app.cli.add_command(serve_command)
+    app.cli.add_command(generate_dataset_command)
+    app.cli.add_command(backfill_identities_command)
+    app.cli.add_command(replay_traffic_command)
+    app.cli.add_command(compare_replays_command)
@@ -0,0 +1,205 @@
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from .identity import identity_rows
+from .models import db, User, Merchant, Transaction, TransactionStatus, UserType, AccountIdentity
+
+STATUSES = (TransactionStatus.COMPLETED, TransactionStatus.FAILED, TransactionStatus.CANCELLED)
+
+# Numeric(10, 2): maior saldo que uma conta comporta, em centavos
+MAX_BALANCE_CENTS = 99_999_999_99
+MAX_USERS = 99_990_000 # Índices acima disso são os CPFs das contas de funding
+MAX_SEED = 99 # A semente entra nos documentos (2 dígitos); sementes distintas nunca colidem
+
+# Peso relativo de cada hora do dia (pico no almoço e no início da noite)
+HOURLY_WEIGHTS = np.array([1, 1, 1, 1, 1, 2, 4, 6, 8, 9, 10, 12, 14, 12, 10, 9, 9, 10, 12, 13, 11, 8, 5, 2], dtype=float)
+
+
+class _Ids:
+    """Compact block of seeded UUIDs (16 raw bytes each); UUID objects are built on access."""
+
+    def __init__(self, rng, count):
+        self._raw = rng.bytes(16 * count)
+
+    def __getitem__(self, i):
+        return uuid.UUID(bytes=self._raw[16 * i:16 * i + 16], version=4)
+
+
+def _money(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+class DatasetSpec:
+    """Parameters of a synthetic dataset; the same spec and seed always produce the same rows."""
+
+    def __init__(self, users, merchants, transactions, seed=42, days=90, end=None, zipf_a=1.2,
+                 merchant_share=0.8, status_mix=(0.93, 0.05, 0.02), mean_amount=60.0, batch_size=50_000):
+        if not 0 <= seed <= MAX_SEED:
+            raise ValueError(f"seed must be between 0 and {MAX_SEED}: it is part of every generated document.")
+        if users > MAX_USERS:
+            raise ValueError(f"users must be at most {MAX_USERS}.")
+        self.users = users
+        self.merchants = merchants
+        self.transactions = transactions
+        self.seed = seed
+        self.days = days
+        self.end = end or datetime(2024, 1, 1)
+        self.zipf_a = zipf_a
+        self.merchant_share = merchant_share
+        self.status_mix = np.asarray(status_mix, dtype=float) / sum(status_mix)
+        self.mean_amount = mean_amount
+        self.batch_size = batch_size
+        # Fluxos independentes: contas, transações, saldos iniciais, ids das transações e contas de funding
+        (self.account_seed, self.transaction_seed, self.opening_seed, self.id_seed,
+         self.funding_seed) = np.random.SeedSequence(seed).spawn(5)
+
+
+def _transaction_batches(spec, hot_merchants):
+    """
+    Yields (payer_idx, payee_idx, payee_is_merchant, cents, status_idx, seconds)
+    arrays per batch. Deterministic: both passes of generate_dataset replay it.
+    """
+    rng = np.random.Generator(np.random.PCG64(spec.transaction_seed))
+    hour_p = HOURLY_WEIGHTS / HOURLY_WEIGHTS.sum()
+    sigma = 1.0
+    mu = np.log(spec.mean_amount) - sigma ** 2 / 2 # Média da lognormal = mean_amount
+
+    remaining = spec.transactions
+    while remaining > 0:
+        n = min(spec.batch_size, remaining)
+        remaining -= n
+
+        payer_idx = rng.integers(0, spec.users, n)
+        to_merchant = (rng.random(n) < spec.merchant_share) if spec.merchants else np.zeros(n, dtype=bool)
+        # Zipf: poucos lojistas concentram a maior parte do volume (rank 1 = mais quente)
+        ranks = np.minimum(rng.zipf(spec.zipf_a, n), max(spec.merchants, 1)) - 1
+        peer_idx = rng.integers(0, spec.users, n)
+        payee_idx = np.where(to_merchant, hot_merchants[ranks] if spec.merchants else 0, peer_idx)
+
+        cents = np.clip(np.rint(rng.lognormal(mu, sigma, n) * 100), 1, 9_999_999).astype(np.int64)
+        status_idx = rng.choice(len(STATUSES), n, p=spec.status_mix)
+        day = rng.integers(0, spec.days, n)
+        hour = rng.choice(24, n, p=hour_p)
+        seconds = day * 86_400 + hour * 3_600 + rng.integers(0, 3_600, n)
+        yield payer_idx, payee_idx, to_merchant, cents, status_idx, seconds
+
+
+def generate_dataset(spec, progress=None):
+    """
+    Bulk-loads `spec.users` common users, `spec.merchants` merchants and
+    `spec.transactions` transactions (plus one opening deposit per user from
+    funding accounts) with realistic distributions: Zipf-skewed merchant
+    popularity, lognormal amounts, a daily traffic curve and a status mix.
+
+    Two passes over the same seeded stream: the first only sums the COMPLETED
+    movement per account with NumPy, so accounts can be inserted with their
+    final balances; the second inserts the transactions in `batch_size` chunks.
+    Balances therefore reconcile with the history. Accounts get their identity
+    index rows as well. Documents and e-mails are derived from the seed, so
+    distinct seeds can share a database. Deposits are spread over as many
+    funding accounts as needed for every balance to fit Numeric(10, 2); a
+    dataset whose merchant or user balances would not fit is rejected.
+    """
+    report = progress or (lambda message: None)
+    account_rng = np.random.Generator(np.random.PCG64(spec.account_seed))
+    user_ids = _Ids(account_rng, spec.users)
+    merchant_ids = _Ids(account_rng, spec.merchants)
+    deposit_ids = _Ids(account_rng, spec.users)
+    hot_merchants = account_rng.permutation(spec.merchants) # Os lojistas quentes não são os primeiros inseridos
+
+    # Passo 1: movimento líquido (centavos) por conta; lojistas ficam após os usuários
+    net = np.zeros(spec.users + spec.merchants, dtype=np.int64)
+    for payer_idx, payee_idx, to_merchant, cents, status_idx, _ in _transaction_batches(spec, hot_merchants):
+        moved = np.where(status_idx == 0, cents, 0)
+        net -= np.bincount(payer_idx, weights=moved, minlength=net.size).astype(np.int64)
+        net += np.bincount(payee_idx + np.where(to_merchant, spec.users, 0), weights=moved, minlength=net.size).astype(np.int64)
+
+    # Depósito inicial: cobre o que cada usuário gastou, mais uma folga para novas transferências
+    opening_rng = np.random.Generator(np.random.PCG64(spec.opening_seed))
+    cushion = np.rint(opening_rng.lognormal(np.log(500), 1.0, spec.users) * 100).astype(np.int64)
+    opening = np.maximum(-net[:spec.users], 0) + cushion
+    balances = net.copy()
+    balances[:spec.users] += opening
+    if balances.size and np.abs(balances).max() > MAX_BALANCE_CENTS:
+        raise ValueError("An account balance would not fit Numeric(10, 2); use more merchants or fewer transactions.")
+
+    # Funding k paga os depósitos que começam em [k*L, (k+1)*L): total < L + maior depósito = limite
+    per_funding = MAX_BALANCE_CENTS - int(opening.max(initial=0))
+    starts = np.cumsum(opening) - opening
+    funder = starts // per_funding
+    funding_count = int(funder.max(initial=0)) + 1
+    if funding_count > 99_999_999 - MAX_USERS + 1:
+        raise ValueError("Too many funding accounts needed for this dataset.")
+    funding_ids = _Ids(np.random.Generator(np.random.PCG64(spec.funding_seed)), funding_count)
+    funding_totals = np.bincount(funder, weights=opening, minlength=funding_count).astype(np.int64)
+
+    password_hash = generate_password_hash("dataset") # Um hash para todas as contas (hash por conta levaria horas)
+    tag = f"{spec.seed:02d}"
+    start = spec.end - timedelta(days=spec.days)
+
+    funding = [(funding_ids[k], f"9{tag}{MAX_USERS + k:08d}", f"funding{k}.s{spec.seed}@dataset.example")
+               for k in range(funding_count)]
+    db.session.execute(insert(User), [{
+        "id": account_id, "full_name": f"Dataset Funding {k}", "cpf": cpf, "email": email,
+        "password_hash": password_hash, "balance": -_money(funding_totals[k]), "user_type": UserType.COMMON,
+    } for k, (account_id, cpf, email) in enumerate(funding)])
+    db.session.execute(insert(AccountIdentity), [row for account_id, cpf, email in funding
+                                                 for row in identity_rows(account_id, UserType.COMMON, cpf, email)])
+    for first in range(0, spec.users, spec.batch_size):
+        last = min(first + spec.batch_size, spec.users)
+        db.session.execute(insert(User), [{
+            "id": user_ids[i], "full_name": f"Dataset User {i}", "cpf": f"9{tag}{i:08d}",
+            "email": f"user{i}.s{spec.seed}@dataset.example", "password_hash": password_hash,
+            "balance": _money(balances[i]), "user_type": UserType.COMMON,
+        } for i in range(first, last)])
+        db.session.execute(insert(AccountIdentity), [row for i in range(first, last) for row in identity_rows(
+            user_ids[i], UserType.COMMON, f"9{tag}{i:08d}", f"user{i}.s{spec.seed}@dataset.example")])
+        db.session.execute(insert(Transaction), [{
+            "id": deposit_ids[i], "payer_id": funding[funder[i]][0], "payee_id": user_ids[i], "amount": _money(opening[i]),
+            "status": TransactionStatus.COMPLETED, "timestamp": start - timedelta(days=1),
+        } for i in range(first, last)])
+        db.session.commit()
+    for first in range(0, spec.merchants, spec.batch_size):
+        last = min(first + spec.batch_size, spec.merchants)
+        db.session.execute(insert(Merchant), [{
+            "id": merchant_ids[i], "full_name": f"Dataset Merchant {i}", "cnpj": f"9{tag}{i:011d}",
+            "email": f"merchant{i}.s{spec.seed}@dataset.example", "password_hash": password_hash,
+            "balance": _money(balances[spec.users + i]), "user_type": UserType.MERCHANT,
+        } for i in range(first, last)])
+        db.session.execute(insert(AccountIdentity), [row for i in range(first, last) for row in identity_rows(
+            merchant_ids[i], UserType.MERCHANT, f"9{tag}{i:011d}", f"merchant{i}.s{spec.seed}@dataset.example")])
+        db.session.commit()
+    report(f"{spec.users} usuários e {spec.merchants} lojistas inseridos")
+
+    # Passo 2: mesma sequência, agora gravada
+    id_rng = np.random.Generator(np.random.PCG64(spec.id_seed))
+    inserted = 0
+    for payer_idx, payee_idx, to_merchant, cents, status_idx, seconds in _transaction_batches(spec, hot_merchants):
+        ids = _Ids(id_rng, len(cents))
+        # Listas Python: acesso por elemento bem mais barato que escalares NumPy
+        rows = zip(payer_idx.tolist(), payee_idx.tolist(), to_merchant.tolist(), cents.tolist(),
+                   status_idx.tolist(), seconds.tolist())
+        db.session.execute(insert(Transaction), [{
+            "id": ids[k],
+            "payer_id": user_ids[payer],
+            "payee_id": merchant_ids[payee] if is_merchant else user_ids[payee],
+            "amount": _money(amount),
+            "status": STATUSES[status],
+            "timestamp": start + timedelta(seconds=offset),
+        } for k, (payer, payee, is_merchant, amount, status, offset) in enumerate(rows)])
+        db.session.commit()
+        inserted += len(cents)
+        report(f"{inserted}/{spec.transactions} transações")
+
+    return {
+        "users": spec.users,
+        "merchants": spec.merchants,
+        "transactions": inserted,
+        "opening_deposits": spec.users,
+        "funding_accounts": funding_count,
+    }
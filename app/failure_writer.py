@@ -0,0 +1,280 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import insert, select
+
+from .models import db, Transaction, TransactionStatus
+from .rollups import record_transaction, record_transactions_bulk
+
+_writer_lock = threading.Lock()
+
+
+def _to_line(record):
+    return json.dumps({
+        "id": str(record["id"]),
+        "payer_id": str(record["payer_id"]),
+        "payee_id": str(record["payee_id"]),
+        "amount": str(record["amount"]),
+        "timestamp": record["timestamp"].isoformat(),
+    }) + "\n"
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # Existe, mas pertence a outro usuário
+    return True
+
+
+def _from_line(line):
+    data = json.loads(line)
+    return {
+        "id": uuid.UUID(data["id"]),
+        "payer_id": uuid.UUID(data["payer_id"]),
+        "payee_id": uuid.UUID(data["payee_id"]),
+        "amount": Decimal(data["amount"]),
+        "status": TransactionStatus.FAILED,
+        "timestamp": datetime.fromisoformat(data["timestamp"]),
+    }
+
+
+class FailedAttemptWriter:
+    """
+    Buffers FAILED transaction records and writes them off the request path.
+
+    `record` only appends to a bounded in-memory buffer. A writer thread flushes
+    it every `flush_interval` seconds (or once `batch_size` records are waiting)
+    with one bulk INSERT plus the aggregated rollup upserts in a single commit.
+    If the commit fails, or the buffer is full, records are appended to a local
+    NDJSON spill file instead of retrying against the database; the spill is
+    replayed on the next successful flush, skipping ids that already landed.
+
+    Each process spills to its own file (`spill_path` with the pid before the
+    extension), so gunicorn workers never interleave or steal each other's
+    lines. Files left by processes that no longer exist are adopted and
+    replayed by the first flush of a live writer.
+    """
+
+    def __init__(self, app, spill_path, max_buffer=10_000, batch_size=500, flush_interval=0.5):
+        self.app = app
+        root, ext = os.path.splitext(spill_path)
+        self.pid = os.getpid()
+        self.spill_path = f"{root}.{self.pid}{ext}"
+        self._spill_dir = os.path.dirname(spill_path) or '.'
+        # <base>.<pid><ext>, com sufixo de replay em andamento
+        self._spill_pattern = re.compile(rf"^{re.escape(os.path.basename(root))}\.(\d+){re.escape(ext)}(\..+)?$")
+        self._sweep_needed = True # Primeiro flush procura arquivos órfãos de processos encerrados
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.spilled = 0
+        self._retry_at = 0.0 # Enquanto o banco está fora, nada de novas tentativas antes disso
+        self._backoff = 0.0
+
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, payer_id, payee_id, amount, when=None):
+        record = {
+            "id": uuid.uuid4(),
+            "payer_id": payer_id,
+            "payee_id": payee_id,
+            "amount": amount,
+            "status": TransactionStatus.FAILED,
+            "timestamp": when or datetime.utcnow(),
+        }
+        with self._lock:
+            if len(self._buffer) < self.max_buffer:
+                self._buffer.append(record)
+                pending = len(self._buffer)
+                record = None
+        if record is not None:
+            # Buffer cheio: o registro vai para o disco, nunca é descartado
+            self._spill([record])
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+
+    def _drain(self):
+        with self._lock:
+            count = min(len(self._buffer), self.batch_size)
+            return [self._buffer.popleft() for _ in range(count)]
+
+    def _spill(self, records):
+        if not records:
+            return
+        with self._lock:
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                f.writelines(_to_line(record) for record in records)
+            self.spilled += len(records)
+            self._sweep_needed = True
+
+    def _write(self, records):
+        db.session.execute(insert(Transaction), records)
+        record_transactions_bulk(db.session, records)
+        db.session.commit()
+        self.written += len(records)
+
+    def _claim_spill_files(self):
+        """Renames this process's spill and orphaned spills of dead processes to replay files owned by this process."""
+        claimed = []
+        with self._lock:
+            if os.path.exists(self.spill_path):
+                target = f"{self.spill_path}.replaying-{uuid.uuid4().hex}"
+                os.replace(self.spill_path, target)
+                claimed.append(target)
+        for name in sorted(os.listdir(self._spill_dir)):
+            match = self._spill_pattern.match(name)
+            path = os.path.join(self._spill_dir, name)
+            if match is None or path == self.spill_path or path in claimed:
+                continue
+            pid = int(match.group(1))
+            if pid == self.pid:
+                claimed.append(path) # Replay anterior deste processo interrompido
+            elif not _process_alive(pid):
+                target = f"{self.spill_path}.replaying-{uuid.uuid4().hex}"
+                try:
+                    os.replace(path, target)
+                except FileNotFoundError:
+                    continue # Outro worker adotou primeiro
+                claimed.append(target)
+        return claimed
+
+    def _replay_file(self, path):
+        with open(path, encoding='utf-8') as f:
+            records = [_from_line(line) for line in f if line.strip()]
+        for start in range(0, len(records), self.batch_size):
+            chunk = records[start:start + self.batch_size]
+            # Um replay interrompido pode já ter gravado parte do arquivo
+            existing = set(db.session.execute(
+                select(Transaction.id).where(Transaction.id.in_([r["id"] for r in chunk]))
+            ).scalars())
+            chunk = [r for r in chunk if r["id"] not in existing]
+            if chunk:
+                self._write(chunk)
+        os.remove(path)
+
+    def _replay_spill(self):
+        if not self._sweep_needed:
+            return
+        self._sweep_needed = False
+        try:
+            for path in self._claim_spill_files():
+                self._replay_file(path)
+        except Exception:
+            self._sweep_needed = True # Arquivos restantes voltam no próximo flush
+            raise
+
+    def flush(self):
+        """Writes everything buffered; returns False if the database was unavailable."""
+        with self._flush_lock:
+            if time.monotonic() < self._retry_at:
+                self._spill(self._drain_all())
+                return False
+            try:
+                while True:
+                    records = self._drain()
+                    if not records:
+                        break
+                    try:
+                        self._write(records)
+                    except Exception:
+                        self._spill(records)
+                        raise
+                self._replay_spill()
+            except Exception as e:
+                db.session.rollback()
+                self._spill(self._drain_all())
+                self._backoff = min(max(self._backoff * 2, 1.0), 60.0)
+                self._retry_at = time.monotonic() + self._backoff
+                print(f"Failed-attempt writer: database unavailable, spilling to {self.spill_path}: {e}")
+                return False
+            self._backoff = 0.0
+        return True
+
+    def _drain_all(self):
+        with self._lock:
+            records = list(self._buffer)
+            self._buffer.clear()
+            return records
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            with self.app.app_context():
+                try:
+                    self.flush()
+                finally:
+                    db.session.remove()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='failed-attempt-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=5.0):
+        """Stops the writer thread and flushes what is still buffered (spilling if the DB is down)."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self.app.app_context():
+            try:
+                self.flush()
+            finally:
+                db.session.remove()
+
+
+def get_failed_attempt_writer():
+    writer = current_app.extensions.get('failed_attempt_writer')
+    if writer is None:
+        with _writer_lock:
+            writer = current_app.extensions.get('failed_attempt_writer')
+            if writer is None:
+                config = current_app.config
+                spill_path = config.get('FAILED_WRITER_SPILL_PATH') or os.path.join(
+                    current_app.instance_path, 'failed_attempts.ndjson')
+                os.makedirs(os.path.dirname(spill_path), exist_ok=True)
+                writer = FailedAttemptWriter(
+                    current_app._get_current_object(),
+                    spill_path,
+                    max_buffer=config.get('FAILED_WRITER_MAX_BUFFER', 10_000),
+                    batch_size=config.get('FAILED_WRITER_BATCH_SIZE', 500),
+                    flush_interval=config.get('FAILED_WRITER_FLUSH_INTERVAL', 0.5),
+                )
+                writer.start()
+                current_app.extensions['failed_attempt_writer'] = writer
+    return writer
+
+
+def record_failed_attempt(session, payer_id, payee_id, amount):
+    """
+    Records a FAILED transfer attempt. With FAILED_WRITER_ENABLED the record is
+    buffered for the background writer; otherwise it is committed right away.
+    """
+    if current_app.config.get('FAILED_WRITER_ENABLED', False):
+        get_failed_attempt_writer().record(payer_id, payee_id, amount)
+        return
+
+    session.add(Transaction(payer_id=payer_id, payee_id=payee_id, amount=amount, status=TransactionStatus.FAILED))
+    record_transaction(session, payer_id, payee_id, amount, TransactionStatus.FAILED)
+    session.commit()
@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from .models import db, User, Merchant, UserType, AccountIdentity
+
+DOCUMENT = 'document'
+EMAIL = 'email'
+
+
+def normalize_document(document):
+    # CPF e CNPJ têm tamanhos diferentes: um único espaço de chaves basta
+    return "".join(ch for ch in document if ch.isdigit())
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+def _account_document(account):
+    return account.cpf if account.user_type == UserType.COMMON else account.cnpj
+
+
+def identity_rows(account_id, account_type, document, email):
+    return [
+        {"kind": DOCUMENT, "value": normalize_document(document), "account_id": account_id, "account_type": account_type},
+        {"kind": EMAIL, "value": normalize_email(email), "account_id": account_id, "account_type": account_type},
+    ]
+
+
+def find_identities(session, document=None, email=None):
+    """One primary-key probe per given key; returns the AccountIdentity rows that exist."""
+    keys = []
+    if document:
+        keys.append((DOCUMENT, normalize_document(document)))
+    if email:
+        keys.append((EMAIL, normalize_email(email)))
+    return [row for row in (session.get(AccountIdentity, key) for key in keys) if row is not None]
+
+
+def claim_identities(session, account):
+    """Adds `account`'s identity rows to `session`; a duplicate fails the commit with IntegrityError."""
+    session.add_all(AccountIdentity(**row) for row in identity_rows(
+        account.id, account.user_type, _account_document(account), account.email))
+
+
+def _backfill_from(source, batch_size, report):
+    inserted = 0
+    conflicts = []
+    for model in (User, Merchant):
+        last_id = None
+        while True:
+            query = select(model).order_by(model.id).limit(batch_size)
+            if last_id is not None:
+                query = query.where(model.id > last_id)
+            accounts = source.execute(query).scalars().all()
+            if not accounts:
+                break
+            last_id = accounts[-1].id
+
+            rows = [row for account in accounts for row in identity_rows(
+                account.id, account.user_type, _account_document(account), account.email)]
+            existing = {}
+            for kind in (DOCUMENT, EMAIL):
+                values = [row["value"] for row in rows if row["kind"] == kind]
+                for identity in db.session.execute(
+                        select(AccountIdentity).where(AccountIdentity.kind == kind, AccountIdentity.value.in_(values))
+                ).scalars():
+                    existing[(identity.kind, identity.value)] = identity.account_id
+
+            missing = []
+            for row in rows:
+                key = (row["kind"], row["value"])
+                owner = existing.get(key)
+                if owner is None:
+                    existing[key] = row["account_id"]
+                    missing.append(row)
+                elif owner != row["account_id"]:
+                    # Mesmo documento/e-mail em duas contas (ex.: usuário e lojista): fica para revisão
+                    conflicts.append({"kind": row["kind"], "value": row["value"], "account_id": row["account_id"], "owner_id": owner})
+            db.session.add_all(AccountIdentity(**row) for row in missing)
+            db.session.commit()
+            inserted += len(missing)
+            report(inserted)
+    return inserted, conflicts
+
+
+def _existing_accounts(session, account_ids):
+    found = set()
+    for model in (User, Merchant):
+        found.update(session.execute(select(model.id).where(model.id.in_(account_ids))).scalars())
+    return found
+
+
+def sweep_orphan_identities(router=None, batch_size=1000, grace_seconds=300):
+    """
+    Deletes identity rows whose account does not exist (a sharded signup that
+    died between reserving its keys on the primary and releasing them).
+    Rows younger than `grace_seconds` are kept: their signup may still be running.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    removed = 0
+    last_key = None
+    while True:
+        query = (select(AccountIdentity.kind, AccountIdentity.value, AccountIdentity.account_id)
+                 .where(AccountIdentity.created_at <= cutoff)
+                 .order_by(AccountIdentity.kind, AccountIdentity.value)
+                 .limit(batch_size))
+        if last_key is not None:
+            query = query.where(
+                (AccountIdentity.kind > last_key[0])
+                | ((AccountIdentity.kind == last_key[0]) & (AccountIdentity.value > last_key[1]))
+            )
+        rows = db.session.execute(query).all()
+        if not rows:
+            return removed
+        last_key = (rows[-1].kind, rows[-1].value)
+
+        account_ids = list({row.account_id for row in rows})
+        if router is None:
+            existing = _existing_accounts(db.session, account_ids)
+        else:
+            existing = set()
+            for index in range(len(router)):
+                with router.session(index) as session:
+                    existing |= _existing_accounts(session, account_ids)
+        orphans = [row for row in rows if row.account_id not in existing]
+        for row in orphans:
+            db.session.execute(delete(AccountIdentity).where(
+                AccountIdentity.kind == row.kind, AccountIdentity.value == row.value,
+                AccountIdentity.account_id == row.account_id))
+        db.session.commit()
+        removed += len(orphans)
+
+
+def backfill_identities(batch_size=1000, progress=None, orphan_grace_seconds=300):
+    """
+    Creates the missing identity rows of existing accounts (idempotent). Keys
+    already owned by another account are not overwritten; they are returned as
+    conflicts. Identities whose account no longer exists are removed first
+    (see sweep_orphan_identities). With sharding, accounts are read from every
+    shard and the identities are written to the primary database.
+    """
+    from .sharding import get_shard_router
+
+    report = progress or (lambda inserted: None)
+    router = get_shard_router()
+    # Órfãos antes: uma chave reservada por um cadastro que falhou não vira conflito falso
+    removed = sweep_orphan_identities(router, batch_size=batch_size, grace_seconds=orphan_grace_seconds)
+    inserted, conflicts = 0, []
+    if router is None:
+        inserted, conflicts = _backfill_from(db.session, batch_size, report)
+    else:
+        for index in range(len(router)):
+            with router.session(index) as session:
+                count, found = _backfill_from(session, batch_size, report)
+            inserted += count
+            conflicts.extend(found)
+    return {"inserted": inserted, "conflicts": conflicts, "removed": removed}
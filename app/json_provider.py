@@ -0,0 +1,74 @@
+import enum
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError: # Dependência opcional; sem ela usamos o provider da stdlib abaixo
+    orjson = None
+
+
+def _default(obj):
+    # Valores monetários saem como string ("10.50") para não perder precisão
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """
+    Fallback sem orjson com a mesma saída do OrjsonProvider: UUID/Decimal como
+    string, enums pelo valor e datas em ISO 8601 (o padrão do Flask usa o formato HTTP).
+    """
+
+    @staticmethod
+    def default(obj):
+        if isinstance(obj, (datetime, date)):
+            return obj.isoformat()
+        if isinstance(obj, uuid.UUID):
+            return str(obj)
+        return _default(obj)
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    Provider JSON do Flask baseado em orjson, usado por jsonify e request.get_json.
+
+    UUID, datetime e enums são serializados nativamente pelo orjson; Decimal
+    passa pelo hook `_default`. As rotas podem devolver os objetos do modelo
+    diretamente, sem conversões manuais com str().
+    """
+
+    sort_keys = True
+    compact = None
+
+    def _option(self):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self.compact is False or (self.compact is None and self._app.debug):
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self._option()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Evita o decode/encode de dumps(): o corpo vai direto em bytes
+        body = orjson.dumps(obj, default=_default, option=self._option())
+        return self._app.response_class(body + b"\n", mimetype="application/json")
+
+
+def get_json_provider_class(fast=True):
+    if fast and orjson is not None:
+        return OrjsonProvider
+    return StdlibJSONProvider
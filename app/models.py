@@ -66,9 +66,16 @@ class TransactionStatus(Enum):
     COMPLETED = "completed"
     FAILED = "failed"
     CANCELLED = "cancelled"
+    RUNNING = "running" # Só agendamentos: execução final em andamento (sob lease)
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    # Índices para histórico por conta e para o job de arquivamento (varredura por tempo)
+    __table_args__ = (
+        db.Index('ix_transactions_payer_timestamp', 'payer_id', 'timestamp'),
+        db.Index('ix_transactions_payee_timestamp', 'payee_id', 'timestamp'),
+        db.Index('ix_transactions_timestamp', 'timestamp'),
+    )
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     payer_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id'), nullable=False)
@@ -100,3 +107,138 @@ class Transaction(db.Model):
 
     def __repr__(self):
         return f"<Transaction {self.id} from {self.payer_id} to {self.payee_id} for {self.amount}>"
+
+class CrossShardTransfer(db.Model):
+    # Estado da saga de uma transferência entre shards; fica no shard do pagador,
+    # junto com o Transaction correspondente.
+    __tablename__ = 'cross_shard_transfers'
+
+    transaction_id = db.Column(UUID(as_uuid=True), primary_key=True)
+    payee_shard = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.String(20), nullable=False, index=True) # debited -> completed | compensated
+    updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<CrossShardTransfer {self.transaction_id} {self.state}>"
+
+class ShardTransferCredit(db.Model):
+    # Marca de idempotência do crédito no shard do recebedor: existe se e somente se
+    # o saldo do recebedor já foi creditado para essa transação.
+    __tablename__ = 'shard_transfer_credits'
+
+    transaction_id = db.Column(UUID(as_uuid=True), primary_key=True)
+    payee_id = db.Column(UUID(as_uuid=True), nullable=False)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    applied_at = db.Column(db.DateTime, server_default=db.func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<ShardTransferCredit {self.transaction_id} to {self.payee_id}>"
+
+class AccountDailyRollup(db.Model):
+    # Agregado diário por conta (User ou Merchant), mantido no mesmo commit da transação
+    __tablename__ = 'account_daily_rollups'
+
+    account_id = db.Column(UUID(as_uuid=True), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    tx_count = db.Column(db.Integer, default=0, nullable=False)
+    failed_count = db.Column(db.Integer, default=0, nullable=False)
+    sum_in = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+    sum_out = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<AccountDailyRollup {self.account_id} {self.day} count={self.tx_count}>"
+
+class HourlyRollup(db.Model):
+    # Agregado global por hora (volume e falhas), base da taxa de falha por hora
+    __tablename__ = 'hourly_rollups'
+
+    hour = db.Column(db.DateTime, primary_key=True)
+    tx_count = db.Column(db.Integer, default=0, nullable=False)
+    failed_count = db.Column(db.Integer, default=0, nullable=False)
+    volume = db.Column(db.Numeric(16, 2), default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<HourlyRollup {self.hour} count={self.tx_count}>"
+
+class SettlementBatch(db.Model):
+    # Uma liquidação por janela de tempo: open -> applying -> completed
+    __tablename__ = 'settlement_batches'
+    __table_args__ = (db.UniqueConstraint('window_start', 'window_end', name='uq_settlement_window'),)
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    window_start = db.Column(db.DateTime, nullable=False)
+    window_end = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), default='open', nullable=False)
+    merchant_count = db.Column(db.Integer, default=0, nullable=False)
+    total_amount = db.Column(db.Numeric(16, 2), default=0, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=db.func.now(), nullable=False)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<SettlementBatch {self.window_start} - {self.window_end} {self.status}>"
+
+class MerchantSettlement(db.Model):
+    # Valor líquido a repassar a um lojista em um lote; `applied` marca o débito já feito no saldo
+    __tablename__ = 'merchant_settlements'
+
+    batch_id = db.Column(UUID(as_uuid=True), db.ForeignKey('settlement_batches.id'), primary_key=True)
+    merchant_id = db.Column(UUID(as_uuid=True), primary_key=True)
+    amount = db.Column(db.Numeric(14, 2), nullable=False)
+    tx_count = db.Column(db.Integer, nullable=False)
+    applied = db.Column(db.Boolean, default=False, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<MerchantSettlement {self.merchant_id} {self.amount}>"
+
+class ScheduledTransfer(db.Model):
+    # Transferência agendada/recorrente. status segue TransactionStatus:
+    # PENDING = ativa, RUNNING = última execução em andamento, COMPLETED = todas as execuções feitas,
+    # FAILED = execução única falhou, CANCELLED = cancelada
+    __tablename__ = 'scheduled_transfers'
+    __table_args__ = (db.Index('ix_scheduled_transfers_status_next_run', 'status', 'next_run_at'),)
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    payer_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id'), nullable=False)
+    payee_id = db.Column(UUID(as_uuid=True), nullable=False)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    next_run_at = db.Column(db.DateTime, nullable=False)
+    interval_seconds = db.Column(db.Integer, nullable=True) # None = execução única
+    remaining_runs = db.Column(db.Integer, nullable=True) # None = sem limite (recorrente)
+    run_count = db.Column(db.Integer, default=0, nullable=False)
+    status = db.Column(db.Enum(TransactionStatus), default=TransactionStatus.PENDING, nullable=False)
+    last_transaction_id = db.Column(UUID(as_uuid=True), nullable=True)
+    last_error = db.Column(db.String(255), nullable=True)
+    leased_at = db.Column(db.DateTime, nullable=True) # Início do lease enquanto RUNNING
+    leased_transaction_id = db.Column(UUID(as_uuid=True), nullable=True) # Id reservado para a transferência da execução final
+    created_at = db.Column(db.DateTime, server_default=db.func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<ScheduledTransfer {self.id} next={self.next_run_at} {self.status.value}>"
+
+class FundsHold(db.Model):
+    # Reserva de saldo de uma transferência PENDING (modo assíncrono). O saldo do pagador já foi
+    # debitado; a linha é removida no mesmo commit que finaliza ou expira a transferência.
+    __tablename__ = 'funds_holds'
+
+    transaction_id = db.Column(UUID(as_uuid=True), db.ForeignKey('transactions.id'), primary_key=True)
+    payer_id = db.Column(UUID(as_uuid=True), nullable=False)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<FundsHold {self.transaction_id} {self.amount} until {self.expires_at}>"
+
+class AccountIdentity(db.Model):
+    # Índice de identidade global: documento e e-mail normalizados -> conta (User ou Merchant).
+    # A chave primária (kind, value) garante unicidade entre as duas tabelas e responde a
+    # cada busca com uma única leitura de índice.
+    __tablename__ = 'account_identities'
+
+    kind = db.Column(db.String(10), primary_key=True) # 'document' | 'email'
+    value = db.Column(db.String(100), primary_key=True)
+    account_id = db.Column(UUID(as_uuid=True), nullable=False, index=True)
+    account_type = db.Column(db.Enum(UserType), nullable=False)
+    created_at = db.Column(db.DateTime, server_default=db.func.now(), nullable=False) # Carência da limpeza de órfãos
+
+    def __repr__(self):
+        return f"<AccountIdentity {self.kind}:{self.value} -> {self.account_id}>"
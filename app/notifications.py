@@ -0,0 +1,308 @@
+import atexit
+import heapq
+import itertools
+import queue
+import threading
+import time
+import zlib
+from decimal import Decimal
+
+from flask import current_app
+
+from . import services
+
+_aggregator_lock = threading.Lock()
+
+
+class _PayeeState:
+    __slots__ = ('last_immediate', 'last_event', 'digest', 'sending', 'events', 'immediate', 'digests', 'coalesced',
+                 'failures')
+
+    def __init__(self):
+        self.last_immediate = None
+        self.last_event = None
+        self.digest = None # Eventos aguardando o próximo digest
+        self.sending = None # Digest sendo entregue ao lane fora do lock
+        self.events = 0
+        self.immediate = 0
+        self.digests = 0
+        self.coalesced = 0 # Eventos entregues dentro de um digest
+        self.failures = 0
+
+    def counters(self):
+        return {
+            "events": self.events,
+            "immediate_sends": self.immediate,
+            "digests_sent": self.digests,
+            "coalesced_events": self.coalesced,
+            "failed_sends": self.failures,
+        }
+
+
+class _Digest:
+    __slots__ = ('deadline', 'count', 'total', 'transaction_ids')
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.count = 0
+        self.total = Decimal("0")
+        self.transaction_ids = []
+
+
+class NotificationAggregator:
+    """
+    Coalesces payee notifications into per-payee digests.
+
+    The first event of a payee within `window` seconds is sent on its own, so
+    low-volume payees see no delay. Further events in that window are buffered
+    and sent as one digest (count, total, transaction ids) when the window
+    closes or `max_batch` events are waiting: a hot merchant gets at most about
+    one call per window instead of one per payment.
+
+    Every send runs on a sender lane chosen by hashing the payee id, and a lane
+    sends one notification at a time, so each payee's notifications leave in
+    the order the events happened. Transfers never wait on the notifier: a
+    digest is handed to its lane without blocking and outside the lock, and is
+    buffered again for the next window when the lane is full. After stop(),
+    events are sent inline by the caller.
+    """
+
+    def __init__(self, app, window=5.0, max_batch=500, lanes=4, lane_queue_size=10_000, idle_seconds=300.0):
+        self.app = app
+        self.window = window
+        self.max_batch = max_batch
+        self.idle_seconds = idle_seconds
+        self._payees = {}
+        self._deadlines = [] # (deadline, seq, payee_id, digest)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._failures_lock = threading.Lock() # Os lanes nunca tomam _lock: quem o segura pode esperar por eles
+        self._wakeup = threading.Condition(self._lock)
+        self._stopped = False
+        self.requeued = 0 # Digests devolvidos ao buffer porque o lane estava cheio
+        self._lanes = [queue.Queue(maxsize=lane_queue_size) for _ in range(lanes)]
+        self._threads = [
+            threading.Thread(target=self._send_loop, args=(lane,), name=f'notifier-{i}', daemon=True)
+            for i, lane in enumerate(self._lanes)
+        ]
+        self._flusher = threading.Thread(target=self._flush_loop, name='notification-flusher', daemon=True)
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        self._flusher.start()
+
+    def _lane(self, payee_id):
+        return self._lanes[zlib.crc32(str(payee_id).encode()) % len(self._lanes)]
+
+    def submit(self, payee_id, amount, transaction_id):
+        now = time.monotonic()
+        ready = None
+        with self._lock:
+            state = self._payees.get(payee_id)
+            if state is None:
+                state = self._payees[payee_id] = _PayeeState()
+            state.events += 1
+            state.last_event = now
+
+            if self._stopped:
+                state.immediate += 1
+                stopped = True
+            else:
+                stopped = False
+                if state.digest is None and state.sending is None and (
+                        state.last_immediate is None or now - state.last_immediate >= self.window):
+                    # Recebedor sem envio recente nem digest em trânsito: notifica já
+                    try:
+                        self._lane(payee_id).put_nowait(('single', payee_id, amount, transaction_id))
+                        state.last_immediate = now
+                        state.immediate += 1
+                        return
+                    except queue.Full:
+                        pass # Fila do lane cheia: o evento entra no digest
+
+                digest = self._buffer_locked(payee_id, state, now)
+                digest.count += 1
+                digest.total += amount
+                digest.transaction_ids.append(transaction_id)
+                if digest.count >= self.max_batch and state.sending is None:
+                    ready = [self._take_locked(payee_id, state)]
+
+        if stopped:
+            # Sem flusher nem lanes: um digest criado agora nunca sairia
+            if not services.send_notification_external(payee_id, amount):
+                with self._failures_lock:
+                    state.failures += 1
+                print(f"Warning: Notification failed for transaction {transaction_id} to payee {payee_id}")
+        elif ready:
+            self._hand_off(ready)
+
+    def _buffer_locked(self, payee_id, state, now):
+        digest = state.digest
+        if digest is None:
+            digest = state.digest = _Digest(now + self.window)
+            heapq.heappush(self._deadlines, (digest.deadline, next(self._seq), payee_id, digest))
+            self._wakeup.notify()
+        return digest
+
+    def _take_locked(self, payee_id, state):
+        digest, state.digest = state.digest, None
+        state.sending = digest # Até a entrega, novos eventos do recebedor vão para outro digest
+        return payee_id, state, digest
+
+    def _hand_off(self, batch, timeout=None):
+        """
+        Puts taken digests on their lanes without holding the lock. Without a
+        timeout nothing blocks: a digest whose lane is full is buffered again,
+        ahead of the events that arrived meanwhile.
+        """
+        results = []
+        for payee_id, state, digest in batch:
+            try:
+                if timeout is None:
+                    self._lane(payee_id).put_nowait(('digest', payee_id, digest))
+                else:
+                    self._lane(payee_id).put(('digest', payee_id, digest), timeout=timeout)
+                results.append(True)
+            except queue.Full:
+                results.append(False)
+
+        retry = []
+        with self._lock:
+            now = time.monotonic()
+            for (payee_id, state, digest), sent in zip(batch, results):
+                state.sending = None
+                if sent:
+                    state.digests += 1
+                    state.coalesced += digest.count
+                elif self._stopped:
+                    retry.append((payee_id, state, digest))
+                else:
+                    self.requeued += 1
+                    newer = state.digest
+                    state.digest = None
+                    merged = self._buffer_locked(payee_id, state, now)
+                    merged.count, merged.total = digest.count, digest.total
+                    merged.transaction_ids = digest.transaction_ids
+                    if newer is not None:
+                        merged.count += newer.count
+                        merged.total += newer.total
+                        merged.transaction_ids.extend(newer.transaction_ids)
+        if retry:
+            if timeout is not None:
+                for payee_id, state, digest in retry:
+                    with self._failures_lock:
+                        state.failures += 1
+                    print(f"Warning: Notification digest of {digest.count} transactions to payee {payee_id} dropped at shutdown")
+            else:
+                self._hand_off(retry, timeout=5.0) # Encerrando: não há próxima janela, espera o lane
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                if self._stopped:
+                    return
+                now = time.monotonic()
+                due = []
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    _, _, payee_id, digest = heapq.heappop(self._deadlines)
+                    state = self._payees.get(payee_id)
+                    # Senão já saiu por max_batch; com entrega em andamento, espera a próxima volta
+                    if state is not None and state.digest is digest:
+                        if state.sending is None:
+                            due.append(self._take_locked(payee_id, state))
+                        else:
+                            digest.deadline = now + 0.01
+                            heapq.heappush(self._deadlines, (digest.deadline, next(self._seq), payee_id, digest))
+                self._prune_locked(now)
+                if not due:
+                    timeout = self._deadlines[0][0] - now if self._deadlines else self.window
+                    self._wakeup.wait(max(timeout, 0.001))
+                    continue
+            self._hand_off(due)
+
+    def _prune_locked(self, now):
+        if len(self._payees) < 10_000:
+            return
+        idle = [payee_id for payee_id, state in self._payees.items()
+                if state.digest is None and state.sending is None and now - state.last_event > self.idle_seconds]
+        for payee_id in idle:
+            del self._payees[payee_id]
+
+    def _send_loop(self, lane):
+        while True:
+            item = lane.get()
+            if item is None:
+                return
+            with self.app.app_context():
+                try:
+                    if item[0] == 'single':
+                        _, payee_id, amount, transaction_id = item
+                        ok = services.send_notification_external(payee_id, amount)
+                        label = f"transaction {transaction_id}"
+                    else:
+                        _, payee_id, digest = item
+                        ok = services.send_notification_digest_external(
+                            payee_id, digest.count, digest.total, digest.transaction_ids)
+                        label = f"digest of {digest.count} transactions"
+                except Exception as e:
+                    ok, label = False, f"{item[0]} notification ({e})"
+            if not ok:
+                state = self._payees.get(payee_id)
+                if state is not None:
+                    with self._failures_lock:
+                        state.failures += 1
+                print(f"Warning: Notification failed for {label} to payee {payee_id}")
+
+    def payee_counters(self, payee_id):
+        with self._lock:
+            state = self._payees.get(payee_id)
+            return state.counters() if state is not None else None
+
+    def stats(self, top=10):
+        with self._lock:
+            states = list(self._payees.items())
+            pending = sum(state.digest.count for _, state in states if state.digest is not None)
+        totals = {key: sum(state.counters()[key] for _, state in states)
+                  for key in ("events", "immediate_sends", "digests_sent", "coalesced_events", "failed_sends")}
+        totals["pending_events"] = pending
+        totals["requeued_digests"] = self.requeued
+        totals["outbound_calls"] = totals["immediate_sends"] + totals["digests_sent"]
+        hottest = sorted(states, key=lambda item: item[1].events, reverse=True)[:top]
+        totals["top_payees"] = [dict(payee_id=payee_id, **state.counters()) for payee_id, state in hottest]
+        return totals
+
+    def stop(self, timeout=5.0):
+        """Sends every buffered digest, then stops the sender threads."""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            pending = [self._take_locked(payee_id, state) for payee_id, state in self._payees.items()
+                       if state.digest is not None]
+            self._wakeup.notify()
+        self._flusher.join(timeout) # Entregas em andamento do flusher terminam antes dos sentinelas
+        self._hand_off(pending, timeout=timeout)
+        for lane in self._lanes:
+            lane.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+def get_notification_aggregator():
+    aggregator = current_app.extensions.get('notification_aggregator')
+    if aggregator is None:
+        with _aggregator_lock:
+            aggregator = current_app.extensions.get('notification_aggregator')
+            if aggregator is None:
+                config = current_app.config
+                aggregator = NotificationAggregator(
+                    current_app._get_current_object(),
+                    window=config.get('NOTIFICATION_DIGEST_WINDOW', 5.0),
+                    max_batch=config.get('NOTIFICATION_DIGEST_MAX_EVENTS', 500),
+                    lanes=config.get('NOTIFICATION_SENDER_LANES', 4),
+                )
+                aggregator.start()
+                atexit.register(aggregator.stop)
+                current_app.extensions['notification_aggregator'] = aggregator
+    return aggregator
@@ -0,0 +1,236 @@
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from flask import Blueprint, Response, current_app, g, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_local = threading.local()
+_sql_hooks_installed = False
+_sql_hooks_lock = threading.Lock()
+
+profiling = Blueprint('profiling', __name__)
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack every `interval` seconds from a helper
+    thread (sys._current_frames), counting identical stacks. Only the profiled
+    request pays for it; nothing is traced between samples.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class RequestProfile:
+    def __init__(self, method, path, interval, slow_query_seconds):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.slow_query_seconds = slow_query_seconds
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.slow_queries = []
+        self.duration = None
+        self.status_code = None
+        self.sampler = StackSampler(threading.get_ident(), interval)
+        self._started = time.perf_counter()
+
+    def record_query(self, statement, elapsed):
+        self.sql_count += 1
+        self.sql_time += elapsed
+        if elapsed >= self.slow_query_seconds:
+            self.slow_queries.append({"statement": statement[:500], "seconds": round(elapsed, 6)})
+
+    def finish(self, status_code):
+        self.sampler.stop()
+        self.duration = time.perf_counter() - self._started
+        self.status_code = status_code
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed-stack format (flamegraph.pl, speedscope)."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.sampler.stacks.most_common())
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "duration_seconds": round(self.duration, 6),
+            "samples": sum(self.sampler.stacks.values()),
+            "sql": {
+                "count": self.sql_count,
+                "total_seconds": round(self.sql_time, 6),
+                "slow": self.slow_queries,
+            },
+        }
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, 'profile', None) is not None:
+        context._profiling_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = getattr(_local, 'profile', None)
+    started = getattr(context, '_profiling_started', None)
+    if profile is not None and started is not None:
+        profile.record_query(statement, time.perf_counter() - started)
+
+
+def _install_sql_hooks():
+    # Listeners globais (todas as engines, inclusive binds), instalados só quando o profiling é ligado
+    global _sql_hooks_installed
+    with _sql_hooks_lock:
+        if not _sql_hooks_installed:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _sql_hooks_installed = True
+
+
+def _should_profile():
+    config = current_app.config
+    token = config.get('PROFILING_TOKEN')
+    header = request.headers.get(config.get('PROFILING_HEADER', 'X-Profile'))
+    # Sem token o header não vale: qualquer cliente iniciaria uma thread de amostragem por requisição
+    if token and header is not None and hmac.compare_digest(header.encode(), token.encode()):
+        return True
+    rate = config.get('PROFILING_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+
+def _start_profile():
+    if request.blueprint == profiling.name or not _should_profile():
+        return
+    config = current_app.config
+    profile = RequestProfile(
+        request.method, request.path,
+        interval=config.get('PROFILING_INTERVAL', 0.005),
+        slow_query_seconds=config.get('PROFILING_SLOW_QUERY_SECONDS', 0.05),
+    )
+    profile.sampler.start()
+    _local.profile = profile
+    g.request_profile = profile
+
+
+def _finish_profile(response):
+    profile = g.pop('request_profile', None)
+    if profile is None:
+        return response
+    _local.profile = None
+    profile.finish(response.status_code)
+
+    store = current_app.extensions['request_profiles']
+    with store['lock']:
+        store['profiles'][profile.id] = profile
+        while len(store['profiles']) > current_app.config.get('PROFILING_MAX_RESULTS', 50):
+            store['profiles'].popitem(last=False)
+
+    output_dir = current_app.config.get('PROFILING_OUTPUT_DIR')
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, f"{profile.id}.collapsed"), 'w', encoding='utf-8') as f:
+            f.write(profile.collapsed())
+
+    response.headers['X-Profile-Id'] = profile.id
+    return response
+
+
+def _discard_profile(exc):
+    # Requisição abortada antes do after_request: não deixa a thread de amostragem viva
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        _local.profile = None
+        profile.sampler.stop()
+
+
+def init_profiling(app):
+    """
+    Installs the per-request profiler when PROFILING_ENABLED is set. When it is
+    off nothing is registered at all: no request hooks, no SQL listeners and no
+    debug endpoints, so the disabled cost is zero. The profiling header and the
+    /debug/profiles endpoints only work when PROFILING_TOKEN is set and the
+    header carries it; without a token, only PROFILING_SAMPLE_RATE starts
+    profiles and they go to PROFILING_OUTPUT_DIR only.
+    """
+    if not app.config.get('PROFILING_ENABLED', False):
+        return
+    _install_sql_hooks()
+    app.extensions['request_profiles'] = {"lock": threading.Lock(), "profiles": OrderedDict()}
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_discard_profile)
+    if app.config.get('PROFILING_TOKEN'):
+        app.register_blueprint(profiling)
+
+
+@profiling.before_request
+def _require_token():
+    # Perfis expõem SQL e caminhos de código: só com o token no header
+    config = current_app.config
+    header = request.headers.get(config.get('PROFILING_HEADER', 'X-Profile'), '')
+    if not hmac.compare_digest(header.encode(), config['PROFILING_TOKEN'].encode()):
+        return jsonify({"error": "Profiling token required."}), 403
+
+
+def _get_profile(profile_id):
+    store = current_app.extensions['request_profiles']
+    with store['lock']:
+        return store['profiles'].get(profile_id)
+
+
+@profiling.route('/debug/profiles', methods=['GET'])
+def list_profiles():
+    store = current_app.extensions['request_profiles']
+    with store['lock']:
+        profiles = list(store['profiles'].values())
+    return jsonify({"profiles": [p.summary() for p in reversed(profiles)]}), 200
+
+
+@profiling.route('/debug/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    profile = _get_profile(profile_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found."}), 404
+    return jsonify(profile.summary()), 200
+
+
+@profiling.route('/debug/profiles/<profile_id>/collapsed', methods=['GET'])
+def get_profile_collapsed(profile_id):
+    profile = _get_profile(profile_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found."}), 404
+    return Response(profile.collapsed(), mimetype='text/plain')
@@ -0,0 +1,118 @@
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+from flask import current_app
+
+
+class RateLimitBackend(ABC):
+    """
+    Storage interface for the sliding-window counters.
+
+    `acquire` must be atomic across all entries: either every counter is charged
+    or none is. A shared backend (Redis, memcached...) can implement it with a
+    server-side script so limits hold across workers and hosts.
+    """
+
+    @abstractmethod
+    def acquire(self, entries, now=None):
+        """
+        entries: iterable of (key, window_seconds, limit, cost).
+        Returns (allowed, retry_after_seconds).
+        """
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    Process-local backend using the sliding-window counter approximation.
+
+    Each key keeps only (window_start, current, previous): the estimate is
+    `previous * (1 - elapsed / window) + current`, so memory per key is O(1)
+    regardless of the request rate. Keys are kept in LRU order and capped at
+    `max_keys`.
+    """
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._counters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _roll(self, key, window, now):
+        window_start = math.floor(now / window) * window
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = [window_start, 0, 0]
+            self._counters[key] = counter
+            if len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+        else:
+            self._counters.move_to_end(key)
+            if counter[0] != window_start:
+                # Previous window only counts if it is the one right before this one
+                counter[2] = counter[1] if window_start - counter[0] == window else 0
+                counter[1] = 0
+                counter[0] = window_start
+        return counter
+
+    def acquire(self, entries, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            counters = []
+            for key, window, limit, cost in entries:
+                counter = self._roll(key, window, now)
+                elapsed = now - counter[0]
+                estimate = counter[2] * (1 - elapsed / window) + counter[1]
+                if estimate + cost > limit:
+                    return False, max(1, math.ceil(window - elapsed))
+                counters.append((counter, cost))
+
+            for counter, cost in counters:
+                counter[1] += cost
+            return True, 0
+
+
+def _to_cents(amount):
+    try:
+        return int((Decimal(str(amount)) * 100).to_integral_value())
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+
+
+def get_rate_limit_backend():
+    backend = current_app.extensions.get('rate_limit_backend')
+    if backend is None:
+        backend = current_app.config.get('RATE_LIMIT_BACKEND') or InMemoryRateLimitBackend()
+        backend = current_app.extensions.setdefault('rate_limit_backend', backend)
+    return backend
+
+
+def check_transfer_rate_limits(payer_id, amount, client_ip):
+    """
+    Applies RATE_LIMIT_RULES to a transfer before any DB or network work.
+
+    Rules are (scope, metric, limit, window_seconds) with scope 'payer' or 'ip'
+    and metric 'count' (transfers) or 'amount' (sum of amounts).
+    Returns (allowed, retry_after_seconds).
+    """
+    if not current_app.config.get('RATE_LIMIT_ENABLED', False):
+        return True, 0
+
+    cents = _to_cents(amount)
+    entries = []
+    for scope, metric, limit, window in current_app.config.get('RATE_LIMIT_RULES', []):
+        subject = payer_id if scope == 'payer' else client_ip
+        if subject is None:
+            continue
+        if metric == 'amount':
+            if cents is None or cents <= 0:
+                continue # Invalid amounts are rejected later by process_transaction
+            entries.append((f"{scope}:{metric}:{window}:{subject}", window, _to_cents(limit), cents))
+        else:
+            entries.append((f"{scope}:{metric}:{window}:{subject}", window, limit, 1))
+
+    if not entries:
+        return True, 0
+    return get_rate_limit_backend().acquire(entries)
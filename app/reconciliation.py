@@ -0,0 +1,151 @@
+import csv
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import Integer, String, cast, func, select
+
+from .archive import iter_archived_transactions
+from .models import db, User, Merchant, Transaction, TransactionStatus, MerchantSettlement, FundsHold
+from .sharding import require_unsharded
+
+
+def _cents(column):
+    return cast(func.round(column * 100), Integer)
+
+
+def _format_cents(cents):
+    return str(Decimal(int(cents)).scaleb(-2))
+
+
+def _key(column):
+    # Same textual form for account ids on both sides of the join (hex on SQLite, uuid text on PostgreSQL)
+    return cast(column, String)
+
+
+class AccountIndex:
+    """Dense integer codes for every account, with their balances in cents."""
+
+    def __init__(self):
+        keys, balances, ids, types = [], [], [], []
+        for model, account_type in ((User, 'common'), (Merchant, 'merchant')):
+            rows = db.session.execute(select(_key(model.id), _cents(model.balance), model.id)).all()
+            for key, balance, account_id in rows:
+                keys.append(key)
+                balances.append(balance)
+                ids.append(account_id)
+                types.append(account_type)
+
+        self.codes = {key: code for code, key in enumerate(keys)}
+        self.balances = np.array(balances, dtype=np.int64)
+        self.ids = ids
+        self.types = types
+        self.size = len(keys)
+        # Transactions pointing at unknown accounts land here, one slot per side
+        self.orphan_payer_code = self.size
+        self.orphan_payee_code = self.size + 1
+
+    def encode(self, keys, orphan_code):
+        """Vectorized key -> code: one dict lookup per distinct key in the chunk."""
+        unique, inverse = np.unique(np.asarray(keys, dtype=object), return_inverse=True)
+        unique_codes = np.fromiter((self.codes.get(key, orphan_code) for key in unique), dtype=np.int64, count=len(unique))
+        return unique_codes[inverse]
+
+
+def _accumulate(net, index, payer_keys, payee_keys, cents):
+    amounts = np.asarray(cents, dtype=np.int64)
+    length = index.size + 2
+    # bincount sums in float64: exact for chunk totals below 2**53 cents
+    net -= np.rint(np.bincount(index.encode(payer_keys, index.orphan_payer_code), weights=amounts, minlength=length)).astype(np.int64)
+    net += np.rint(np.bincount(index.encode(payee_keys, index.orphan_payee_code), weights=amounts, minlength=length)).astype(np.int64)
+
+
+def compute_expected_balances(index, chunk_size=500_000, include_archive=True):
+    """
+    Net movement of COMPLETED transactions per account, minus applied
+    settlement payouts and open funds holds, in cents.
+
+    The transactions table is streamed in chunks of `chunk_size` rows; each chunk
+    becomes NumPy arrays aggregated with bincount, so memory is bounded by the
+    chunk size plus one int64 per account.
+    """
+    net = np.zeros(index.size + 2, dtype=np.int64)
+    stmt = (
+        select(_key(Transaction.payer_id), _key(Transaction.payee_id), _cents(Transaction.amount))
+        .where(Transaction.status == TransactionStatus.COMPLETED)
+    )
+    connection = db.session.connection().execution_options(stream_results=True, yield_per=chunk_size)
+    for chunk in connection.execute(stmt).partitions(chunk_size):
+        payer_keys, payee_keys, cents = zip(*chunk)
+        _accumulate(net, index, payer_keys, payee_keys, cents)
+
+    # Settlement payouts already debited from merchant balances
+    payouts = db.session.execute(
+        select(_key(MerchantSettlement.merchant_id), _cents(func.sum(MerchantSettlement.amount)))
+        .where(MerchantSettlement.applied.is_(True))
+        .group_by(MerchantSettlement.merchant_id)
+    ).all()
+    # Funds reserved for PENDING async transfers, already debited from the payer
+    holds = db.session.execute(
+        select(_key(FundsHold.payer_id), _cents(func.sum(FundsHold.amount))).group_by(FundsHold.payer_id)
+    ).all()
+    for rows in (payouts, holds):
+        if rows:
+            account_keys, cents = zip(*rows)
+            net -= np.rint(np.bincount(index.encode(account_keys, index.orphan_payer_code),
+                                       weights=np.asarray(cents, dtype=np.int64),
+                                       minlength=index.size + 2)).astype(np.int64)
+
+    if include_archive:
+        key_of = _archive_key_function()
+        buffer = ([], [], [])
+        for record in iter_archived_transactions():
+            if record["status"] != TransactionStatus.COMPLETED:
+                continue
+            buffer[0].append(key_of(record["payer_id"]))
+            buffer[1].append(key_of(record["payee_id"]))
+            buffer[2].append(int(record["amount"] * 100))
+            if len(buffer[2]) >= chunk_size:
+                _accumulate(net, index, *buffer)
+                buffer = ([], [], [])
+        if buffer[2]:
+            _accumulate(net, index, *buffer)
+
+    return net
+
+
+def _archive_key_function():
+    # Archived ids are UUID objects: render them like the database does in _key()
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return lambda account_id: account_id.hex
+    return str
+
+
+def reconcile_balances(chunk_size=500_000, output_path=None, include_archive=True):
+    """
+    Compares every account balance with the net of its completed transactions
+    and optionally writes the discrepancies to a CSV report.
+    """
+    require_unsharded("Reconciliation")
+    index = AccountIndex()
+    net = compute_expected_balances(index, chunk_size=chunk_size, include_archive=include_archive)
+
+    differences = index.balances - net[:index.size]
+    mismatched = np.flatnonzero(differences)
+
+    if output_path:
+        with open(output_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["account_id", "account_type", "balance", "expected_balance", "difference"])
+            for code in mismatched:
+                writer.writerow([
+                    str(index.ids[code]), index.types[code],
+                    _format_cents(index.balances[code]), _format_cents(net[code]), _format_cents(differences[code]),
+                ])
+
+    return {
+        "accounts": index.size,
+        "discrepancies": int(mismatched.size),
+        # Separados: débitos e créditos de contas inexistentes não se anulam no relatório
+        "orphan_payer_cents": int(-net[index.orphan_payer_code]),
+        "orphan_payee_cents": int(net[index.orphan_payee_code]),
+    }
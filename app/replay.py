@@ -0,0 +1,304 @@
+import contextlib
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from . import services
+
+
+def _outcome(status_code, body):
+    """What a response decided: the transaction status, the error message or just the HTTP status."""
+    if isinstance(body, dict):
+        if isinstance(body.get("status"), str):
+            return body["status"]
+        if "error" in body:
+            return body["error"]
+    return str(status_code)
+
+
+class _IdMap:
+    """
+    Captured account ids -> ids created during the replay. A request that uses
+    an id created by an earlier captured request waits until that one finished.
+    """
+
+    def __init__(self, records):
+        self._created_by = {}
+        for index, record in enumerate(records):
+            response = record.get("response")
+            if record["endpoint"] == 'main.create_user' and record["status"] == 201 and isinstance(response, dict):
+                self._created_by[response["id"]] = index
+        self._done = {index: threading.Event() for index in set(self._created_by.values())}
+        self._mapped = {}
+
+    def translate(self, value, timeout):
+        index = self._created_by.get(value)
+        if index is None:
+            return value
+        self._done[index].wait(timeout)
+        return self._mapped.get(value, value)
+
+    def finished(self, index, record, response_body):
+        if index in self._done:
+            if isinstance(response_body, dict) and "id" in response_body:
+                self._mapped[record["response"]["id"]] = response_body["id"]
+            self._done[index].set()
+
+
+# Campos cujo valor decide o resultado de outra requisição com o mesmo valor
+_ORDERING_FIELDS = {'document': 'document', 'cpf': 'document', 'cnpj': 'document', 'email': 'email', 'payer_id': 'payer'}
+
+
+def _ordering_keys(record):
+    body = record.get("body")
+    if not isinstance(body, dict):
+        return ()
+    return {(_ORDERING_FIELDS[key], value) for key, value in body.items() if key in _ORDERING_FIELDS and value}
+
+
+class _KeyOrder:
+    """
+    Requests sharing a document, an e-mail or a payer are sent in captured
+    order: each waits until the previous request with any of its keys finished,
+    so a duplicate sign-up or a balance-dependent transfer gets the same answer
+    as in the capture. Requests without a shared key keep their own timing.
+    """
+
+    def __init__(self, records):
+        last = {}
+        self._after = []
+        for index, record in enumerate(records):
+            previous = set()
+            for key in _ordering_keys(record):
+                if key in last:
+                    previous.add(last[key])
+                last[key] = index
+            self._after.append(previous)
+        self._done = {index: threading.Event() for previous in self._after for index in previous}
+
+    def wait(self, index, timeout):
+        for previous in self._after[index]:
+            self._done[previous].wait(timeout)
+
+    def finished(self, index):
+        if index in self._done:
+            self._done[index].set()
+
+
+def _uuid_values(record):
+    values = list(record["path"].split("/"))
+    if isinstance(record.get("body"), dict):
+        values.extend(value for value in record["body"].values() if isinstance(value, str))
+    for value in values:
+        if len(value) == 36:
+            try:
+                yield str(uuid.UUID(value))
+            except ValueError:
+                pass
+
+
+def unknown_ids(records):
+    """
+    Ids used by captured requests that the capture itself never created
+    (accounts and transactions that existed before the capture started).
+    Replaying those needs a database with that data, e.g. a snapshot.
+    """
+    created = set()
+    for record in records:
+        response = record.get("response")
+        if isinstance(response, dict):
+            created.update(response[key] for key in ("id", "transaction_id") if isinstance(response.get(key), str))
+    return {value for record in records for value in _uuid_values(record)} - created
+
+
+def _rewrite(record, ids, timeout):
+    path = "/".join(ids.translate(part, timeout) for part in record["path"].split("/"))
+    body = record.get("body")
+    if isinstance(body, dict):
+        body = {key: ids.translate(value, timeout) if isinstance(value, str) else value for key, value in body.items()}
+    return path, body
+
+
+def replay_capture(records, base_url, speed=1.0, clients=16, timeout=30.0):
+    """
+    Plays captured records against `base_url`, keeping their relative timing
+    divided by `speed` (0 = as fast as possible) so bursts are reproduced.
+    Accounts created by the capture are created again and later requests are
+    rewritten to use the new ids. Requests sharing a document, e-mail or payer
+    are sent in captured order (see _KeyOrder). Returns one result per record,
+    in order.
+    """
+    records = list(records)
+    if not records:
+        return []
+    ids = _IdMap(records)
+    order = _KeyOrder(records)
+    results = [None] * len(records)
+    local = threading.local()
+
+    def send(index, record, scheduled):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        order.wait(index, timeout)
+        path, body = _rewrite(record, ids, timeout)
+        url = base_url.rstrip('/') + path + (f"?{record['query']}" if record.get('query') else "")
+        started = time.perf_counter()
+        lag = time.monotonic() - scheduled
+        response_body, status_code = None, 0
+        try:
+            kwargs = {"json": body} if record.get("json") else {}
+            response = session.request(record["method"], url, timeout=timeout, **kwargs)
+            status_code = response.status_code
+            try:
+                response_body = response.json()
+            except ValueError:
+                pass
+        except requests.RequestException as e:
+            response_body = {"error": f"request failed: {e}"}
+        finally:
+            latency = time.perf_counter() - started
+            ids.finished(index, record, response_body)
+            order.finished(index)
+        results[index] = {
+            "seq": index,
+            "endpoint": record["endpoint"],
+            "method": record["method"],
+            "captured_status": record["status"],
+            "captured_outcome": _outcome(record["status"], record.get("response")),
+            "status": status_code,
+            "outcome": _outcome(status_code, response_body),
+            "latency": round(latency, 6),
+            "lag": round(max(lag, 0.0), 6), # Atraso do replay em relação ao horário previsto
+        }
+
+    first = records[0]["t"]
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for index, record in enumerate(records):
+            scheduled = started + ((record["t"] - first) / speed if speed > 0 else 0.0)
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, index, record, scheduled)
+    return results
+
+
+@contextlib.contextmanager
+def stubbed_external_services(latency=0.0):
+    """Replaces the authorizer (always approves) and the notifier with local stubs."""
+    def authorize(*args, **kwargs):
+        if latency:
+            time.sleep(latency)
+        return True
+
+    def notify(*args, **kwargs):
+        return True
+
+    originals = services.authorize_transaction_external, services.send_notification_external
+    services.authorize_transaction_external, services.send_notification_external = authorize, notify
+    try:
+        yield
+    finally:
+        services.authorize_transaction_external, services.send_notification_external = originals
+
+
+@contextlib.contextmanager
+def local_instance(database_uri=None, authorizer_latency=0.0, config_overrides=None):
+    """
+    Serves a fresh app of this build on an ephemeral local port, with stubbed
+    external services, and yields its base URL. Without `database_uri` the app
+    starts on an empty temporary database: only captures that create every
+    account they use (see unknown_ids) replay faithfully there.
+    """
+    from werkzeug.serving import make_server
+    from . import create_app
+
+    with contextlib.ExitStack() as stack:
+        if database_uri is None:
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+            database_uri = f"sqlite:///{os.path.join(directory, 'replay.db')}"
+        overrides = {"SQLALCHEMY_DATABASE_URI": database_uri, "CAPTURE_ENABLED": False}
+        overrides.update(config_overrides or {})
+        app = create_app(overrides)
+        stack.enter_context(stubbed_external_services(authorizer_latency))
+
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, name='replay-server', daemon=True)
+        thread.start()
+        try:
+            yield f"http://127.0.0.1:{server.server_port}"
+        finally:
+            server.shutdown()
+            thread.join()
+            from .server import drain
+            drain(app)
+
+
+def write_results(path, results):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for result in results:
+            f.write(json.dumps(result, separators=(',', ':')) + "\n")
+
+
+def read_results(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _percentile(values, q):
+    index = min(int(round(q / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def summarize(results):
+    """Per-endpoint count, latency percentiles (ms) and mismatches against the capture."""
+    by_endpoint = {}
+    for result in results:
+        by_endpoint.setdefault(result["endpoint"], []).append(result)
+    summary = {}
+    for endpoint, items in sorted(by_endpoint.items()):
+        latencies = sorted(item["latency"] * 1000 for item in items)
+        summary[endpoint] = {
+            "count": len(items),
+            "p50_ms": round(_percentile(latencies, 50), 3),
+            "p95_ms": round(_percentile(latencies, 95), 3),
+            "p99_ms": round(_percentile(latencies, 99), 3),
+            "max_lag_ms": round(max(item["lag"] for item in items) * 1000, 3),
+            "mismatches": sum(
+                1 for item in items
+                if (item["status"], item["outcome"]) != (item["captured_status"], item["captured_outcome"])
+            ),
+        }
+    return summary
+
+
+def compare_results(baseline, candidate):
+    """
+    Compares two replays of the same capture (e.g. two builds): latency
+    percentiles per endpoint and every request whose status or outcome differs.
+    """
+    if len(baseline) != len(candidate):
+        raise ValueError("Replays come from different captures (record counts differ).")
+    before, after = summarize(baseline), summarize(candidate)
+    endpoints = {}
+    for endpoint in sorted(set(before) | set(after)):
+        a, b = before.get(endpoint), after.get(endpoint)
+        endpoints[endpoint] = {
+            "baseline": a,
+            "candidate": b,
+            "p95_delta_ms": round(b["p95_ms"] - a["p95_ms"], 3) if a and b else None,
+        }
+    differences = [
+        {"seq": a["seq"], "endpoint": a["endpoint"], "baseline": [a["status"], a["outcome"]], "candidate": [b["status"], b["outcome"]]}
+        for a, b in zip(baseline, candidate)
+        if (a["status"], a["outcome"]) != (b["status"], b["outcome"])
+    ]
+    return {"endpoints": endpoints, "differences": differences}
@@ -0,0 +1,170 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy.orm import Session
+
+from .models import db
+from .sharding import get_shard_router
+
+
+class ReplicaRouter:
+    """
+    Chooses the engine for read-only queries.
+
+    Reads go round-robin to the replica binds (`replica_0`, `replica_1`, ...) unless:
+    - one of the accounts being read was written by this process within
+      `sticky_seconds` (read-your-writes after the client's own transfer), or
+    - the client carries a recent write marker (see attach_write_marker), which
+      covers reads served by another worker or host, or
+    - the replica lags more than `max_lag_seconds` according to `lag_probe`,
+    in which case the primary serves the read.
+    """
+
+    def __init__(self, bind_keys, sticky_seconds=5.0, max_lag_seconds=2.0,
+                 lag_probe=None, lag_check_interval=1.0, max_sticky_keys=100_000):
+        self.bind_keys = list(bind_keys)
+        self.sticky_seconds = sticky_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_probe = lag_probe
+        self.lag_check_interval = lag_check_interval
+        self.max_sticky_keys = max_sticky_keys
+
+        self._cycle = itertools.cycle(self.bind_keys) if self.bind_keys else None
+        self._sticky = {}
+        self._lag_cache = {}
+        self._lock = threading.Lock()
+
+    def mark_written(self, *account_ids):
+        expires = time.monotonic() + self.sticky_seconds
+        with self._lock:
+            if len(self._sticky) >= self.max_sticky_keys:
+                self._prune(time.monotonic())
+            for account_id in account_ids:
+                self._sticky[account_id] = expires
+
+    def _prune(self, now):
+        for key in [k for k, expires in self._sticky.items() if expires <= now]:
+            del self._sticky[key]
+
+    def _is_sticky(self, account_ids, now):
+        with self._lock:
+            return any(self._sticky.get(account_id, 0) > now for account_id in account_ids)
+
+    def _lag(self, bind_key, now):
+        if self.lag_probe is None:
+            return 0.0
+        cached = self._lag_cache.get(bind_key)
+        if cached and now - cached[0] < self.lag_check_interval:
+            return cached[1]
+        try:
+            lag = self.lag_probe(bind_key)
+        except Exception as e:
+            print(f"Replica lag probe failed for {bind_key}: {e}")
+            lag = None
+        lag = float('inf') if lag is None else lag
+        self._lag_cache[bind_key] = (now, lag)
+        return lag
+
+    def choose_bind(self, account_ids=()):
+        """Returns the replica bind key to read from, or None for the primary."""
+        if not self.bind_keys:
+            return None
+        now = time.monotonic()
+        if account_ids and self._is_sticky(account_ids, now):
+            return None
+        for _ in range(len(self.bind_keys)):
+            with self._lock:
+                bind_key = next(self._cycle)
+            if self._lag(bind_key, now) <= self.max_lag_seconds:
+                return bind_key
+        return None # Every replica is lagging
+
+
+def replica_binds(uris):
+    """SQLALCHEMY_BINDS entries for the configured replica URIs."""
+    return {f"replica_{i}": uri for i, uri in enumerate(uris)}
+
+
+def get_replica_router():
+    router = current_app.extensions.get('replica_router')
+    if router is None:
+        config = current_app.config
+        router = ReplicaRouter(
+            replica_binds(config.get('READ_REPLICA_URIS', [])).keys(),
+            sticky_seconds=config.get('READ_REPLICA_STICKY_SECONDS', 5.0),
+            max_lag_seconds=config.get('READ_REPLICA_MAX_LAG_SECONDS', 2.0),
+            lag_probe=config.get('READ_REPLICA_LAG_PROBE'),
+        )
+        router = current_app.extensions.setdefault('replica_router', router)
+    return router
+
+
+def mark_recent_write(*account_ids):
+    router = get_replica_router()
+    router.mark_written(*account_ids)
+    if router.bind_keys and has_request_context():
+        g.last_write_at = time.time()
+
+
+def attach_write_marker(response):
+    """
+    after_request hook: a response to a request that wrote carries the write
+    time (header and cookie). The client sends it back and its reads go to the
+    primary while the marker is recent, whichever worker serves them.
+    """
+    written_at = g.pop('last_write_at', None)
+    if written_at is not None:
+        config = current_app.config
+        value = f"{written_at:.3f}"
+        response.headers[config.get('READ_REPLICA_WRITE_HEADER', 'X-Last-Write')] = value
+        response.set_cookie(config.get('READ_REPLICA_WRITE_COOKIE', 'last_write'), value,
+                            max_age=max(int(config.get('READ_REPLICA_STICKY_SECONDS', 5.0)), 1),
+                            httponly=True, samesite='Lax')
+    return response
+
+
+def _client_wrote_recently(sticky_seconds):
+    if not has_request_context():
+        return False
+    config = current_app.config
+    raw = (request.headers.get(config.get('READ_REPLICA_WRITE_HEADER', 'X-Last-Write'))
+           or request.cookies.get(config.get('READ_REPLICA_WRITE_COOKIE', 'last_write')))
+    try:
+        written_at = float(raw)
+    except (TypeError, ValueError):
+        return False
+    # Pequena folga para relógios entre hosts fora de sincronia
+    return -1.0 <= time.time() - written_at < sticky_seconds
+
+
+@contextmanager
+def read_session(*account_ids):
+    """
+    Session for read-only queries about `account_ids`.
+
+    Yields a short-lived Session bound to the account's shard or to a replica,
+    or the regular `db.session` when the primary must serve the read.
+    """
+    shard_router = get_shard_router()
+    if shard_router is not None and account_ids:
+        # Sharded accounts are read from the shard that owns them
+        with shard_router.session_for(account_ids[0]) as session:
+            yield session
+        return
+
+    router = get_replica_router()
+    bind_key = None
+    if router.bind_keys and not _client_wrote_recently(router.sticky_seconds):
+        bind_key = router.choose_bind(account_ids)
+    if bind_key is None:
+        yield db.session
+        return
+
+    session = Session(bind=db.engines[bind_key])
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,117 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from sqlalchemy import case, select, update
+
+from .models import db, User, Merchant, Transaction, TransactionStatus
+from .sharding import require_unsharded
+from .transaction_cache import get_transaction_cache
+
+MAX_BATCH_SIZE = 10_000 # Um lote é um commit: limita o tempo de lock de cada transação
+
+
+def adjust_balances(deltas):
+    """
+    Adds `deltas` ({account_id: amount}) to user and merchant balances in the
+    caller's transaction: one UPDATE per table, balance + CASE id WHEN ... END.
+    """
+    if not deltas:
+        return
+    for model in (User, Merchant):
+        db.session.execute(
+            update(model)
+            .where(model.id.in_(list(deltas)))
+            .values(balance=model.balance + case(deltas, value=model.id, else_=0))
+        )
+
+
+def _mark_cancelled(criteria):
+    """
+    Moves matching COMPLETED transactions to CANCELLED and returns the rows it
+    actually changed, so a transaction cancelled concurrently is never reversed twice.
+    """
+    return db.session.execute(
+        update(Transaction)
+        .where(Transaction.status == TransactionStatus.COMPLETED, *criteria)
+        .values(status=TransactionStatus.CANCELLED)
+        .returning(Transaction.id, Transaction.payer_id, Transaction.payee_id, Transaction.amount)
+    ).all()
+
+
+def _reversal_deltas(rows):
+    deltas = defaultdict(Decimal)
+    for _, payer_id, payee_id, amount in rows:
+        deltas[payer_id] += amount
+        deltas[payee_id] -= amount
+    return deltas
+
+
+def cancel_transaction(transaction_id):
+    """Cancels one COMPLETED transaction and returns the money to the payer."""
+    require_unsharded("Cancellation")
+    rows = _mark_cancelled([Transaction.id == transaction_id])
+    if not rows:
+        db.session.rollback()
+        transaction = db.session.get(Transaction, transaction_id)
+        if transaction is None:
+            return {"error": "Transaction not found."}, 404
+        return {"error": f"Only completed transactions can be cancelled (status: {transaction.status.value})."}, 409
+
+    adjust_balances(_reversal_deltas(rows))
+    db.session.commit()
+    get_transaction_cache().invalidate(transaction_id)
+    return {
+        "message": "Transaction cancelled.",
+        "transaction_id": str(transaction_id),
+        "status": TransactionStatus.CANCELLED.value
+    }, 200
+
+
+def cancel_transactions_bulk(merchant_id=None, start=None, end=None, batch_size=1000, progress=None):
+    """
+    Cancels every COMPLETED transaction matching the filter, in batches.
+
+    Each batch is one commit: an UPDATE ... RETURNING marks the batch cancelled,
+    the reversals are summed per account and applied with one CASE update per
+    table. `progress(cancelled_so_far, amount_so_far)` is called after each batch.
+    `batch_size` must be in [1, MAX_BATCH_SIZE].
+    """
+    require_unsharded("Cancellation")
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        # LIMIT 0 não cancelaria nada e LIMIT -1 (SQLite) cancelaria tudo num único lote
+        raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}.")
+    filters = []
+    if merchant_id is not None:
+        filters.append(Transaction.payee_id == merchant_id)
+    if start is not None:
+        filters.append(Transaction.timestamp >= start)
+    if end is not None:
+        filters.append(Transaction.timestamp < end)
+
+    cancelled = 0
+    amount = Decimal('0.00')
+    batches = 0
+    while True:
+        batch_ids = (
+            select(Transaction.id)
+            .where(Transaction.status == TransactionStatus.COMPLETED, *filters)
+            .order_by(Transaction.timestamp)
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        rows = _mark_cancelled([Transaction.id.in_(batch_ids)])
+        if not rows:
+            db.session.rollback()
+            break
+
+        adjust_balances(_reversal_deltas(rows))
+        db.session.commit()
+        get_transaction_cache().invalidate(*(row.id for row in rows))
+
+        batches += 1
+        cancelled += len(rows)
+        amount += sum((row.amount for row in rows), Decimal('0.00'))
+        if progress is not None:
+            progress(cancelled, amount)
+
+    return {"cancelled": cancelled, "amount": str(amount), "batches": batches}
@@ -0,0 +1,170 @@
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .archive import iter_archived_transactions
+from .models import db, Transaction, TransactionStatus, AccountDailyRollup, HourlyRollup
+from .sharding import require_unsharded
+
+ZERO = Decimal('0.00')
+
+_UPSERT_BY_DIALECT = {
+    'sqlite': sqlite_insert,
+    'postgresql': postgresql_insert,
+}
+
+
+def _upsert(session, model, keys, increments):
+    """INSERT ... ON CONFLICT DO UPDATE col = col + excluded.col (read-modify-write fallback elsewhere)."""
+    dialect = session.get_bind(mapper=model.__mapper__).dialect.name
+    insert_fn = _UPSERT_BY_DIALECT.get(dialect)
+    if insert_fn is None:
+        row = session.get(model, tuple(keys.values()))
+        if row is None:
+            session.add(model(**keys, **increments))
+        else:
+            for column, value in increments.items():
+                setattr(row, column, getattr(row, column) + value)
+        return
+
+    stmt = insert_fn(model).values(**keys, **increments)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={column: getattr(model, column) + stmt.excluded[column] for column in increments},
+    )
+    session.execute(stmt)
+
+
+def _truncate_hour(when):
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def record_transaction(session, payer_id, payee_id, amount, status, when=None):
+    """
+    Adds one processed transaction to the rollups inside the caller's session,
+    so the counters are committed (or rolled back) together with the transaction.
+    """
+    when = when or datetime.utcnow()
+    completed = status == TransactionStatus.COMPLETED
+    failed = int(status == TransactionStatus.FAILED)
+    moved = amount if completed else ZERO
+
+    _upsert(session, AccountDailyRollup, {"account_id": payer_id, "day": when.date()},
+            {"tx_count": 1, "failed_count": failed, "sum_in": ZERO, "sum_out": moved})
+    _upsert(session, AccountDailyRollup, {"account_id": payee_id, "day": when.date()},
+            {"tx_count": 1, "failed_count": failed, "sum_in": moved, "sum_out": ZERO})
+    _upsert(session, HourlyRollup, {"hour": _truncate_hour(when)},
+            {"tx_count": 1, "failed_count": failed, "volume": moved})
+
+
+def record_transactions_bulk(session, transactions):
+    """
+    Same as record_transaction for many rows (dicts with payer_id, payee_id,
+    amount, status and timestamp): increments are summed per rollup key first,
+    so each account-day and hour is upserted once per call.
+    """
+    daily = defaultdict(lambda: {"tx_count": 0, "failed_count": 0, "sum_in": ZERO, "sum_out": ZERO})
+    hourly = defaultdict(lambda: {"tx_count": 0, "failed_count": 0, "volume": ZERO})
+    for t in transactions:
+        completed = t["status"] == TransactionStatus.COMPLETED
+        failed = int(t["status"] == TransactionStatus.FAILED)
+        moved = t["amount"] if completed else ZERO
+        day = t["timestamp"].date()
+        for account_id, column in ((t["payer_id"], "sum_out"), (t["payee_id"], "sum_in")):
+            counters = daily[(account_id, day)]
+            counters["tx_count"] += 1
+            counters["failed_count"] += failed
+            counters[column] += moved
+        counters = hourly[_truncate_hour(t["timestamp"])]
+        counters["tx_count"] += 1
+        counters["failed_count"] += failed
+        counters["volume"] += moved
+
+    for (account_id, day), increments in daily.items():
+        _upsert(session, AccountDailyRollup, {"account_id": account_id, "day": day}, increments)
+    for hour, increments in hourly.items():
+        _upsert(session, HourlyRollup, {"hour": hour}, increments)
+
+
+def get_account_daily(account_id, start_day, end_day):
+    """Per-day counters for an account in [start_day, end_day]: one primary-key range read."""
+    require_unsharded("Rollup reports") # Transferências entre shards não alimentam os rollups
+    rows = db.session.execute(
+        select(AccountDailyRollup)
+        .where(AccountDailyRollup.account_id == account_id,
+               AccountDailyRollup.day >= start_day, AccountDailyRollup.day <= end_day)
+        .order_by(AccountDailyRollup.day)
+    ).scalars().all()
+    return [{
+        "day": row.day.isoformat(),
+        "tx_count": row.tx_count,
+        "failed_count": row.failed_count,
+        "sum_in": str(row.sum_in),
+        "sum_out": str(row.sum_out),
+    } for row in rows]
+
+
+def get_failure_rate(start_hour, end_hour):
+    """Hourly volume and failure rate in [start_hour, end_hour)."""
+    require_unsharded("Rollup reports")
+    rows = db.session.execute(
+        select(HourlyRollup)
+        .where(HourlyRollup.hour >= _truncate_hour(start_hour), HourlyRollup.hour < end_hour)
+        .order_by(HourlyRollup.hour)
+    ).scalars().all()
+    return [{
+        "hour": row.hour.isoformat(),
+        "tx_count": row.tx_count,
+        "failed_count": row.failed_count,
+        "failure_rate": round(row.failed_count / row.tx_count, 4) if row.tx_count else 0.0,
+        "volume": str(row.volume),
+    } for row in rows]
+
+
+def rebuild_rollups(batch_size=10_000):
+    """
+    Recomputes the rollups from the hot table and the archive (backfill/repair).
+    Transactions still PENDING are skipped; CANCELLED ones count as they were
+    processed (completed), matching what the live maintenance recorded.
+    """
+    require_unsharded("Rebuilding rollups") # O primário não tem as transações: apagaria os rollups
+    daily = defaultdict(lambda: [0, 0, ZERO, ZERO])
+    hourly = defaultdict(lambda: [0, 0, ZERO])
+
+    def add(payer_id, payee_id, amount, status, when):
+        if status == TransactionStatus.PENDING:
+            return
+        failed = int(status == TransactionStatus.FAILED)
+        moved = ZERO if failed else amount
+        for account_id, amount_in, amount_out in ((payer_id, ZERO, moved), (payee_id, moved, ZERO)):
+            entry = daily[(account_id, when.date())]
+            entry[0] += 1
+            entry[1] += failed
+            entry[2] += amount_in
+            entry[3] += amount_out
+        entry = hourly[_truncate_hour(when)]
+        entry[0] += 1
+        entry[1] += failed
+        entry[2] += moved
+
+    columns = (Transaction.payer_id, Transaction.payee_id, Transaction.amount, Transaction.status, Transaction.timestamp)
+    for row in db.session.execute(select(*columns).execution_options(yield_per=batch_size)):
+        add(*row)
+    for record in iter_archived_transactions():
+        add(record["payer_id"], record["payee_id"], record["amount"], record["status"], record["timestamp"])
+
+    db.session.execute(delete(AccountDailyRollup))
+    db.session.execute(delete(HourlyRollup))
+    daily_rows = [{"account_id": account_id, "day": day, "tx_count": v[0], "failed_count": v[1], "sum_in": v[2], "sum_out": v[3]}
+                  for (account_id, day), v in daily.items()]
+    hourly_rows = [{"hour": hour, "tx_count": v[0], "failed_count": v[1], "volume": v[2]} for hour, v in hourly.items()]
+    for start in range(0, len(daily_rows), batch_size):
+        db.session.execute(insert(AccountDailyRollup), daily_rows[start:start + batch_size])
+    for start in range(0, len(hourly_rows), batch_size):
+        db.session.execute(insert(HourlyRollup), hourly_rows[start:start + batch_size])
+    db.session.commit()
+    return {"accounts_days": len(daily_rows), "hours": len(hourly_rows)}
@@ -1,77 +1,93 @@
-from flask import Blueprint, request, jsonify
-from .models import db, User, Merchant, UserType
-from .services import process_transaction # Adicionado process_transaction
+from flask import Blueprint, current_app, request, jsonify, url_for
+from .models import db, User, Merchant, UserType, Transaction, ScheduledTransfer, TransactionStatus, AccountIdentity
+from .services import execute_transfer, get_transaction_history
+from .schemas import USER_SCHEMA, TRANSFER_SCHEMA, SCHEDULED_TRANSFER_SCHEMA, ValidationError
+from .admission import admission_controlled
+from .ratelimit import check_transfer_rate_limits
+from .replicas import read_session, mark_recent_write
+from .archive import find_archived_transaction
+from .sharding import ShardingUnsupported, find_transaction, get_shard_router, require_unsharded
+from .rollups import get_account_daily, get_failure_rate
+from .reversals import MAX_BATCH_SIZE, cancel_transaction, cancel_transactions_bulk
+from .scheduler import get_transfer_scheduler
+from .async_transfers import accept_transfer
+from .transaction_cache import get_transaction_cache
+from .notifications import get_notification_aggregator
+from .identity import find_identities, claim_identities
 from werkzeug.security import generate_password_hash, check_password_hash
-import re # Para validação de CPF/CNPJ (simples)
 from sqlalchemy.exc import IntegrityError # Para tratar erros de unicidade
+import hmac
 import uuid # Para converter string de ID para UUID
+from datetime import date, datetime, timedelta
 
 main = Blueprint('main', __name__)
 
+def _release_identities(session, account):
+    # Conta não gravada no shard: libera a reserva feita no banco principal
+    if session is not db.session:
+        db.session.query(AccountIdentity).filter_by(account_id=account.id).delete()
+        db.session.commit()
+
 @main.route('/')
 def home():
     return "Sistema de Pagamentos - Bem-vindo!"
 
 @main.route('/users', methods=['POST'])
 def create_user():
-    data = request.get_json()
-    if not data:
-        return jsonify({"error": "Invalid input"}), 400
+    try:
+        account = USER_SCHEMA.load(request.get_json(silent=True))
+    except ValidationError as e:
+        return jsonify(e.to_dict()), 400
 
-    required_fields = ['full_name', 'email', 'password', 'document', 'user_type']
-    for field in required_fields:
-        if field not in data:
-            return jsonify({"error": f"Missing field: {field}"}), 400
-
-    user_type_str = data.get('user_type', '').lower()
-    full_name = data.get('full_name')
-    email = data.get('email')
-    password = data.get('password')
-    document = data.get('document')
-
-    # Basic validation for document format (simplistic)
-    if user_type_str == UserType.COMMON.value:
-        if not re.match(r'^\d{11}$', document):
-            return jsonify({"error": "Invalid CPF format. Must be 11 digits."}), 400
-    elif user_type_str == UserType.MERCHANT.value:
-        if not re.match(r'^\d{14}$', document):
-            return jsonify({"error": "Invalid CNPJ format. Must be 14 digits."}), 400
-    else:
-        return jsonify({"error": "Invalid user_type. Must be 'common' or 'merchant'."}), 400
+    # Unicidade entre usuários e lojistas: uma leitura de chave primária por documento/e-mail
+    if find_identities(db.session, document=account.document, email=account.email):
+        if account.user_type == UserType.COMMON:
+            return jsonify({"error": "CPF or Email already exists for a common user."}), 409
+        return jsonify({"error": "CNPJ or Email already exists for a merchant."}), 409
 
-    hashed_password = generate_password_hash(password)
+    hashed_password = generate_password_hash(account.password)
 
-    if user_type_str == UserType.COMMON.value:
-        # Check if CPF or Email already exists for User
-        if User.query.filter((User.cpf == document) | (User.email == email)).first():
-            return jsonify({"error": "CPF or Email already exists for a common user."}), 409
+    if account.user_type == UserType.COMMON:
         new_user = User(
-            full_name=full_name,
-            cpf=document,
-            email=email,
+            id=uuid.uuid4(),
+            full_name=account.full_name,
+            cpf=account.document,
+            email=account.email,
             password_hash=hashed_password,
             user_type=UserType.COMMON
         )
-    elif user_type_str == UserType.MERCHANT.value:
-        # Check if CNPJ or Email already exists for Merchant
-        if Merchant.query.filter((Merchant.cnpj == document) | (Merchant.email == email)).first():
-            return jsonify({"error": "CNPJ or Email already exists for a merchant."}), 409
+    else:
         new_user = Merchant(
-            full_name=full_name,
-            cnpj=document,
-            email=email,
+            id=uuid.uuid4(),
+            full_name=account.full_name,
+            cnpj=account.document,
+            email=account.email,
             password_hash=hashed_password,
             user_type=UserType.MERCHANT
         )
-    else: # Should have been caught earlier, but as a safeguard
-        return jsonify({"error": "Invalid user_type specified"}), 400
+
+    # Com sharding, a conta é gravada no shard determinado pelo seu UUID e o índice de
+    # identidade (global, no banco principal) é reservado antes, em commit próprio
+    session = db.session
+    router = get_shard_router()
+    if router is not None:
+        try:
+            claim_identities(db.session, new_user)
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            return jsonify({"error": "Database integrity error. User with this document or email likely already exists.", "details": str(e)}), 409
+        session = router.session_for(new_user.id)
+    else:
+        claim_identities(session, new_user) # Mesmo commit da conta
 
     try:
-        db.session.add(new_user)
-        db.session.commit()
+        session.add(new_user)
+        session.commit()
+        mark_recent_write(new_user.id)
         # Return user info, excluding password_hash
         user_data = {
-            "id": str(new_user.id),
+            "id": new_user.id,
             "full_name": new_user.full_name,
             "email": new_user.email,
             "user_type": new_user.user_type.value
@@ -83,35 +99,85 @@ def create_user():
 
         return jsonify(user_data), 201
     except IntegrityError as e:
-        db.session.rollback()
+        session.rollback()
+        _release_identities(session, new_user)
         # This might be redundant if checks above are thorough, but good for race conditions
         return jsonify({"error": "Database integrity error. User with this document or email likely already exists.", "details": str(e)}), 409
     except Exception as e:
-        db.session.rollback()
+        session.rollback()
+        _release_identities(session, new_user)
         return jsonify({"error": "An unexpected error occurred.", "details": str(e)}), 500
+    finally:
+        if session is not db.session:
+            session.close()
 
 @main.route('/transactions', methods=['POST'])
+@admission_controlled
 def create_transaction():
-    data = request.get_json()
-    if not data:
-        return jsonify({"error": "Invalid input"}), 400
-
-    payer_id = data.get('payer_id')
-    payee_id = data.get('payee_id')
-    amount = data.get('amount')
+    try:
+        transfer = TRANSFER_SCHEMA.load(request.get_json(silent=True))
+    except ValidationError as e:
+        return jsonify(e.to_dict()), 400
 
-    if not all([payer_id, payee_id, amount]):
-        return jsonify({"error": "Missing fields: payer_id, payee_id, or amount are required."}), 400
+    # Velocity limits run before any lookup or authorizer call
+    allowed, retry_after = check_transfer_rate_limits(str(transfer.payer_id), transfer.amount, request.remote_addr)
+    if not allowed:
+        response = jsonify({"error": "Rate limit exceeded for this payer or client."})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
 
     try:
-        # Convert amount to string in case it's a number, as process_transaction expects string for Decimal conversion
-        result, status_code = process_transaction(str(payer_id), str(payee_id), str(amount))
+        if current_app.config.get('ASYNC_TRANSFERS_ENABLED') and get_shard_router() is None:
+            result, status_code = accept_transfer(transfer.payer_id, transfer.payee_id, transfer.amount)
+            if status_code == 202:
+                result["status_url"] = url_for('main.get_transaction', transaction_id=result["transaction_id"])
+                return jsonify(result), status_code, {"Location": result["status_url"]}
+            return jsonify(result), status_code
+
+        # Valores já tipados pelo schema: sem reconversão de strings no serviço
+        result, status_code = execute_transfer(transfer.payer_id, transfer.payee_id, transfer.amount)
         return jsonify(result), status_code
-    except ValueError as e: # Catch potential errors if amount cannot be converted to string for Decimal
-        return jsonify({"error": f"Invalid amount format: {str(e)}"}), 400
     except Exception as e: # Catch any other unexpected errors from service layer
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+@main.route('/transactions/<transaction_id>', methods=['GET'])
+def get_transaction(transaction_id):
+    try:
+        val_uuid = uuid.UUID(transaction_id)
+    except ValueError:
+        return jsonify({"error": "Invalid transaction ID format."}), 400
+
+    # Transações finalizadas são respondidas do cache em memória, sem consulta ao banco
+    cache = get_transaction_cache()
+    entry = cache.get(val_uuid)
+    if entry is None:
+        router = get_shard_router()
+        if router is not None:
+            transaction = find_transaction(router, val_uuid)
+        else:
+            transaction = db.session.get(Transaction, val_uuid)
+        if transaction is not None:
+            record = {
+                "id": transaction.id,
+                "payer_id": transaction.payer_id,
+                "payee_id": transaction.payee_id,
+                "amount": transaction.amount,
+                "status": transaction.status,
+                "timestamp": transaction.timestamp,
+            }
+        else:
+            record = find_archived_transaction(val_uuid) # Já saiu da tabela quente
+            if record is None:
+                return jsonify({"error": "Transaction not found."}), 404
+        body = current_app.json.dumps(record).encode()
+        entry = cache.entry_for(record["id"], record["status"], body)
+
+    response = current_app.response_class(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = entry.cache_control
+    return response.make_conditional(request) # 304 quando If-None-Match confere
+
 @main.route('/users/<user_id>/balance', methods=['GET'])
 def get_user_balance(user_id):
     try:
@@ -121,17 +187,226 @@ def get_user_balance(user_id):
         except ValueError:
             return jsonify({"error": "Invalid user ID format."}), 400
 
-        # Try to find in User table
-        user = db.session.get(User, val_uuid) # Usando db.session.get
-        if user:
-            return jsonify({"user_id": str(user.id), "balance": str(user.balance), "user_type": "common"}), 200
+        # Leitura somente: réplica, a menos que a conta tenha sido escrita há pouco
+        with read_session(val_uuid) as session:
+            # Try to find in User table
+            user = session.get(User, val_uuid)
+            if user:
+                return jsonify({"user_id": user.id, "balance": user.balance, "user_type": "common"}), 200
 
-        # Try to find in Merchant table
-        merchant = db.session.get(Merchant, val_uuid) # Usando db.session.get
-        if merchant:
-            return jsonify({"user_id": str(merchant.id), "balance": str(merchant.balance), "user_type": "merchant"}), 200
+            # Try to find in Merchant table
+            merchant = session.get(Merchant, val_uuid)
+            if merchant:
+                return jsonify({"user_id": merchant.id, "balance": merchant.balance, "user_type": "merchant"}), 200
 
         return jsonify({"error": "User not found"}), 404
 
     except Exception as e:
         return jsonify({"error": "An unexpected error occurred.", "details": str(e)}), 500
+
+@main.route('/accounts/lookup', methods=['GET'])
+def lookup_account():
+    # Revela se um documento/e-mail tem conta: só para chamadas administrativas com o token
+    token = current_app.config.get('ACCOUNT_LOOKUP_TOKEN')
+    if not token:
+        return jsonify({"error": "Account lookup is disabled."}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), token.encode()):
+        return jsonify({"error": "Admin token required."}), 403
+
+    document = request.args.get('document', '').strip()
+    email = request.args.get('email', '').strip()
+    if not document and not email:
+        return jsonify({"error": "Provide document and/or email."}), 400
+
+    # Somente leitura: uma busca por chave primária para cada parâmetro informado
+    with read_session() as session:
+        identities = find_identities(session, document=document, email=email)
+        accounts = {}
+        for identity in identities:
+            match = accounts.setdefault(identity.account_id, {
+                "account_id": identity.account_id,
+                "account_type": identity.account_type.value,
+                "matched_by": [],
+            })
+            match["matched_by"].append(identity.kind)
+    if not accounts:
+        return jsonify({"error": "Account not found."}), 404
+    return jsonify({"accounts": list(accounts.values())}), 200
+
+@main.route('/users/<user_id>/transactions', methods=['GET'])
+def get_user_transactions(user_id):
+    try:
+        val_uuid = uuid.UUID(user_id)
+    except ValueError:
+        return jsonify({"error": "Invalid user ID format."}), 400
+
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        return jsonify({"error": "Invalid query parameters. Use ISO 8601 for since/until and an integer limit."}), 400
+
+    try:
+        transactions = get_transaction_history(val_uuid, since=since, until=until, limit=limit)
+        return jsonify({"user_id": val_uuid, "transactions": transactions}), 200
+    except Exception as e:
+        return jsonify({"error": "An unexpected error occurred.", "details": str(e)}), 500
+
+@main.route('/reports/accounts/<account_id>/daily', methods=['GET'])
+def get_account_daily_report(account_id):
+    try:
+        val_uuid = uuid.UUID(account_id)
+    except ValueError:
+        return jsonify({"error": "Invalid account ID format."}), 400
+
+    try:
+        end_day = date.fromisoformat(request.args['to']) if request.args.get('to') else datetime.utcnow().date()
+        start_day = date.fromisoformat(request.args['from']) if request.args.get('from') else end_day
+    except ValueError:
+        return jsonify({"error": "Invalid date. Use YYYY-MM-DD for from/to."}), 400
+    if start_day > end_day or (end_day - start_day).days > 366:
+        return jsonify({"error": "Invalid range. 'from' must precede 'to' by at most 366 days."}), 400
+
+    # Lê apenas a tabela de rollups: custo independe do tamanho do histórico
+    try:
+        return jsonify({"account_id": val_uuid, "days": get_account_daily(val_uuid, start_day, end_day)}), 200
+    except ShardingUnsupported as e:
+        return jsonify({"error": str(e)}), 501
+
+@main.route('/reports/failure-rate', methods=['GET'])
+def get_failure_rate_report():
+    try:
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.utcnow()
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else end - timedelta(hours=24)
+    except ValueError:
+        return jsonify({"error": "Invalid datetime. Use ISO 8601 for from/to."}), 400
+    if start > end or end - start > timedelta(days=31):
+        return jsonify({"error": "Invalid range. 'from' must precede 'to' by at most 31 days."}), 400
+
+    try:
+        return jsonify({"hours": get_failure_rate(start, end)}), 200
+    except ShardingUnsupported as e:
+        return jsonify({"error": str(e)}), 501
+
+@main.route('/notifications/stats', methods=['GET'])
+def get_notification_stats():
+    if not current_app.config.get('NOTIFICATION_AGGREGATION_ENABLED'):
+        return jsonify({"error": "Notification aggregation is disabled."}), 404
+    return jsonify(get_notification_aggregator().stats()), 200
+
+@main.route('/transactions/<transaction_id>/cancel', methods=['POST'])
+def cancel_single_transaction(transaction_id):
+    try:
+        val_uuid = uuid.UUID(transaction_id)
+    except ValueError:
+        return jsonify({"error": "Invalid transaction ID format."}), 400
+
+    try:
+        result, status_code = cancel_transaction(val_uuid)
+        return jsonify(result), status_code
+    except ShardingUnsupported as e:
+        return jsonify({"error": str(e)}), 501
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": "An unexpected error occurred.", "details": str(e)}), 500
+
+@main.route('/transactions/cancel-bulk', methods=['POST'])
+def cancel_transactions_in_bulk():
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Invalid input"}), 400
+
+    try:
+        merchant_id = uuid.UUID(data['merchant_id']) if data.get('merchant_id') else None
+        start = datetime.fromisoformat(data['start']) if data.get('start') else None
+        end = datetime.fromisoformat(data['end']) if data.get('end') else None
+        batch_size = int(data.get('batch_size', 1000))
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid filter. Use a UUID merchant_id, ISO 8601 start/end and an integer batch_size."}), 400
+    if batch_size < 1:
+        return jsonify({"error": "batch_size must be positive."}), 400
+    batch_size = min(batch_size, MAX_BATCH_SIZE)
+
+    # Evita cancelar todo o histórico por engano: exige lojista ou janela completa
+    if merchant_id is None and (start is None or end is None):
+        return jsonify({"error": "A merchant_id or both start and end are required."}), 400
+
+    try:
+        summary = cancel_transactions_bulk(merchant_id=merchant_id, start=start, end=end, batch_size=batch_size)
+        return jsonify(summary), 200
+    except ShardingUnsupported as e:
+        return jsonify({"error": str(e)}), 501
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": "An unexpected error occurred.", "details": str(e)}), 500
+
+def _scheduled_transfer_to_dict(schedule):
+    return {
+        "id": schedule.id,
+        "payer_id": schedule.payer_id,
+        "payee_id": schedule.payee_id,
+        "amount": schedule.amount,
+        "next_run_at": schedule.next_run_at,
+        "interval_seconds": schedule.interval_seconds,
+        "remaining_runs": schedule.remaining_runs,
+        "run_count": schedule.run_count,
+        "status": schedule.status,
+        "last_transaction_id": schedule.last_transaction_id,
+        "last_error": schedule.last_error,
+    }
+
+@main.route('/scheduled-transfers', methods=['POST'])
+def create_scheduled_transfer():
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Invalid input"}), 400
+
+    try:
+        # Agendamentos, agendador e a FK do pagador ficam no banco principal
+        require_unsharded("Scheduled transfers")
+    except ShardingUnsupported as e:
+        return jsonify({"error": str(e)}), 501
+
+    try:
+        scheduled = SCHEDULED_TRANSFER_SCHEMA.load(data)
+    except ValidationError as e:
+        return jsonify(e.to_dict()), 400
+
+    if not User.query.filter_by(id=scheduled.payer_id, user_type=UserType.COMMON).first():
+        return jsonify({"error": "Payer not found or is not a common user."}), 404
+    if db.session.get(User, scheduled.payee_id) is None and db.session.get(Merchant, scheduled.payee_id) is None:
+        return jsonify({"error": "Payee not found."}), 404
+
+    schedule = ScheduledTransfer(
+        payer_id=scheduled.payer_id,
+        payee_id=scheduled.payee_id,
+        amount=scheduled.amount,
+        next_run_at=scheduled.run_at,
+        interval_seconds=scheduled.interval_seconds,
+        remaining_runs=scheduled.max_runs if scheduled.interval_seconds is not None else 1,
+        status=TransactionStatus.PENDING
+    )
+    db.session.add(schedule)
+    db.session.commit()
+    get_transfer_scheduler().schedule_added(schedule.id, schedule.next_run_at)
+    return jsonify(_scheduled_transfer_to_dict(schedule)), 201
+
+@main.route('/scheduled-transfers/<schedule_id>', methods=['GET', 'DELETE'])
+def scheduled_transfer_detail(schedule_id):
+    try:
+        val_uuid = uuid.UUID(schedule_id)
+    except ValueError:
+        return jsonify({"error": "Invalid scheduled transfer ID format."}), 400
+
+    schedule = db.session.get(ScheduledTransfer, val_uuid)
+    if schedule is None:
+        return jsonify({"error": "Scheduled transfer not found."}), 404
+
+    if request.method == 'DELETE':
+        if schedule.status != TransactionStatus.PENDING:
+            return jsonify({"error": f"Scheduled transfer is already {schedule.status.value}."}), 409
+        schedule.status = TransactionStatus.CANCELLED
+        db.session.commit()
+
+    return jsonify(_scheduled_transfer_to_dict(schedule)), 200
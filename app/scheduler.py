@@ -0,0 +1,231 @@
+import heapq
+import math
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from .models import db, ScheduledTransfer, Transaction, TransactionStatus
+from .services import execute_transfer
+
+
+def _next_occurrence(schedule, now):
+    """Next run after `now`; occurrences missed while the service was down are skipped, not replayed."""
+    if schedule.interval_seconds is None:
+        return None
+    interval = timedelta(seconds=schedule.interval_seconds)
+    missed = max(0, math.floor((now - schedule.next_run_at) / interval))
+    return schedule.next_run_at + interval * (missed + 1)
+
+
+class TransferScheduler:
+    """
+    In-process scheduler for ScheduledTransfer rows.
+
+    Only schedules due within `window_seconds` are loaded (at most `max_loaded`)
+    into a min-heap keyed by run time, so memory stays bounded however many
+    future schedules exist. Due items are executed `batch_size` at a time. Each
+    occurrence is first claimed with a conditional UPDATE that advances
+    next_run_at; a restarted or concurrent scheduler cannot claim the same
+    occurrence again, so no transfer is executed twice.
+
+    The last occurrence of a schedule is claimed as RUNNING under a lease,
+    together with the id its Transaction will be written with, and only becomes
+    COMPLETED (or FAILED) after its transfer committed. A lease that expires
+    (the process died mid-run) is recovered on the next reload by looking that
+    id up.
+    """
+
+    def __init__(self, app, window_seconds=300, max_loaded=10_000, batch_size=100, poll_interval=1.0,
+                 refresh_seconds=30, lease_seconds=300):
+        self.app = app
+        self.window = timedelta(seconds=window_seconds)
+        self.refresh = timedelta(seconds=refresh_seconds)
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_loaded = max_loaded
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+        self._heap = []
+        self._loaded_until = None
+        self._refresh_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def recover_expired_leases(self):
+        """
+        Final runs left RUNNING past the lease: completed when the transaction
+        reserved by the claim exists, otherwise returned to PENDING to run again
+        with the same reserved id (a late commit of the lost run then conflicts
+        instead of paying twice).
+        """
+        # O lease mede a vida do processo: relógio real, não o `now` do agendamento
+        expired = db.session.execute(
+            select(ScheduledTransfer)
+            .where(ScheduledTransfer.status == TransactionStatus.RUNNING,
+                   ScheduledTransfer.leased_at <= datetime.utcnow() - self.lease)
+        ).scalars().all()
+        recovered = 0
+        for schedule in expired:
+            transaction = db.session.get(Transaction, schedule.leased_transaction_id)
+            if transaction is not None and transaction.status == TransactionStatus.COMPLETED:
+                values = {"status": TransactionStatus.COMPLETED, "last_transaction_id": transaction.id,
+                          "leased_transaction_id": None}
+            else:
+                values = {"status": TransactionStatus.PENDING, "run_count": ScheduledTransfer.run_count - 1,
+                          "remaining_runs": ScheduledTransfer.remaining_runs + 1}
+            result = db.session.execute(
+                update(ScheduledTransfer)
+                .where(ScheduledTransfer.id == schedule.id,
+                       ScheduledTransfer.status == TransactionStatus.RUNNING,
+                       ScheduledTransfer.leased_at == schedule.leased_at)
+                .values(leased_at=None, **values)
+                .execution_options(synchronize_session=False)
+            )
+            recovered += result.rowcount
+        db.session.commit()
+        return recovered
+
+    def load_window(self, now):
+        self.recover_expired_leases()
+        horizon = now + self.window
+        rows = db.session.execute(
+            select(ScheduledTransfer.next_run_at, ScheduledTransfer.id)
+            .where(ScheduledTransfer.status == TransactionStatus.PENDING, ScheduledTransfer.next_run_at <= horizon)
+            .order_by(ScheduledTransfer.next_run_at)
+            .limit(self.max_loaded)
+        ).all()
+        heap = [tuple(row) for row in rows]
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap = heap
+        # A truncated load only covers up to its last item; reload sooner in that case
+        self._loaded_until = rows[-1][0] if len(rows) == self.max_loaded else horizon
+        # Periodic reload also picks up schedules created by other processes
+        self._refresh_at = min(self._loaded_until, now + self.refresh)
+
+    def schedule_added(self, schedule_id, run_at):
+        """Lets a schedule created in this process run before the next reload."""
+        with self._lock:
+            if self._loaded_until is not None and run_at <= self._loaded_until and len(self._heap) < self.max_loaded:
+                heapq.heappush(self._heap, (run_at, schedule_id))
+
+    def _claim(self, schedule_ids, now):
+        """Advances every due schedule in one commit and returns those this process claimed."""
+        claimed = []
+        for schedule in db.session.execute(
+            select(ScheduledTransfer).where(ScheduledTransfer.id.in_(schedule_ids))
+        ).scalars():
+            if schedule.status != TransactionStatus.PENDING or schedule.next_run_at > now:
+                continue
+            next_run = _next_occurrence(schedule, now)
+            remaining = schedule.remaining_runs - 1 if schedule.remaining_runs is not None else None
+            finished = next_run is None or remaining == 0
+            # Execução final: o id vai no mesmo commit do lease (e é mantido se ela for reexecutada)
+            transaction_id = (schedule.leased_transaction_id or uuid.uuid4()) if finished else uuid.uuid4()
+            result = db.session.execute(
+                update(ScheduledTransfer)
+                .where(ScheduledTransfer.id == schedule.id,
+                       ScheduledTransfer.next_run_at == schedule.next_run_at,
+                       ScheduledTransfer.status == TransactionStatus.PENDING)
+                .values(
+                    next_run_at=schedule.next_run_at if finished else next_run, # Recuperação reexecuta a mesma ocorrência
+                    remaining_runs=remaining,
+                    run_count=ScheduledTransfer.run_count + 1,
+                    # Última execução: COMPLETED só depois do commit da transferência
+                    status=TransactionStatus.RUNNING if finished else TransactionStatus.PENDING,
+                    leased_at=datetime.utcnow() if finished else None,
+                    leased_transaction_id=transaction_id if finished else None,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                claimed.append((schedule.id, schedule.payer_id, schedule.payee_id, schedule.amount, transaction_id,
+                                None if finished else next_run))
+        db.session.commit()
+        return claimed
+
+    def run_pending(self, now=None):
+        """Executes the loaded schedules that are due. Returns how many ran."""
+        now = now or datetime.utcnow()
+        if self._refresh_at is None or now >= self._refresh_at:
+            self.load_window(now)
+
+        executed = 0
+        while self._heap and self._heap[0][0] <= now:
+            batch = []
+            with self._lock:
+                while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                    batch.append(heapq.heappop(self._heap)[1])
+
+            for schedule_id, payer_id, payee_id, amount, transaction_id, next_run in self._claim(batch, now):
+                # O claim já avançou todo o lote: uma exceção aqui não pode perder as ocorrências seguintes
+                try:
+                    # Valores já tipados do banco: sem passar por strings e pelo schema
+                    result, status_code = execute_transfer(payer_id, payee_id, amount, transaction_id=transaction_id)
+                except Exception as e:
+                    db.session.rollback()
+                    result, status_code = {"error": f"Scheduled run failed: {e}"}, 500
+                values = {"last_transaction_id": None, "last_error": None}
+                if status_code in (200, 202):
+                    values["last_transaction_id"] = uuid.UUID(result["transaction_id"]) if result.get("transaction_id") else None
+                else:
+                    values["last_error"] = str(result.get("error"))[:255]
+                if next_run is None:
+                    values["status"] = TransactionStatus.COMPLETED if status_code in (200, 202) else TransactionStatus.FAILED
+                    values["leased_at"] = None
+                    values["leased_transaction_id"] = None
+                try:
+                    db.session.execute(update(ScheduledTransfer).where(ScheduledTransfer.id == schedule_id).values(**values))
+                    db.session.commit()
+                except Exception as e:
+                    # Execução final continua RUNNING e é resolvida pela recuperação do lease
+                    db.session.rollback()
+                    print(f"Transfer scheduler: could not record run of {schedule_id}: {e}")
+                executed += 1
+
+                if next_run is not None:
+                    self.schedule_added(schedule_id, next_run)
+        return executed
+
+    def _loop(self):
+        while not self._stop.wait(self.poll_interval):
+            with self.app.app_context():
+                try:
+                    self.run_pending()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Transfer scheduler: tick failed: {e}")
+                finally:
+                    db.session.remove()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='transfer-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def get_transfer_scheduler():
+    scheduler = current_app.extensions.get('transfer_scheduler')
+    if scheduler is None:
+        config = current_app.config
+        scheduler = TransferScheduler(
+            current_app._get_current_object(),
+            window_seconds=config.get('SCHEDULER_WINDOW_SECONDS', 300),
+            max_loaded=config.get('SCHEDULER_MAX_LOADED', 10_000),
+            batch_size=config.get('SCHEDULER_BATCH_SIZE', 100),
+            poll_interval=config.get('SCHEDULER_POLL_INTERVAL', 1.0),
+            refresh_seconds=config.get('SCHEDULER_REFRESH_SECONDS', 30),
+            lease_seconds=config.get('SCHEDULER_LEASE_SECONDS', 300),
+        )
+        scheduler = current_app.extensions.setdefault('transfer_scheduler', scheduler)
+    return scheduler
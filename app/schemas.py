@@ -0,0 +1,167 @@
+import re
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+
+from .models import UserType
+
+
+class ValidationError(ValueError):
+    def __init__(self, message, field=None):
+        super().__init__(message)
+        self.message = message
+        self.field = field
+
+    def to_dict(self):
+        """Corpo padrão das respostas 400."""
+        payload = {"error": self.message}
+        if self.field is not None:
+            payload["field"] = self.field
+        return payload
+
+
+def _uuid(value):
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+def _decimal(value):
+    # Floats passam por str() para não herdar a representação binária (0.1 -> 0.1000000000000000055...)
+    value = value if isinstance(value, Decimal) else Decimal(str(value))
+    if not value.is_finite():
+        raise ValueError(f"{value} is not a finite amount")
+    return value
+
+
+def _str(value):
+    if not isinstance(value, str):
+        raise TypeError(f"expected a string, got {type(value).__name__}")
+    return value
+
+
+def _user_type(value):
+    return UserType(str(value).lower())
+
+
+def _int(value):
+    if isinstance(value, bool):
+        raise TypeError("expected an integer, got bool")
+    return int(value)
+
+
+def _datetime(value):
+    value = datetime.fromisoformat(_str(value))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None) # Banco guarda UTC sem fuso
+    return value
+
+
+_CONVERTERS = {uuid.UUID: _uuid, Decimal: _decimal, str: _str, UserType: _user_type, int: _int, datetime: _datetime}
+
+
+class Field:
+    def __init__(self, type_, required=True, positive=False, message=None):
+        self.type = type_
+        self.required = required
+        self.positive = positive
+        self.message = message # Mensagem usada quando a conversão/validação falha
+
+
+class Schema:
+    """
+    Schema declarativo compilado na importação.
+
+    Os campos viram uma tupla de (nome, conversor, regras) e o
+    resultado de `load` é um namedtuple já tipado (UUID, Decimal, enums), de
+    modo que a camada de serviço recebe os valores prontos, sem reconverter
+    strings. Todos os campos obrigatórios são verificados antes de qualquer
+    conversão, para que "campo faltando" tenha precedência sobre formato.
+    """
+
+    def __init__(self, name, missing_message="Missing field: {field}", validators=(), **fields):
+        self.type = namedtuple(name, fields)
+        self.missing_message = missing_message
+        self.validators = tuple(validators)
+        self._required = tuple(key for key, field in fields.items() if field.required)
+        self._steps = tuple(
+            (key, _CONVERTERS[field.type], field.positive, field.message)
+            for key, field in fields.items()
+        )
+
+    def load(self, data):
+        if not isinstance(data, dict):
+            raise ValidationError("Invalid input")
+
+        for key in self._required:
+            if data.get(key) in (None, ""):
+                raise ValidationError(self.missing_message.format(field=key), key)
+
+        values = []
+        for key, convert, positive, message in self._steps:
+            raw = data.get(key)
+            if raw is None:
+                values.append(None)
+                continue
+            try:
+                value = convert(raw)
+            except (ValueError, TypeError, InvalidOperation) as e:
+                raise ValidationError(message or f"Invalid input format: {e}", key)
+            if positive and value <= 0:
+                raise ValidationError("Transaction amount must be positive.", key)
+            values.append(value)
+
+        loaded = self.type._make(values)
+        for validator in self.validators:
+            validator(loaded)
+        return loaded
+
+
+_DOCUMENT_PATTERNS = {
+    UserType.COMMON: (re.compile(r'^\d{11}$'), "Invalid CPF format. Must be 11 digits."),
+    UserType.MERCHANT: (re.compile(r'^\d{14}$'), "Invalid CNPJ format. Must be 14 digits."),
+}
+
+
+def _validate_document(user):
+    pattern, message = _DOCUMENT_PATTERNS[user.user_type]
+    if not pattern.match(user.document):
+        raise ValidationError(message, "document")
+
+
+USER_SCHEMA = Schema(
+    "NewAccount",
+    full_name=Field(str),
+    email=Field(str),
+    password=Field(str),
+    document=Field(str),
+    user_type=Field(UserType, message="Invalid user_type. Must be 'common' or 'merchant'."),
+    validators=(_validate_document,),
+)
+
+TRANSFER_SCHEMA = Schema(
+    "Transfer",
+    missing_message="Missing fields: payer_id, payee_id, or amount are required.",
+    payer_id=Field(uuid.UUID),
+    payee_id=Field(uuid.UUID),
+    amount=Field(Decimal, positive=True),
+)
+
+
+def _validate_recurrence(schedule):
+    if schedule.interval_seconds is not None and schedule.interval_seconds < 60:
+        raise ValidationError("interval_seconds must be at least 60.", "interval_seconds")
+    if schedule.max_runs is not None and (schedule.max_runs < 1 or schedule.interval_seconds is None):
+        raise ValidationError("max_runs must be positive and requires interval_seconds.", "max_runs")
+
+
+SCHEDULED_TRANSFER_SCHEMA = Schema(
+    "ScheduledTransferRequest",
+    missing_message="Missing fields: payer_id, payee_id, amount and run_at are required.",
+    payer_id=Field(uuid.UUID),
+    payee_id=Field(uuid.UUID),
+    amount=Field(Decimal, positive=True),
+    run_at=Field(datetime),
+    interval_seconds=Field(int, required=False),
+    max_runs=Field(int, required=False),
+    validators=(_validate_recurrence,),
+)
@@ -0,0 +1,135 @@
+import multiprocessing
+import os
+
+from sqlalchemy import text
+
+from .models import db
+
+
+def default_workers():
+    return multiprocessing.cpu_count() * 2 + 1
+
+
+def warm_up(app):
+    """
+    Prepares a worker before it accepts traffic: opens a connection on every
+    engine (primary, replicas, shards), builds the lazily created singletons
+    and primes the routing/serialization paths with an internal request.
+    """
+    from .admission import get_admission_controller
+    from .archive import load_index
+    from .async_transfers import get_transfer_workers
+    from .authorization import get_authorization_dispatcher
+    from .failure_writer import get_failed_attempt_writer
+    from .notifications import get_notification_aggregator
+    from .ratelimit import get_rate_limit_backend
+    from .replicas import get_replica_router
+    from .sharding import get_shard_router
+    from .transaction_cache import get_transaction_cache
+
+    config = app.config
+    with app.app_context():
+        for engine in db.engines.values():
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+
+        get_admission_controller('main.create_transaction')
+        get_rate_limit_backend()
+        get_transaction_cache()
+        get_replica_router()
+        get_shard_router()
+        load_index()
+        if config.get('AUTHORIZATION_BATCHING_ENABLED'):
+            get_authorization_dispatcher()
+        if config.get('FAILED_WRITER_ENABLED'):
+            get_failed_attempt_writer()
+        if config.get('ASYNC_TRANSFERS_ENABLED'):
+            get_transfer_workers()
+        if config.get('NOTIFICATION_AGGREGATION_ENABLED'):
+            get_notification_aggregator()
+        app.json.loads(app.json.dumps({"warm": True}))
+
+    app.test_client().get('/')
+
+
+def drain(app):
+    """
+    Graceful shutdown of one worker, after the server stopped routing requests
+    to it: finishes queued async transfers, flushes buffered failed-attempt
+    records and notification digests, closes the traffic capture segment and the connection pools.
+    """
+    extensions = app.extensions
+    if 'transfer_workers' in extensions:
+        extensions['transfer_workers'].stop()
+    if 'failed_attempt_writer' in extensions:
+        extensions['failed_attempt_writer'].stop()
+    if 'transfer_scheduler' in extensions:
+        extensions['transfer_scheduler'].stop()
+    if 'notification_aggregator' in extensions:
+        extensions['notification_aggregator'].stop()
+    if 'authorization_dispatcher' in extensions:
+        extensions['authorization_dispatcher'].stop()
+    if 'capture_writer' in extensions:
+        extensions['capture_writer'].close()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def build_options(app, bind=None, workers=None, threads=None):
+    config = app.config
+    threads = threads or config.get('SERVER_THREADS', 4)
+    return {
+        'bind': bind or config.get('SERVER_BIND', '0.0.0.0:8000'),
+        'workers': workers or config.get('SERVER_WORKERS') or default_workers(),
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'timeout': config.get('SERVER_TIMEOUT', 30),
+        'graceful_timeout': config.get('SERVER_GRACEFUL_TIMEOUT', 30),
+        'max_requests': config.get('SERVER_MAX_REQUESTS', 0),
+        'max_requests_jitter': config.get('SERVER_MAX_REQUESTS_JITTER', 0),
+        # App criado uma vez no master (create_all, imports); cada worker herda via fork
+        'preload_app': True,
+    }
+
+
+def _post_fork(app):
+    def hook(server, worker):
+        # Conexões abertas no master não podem ser compartilhadas entre processos
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+    return hook
+
+
+def run_server(app, **kwargs):
+    """
+    Runs `app` under gunicorn (prefork). Each worker is warmed up before it
+    starts accepting connections and drained when it exits.
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise RuntimeError("gunicorn is not installed; run `pip install gunicorn` to use the production server.")
+
+    class PaymentsServer(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+            self.cfg.set('post_fork', _post_fork(self.application))
+            self.cfg.set('post_worker_init', lambda worker: warm_up(self.application))
+            self.cfg.set('worker_exit', lambda server, worker: drain(self.application))
+            # O master também pode ter threads próprias (ex.: agendador iniciado no create_app)
+            self.cfg.set('on_exit', lambda server: drain(self.application))
+
+        def load(self):
+            return self.application
+
+    options = build_options(app, **kwargs)
+    print(f"Starting {options['workers']} worker(s) x {options['threads']} thread(s) on {options['bind']} (pid {os.getpid()})")
+    PaymentsServer(app, options).run()
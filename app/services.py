@@ -1,8 +1,16 @@
 from .models import db, User, Merchant, Transaction, TransactionStatus, UserType
-from decimal import Decimal
-import uuid # Required for converting string IDs to UUID objects
+import heapq
+import itertools
 import requests
 from flask import current_app
+from sqlalchemy import or_, update
+from .authorization import get_authorization_dispatcher
+from .replicas import mark_recent_write, read_session
+from .archive import iter_archived_transactions, reaches_archive
+from .rollups import record_transaction
+from .sharding import get_shard_router, process_sharded_transaction
+from .schemas import TRANSFER_SCHEMA, ValidationError
+from .failure_writer import record_failed_attempt
 
 # Mock external services - TO BE REPLACED WITH ACTUAL CALLS
 # def mock_authorize_transaction():
@@ -13,9 +21,14 @@ from flask import current_app
 #     print(f"Mock Notifier: Sending notification to {payee_id}: {message}")
 #     return True
 
-def authorize_transaction_external():
+def authorize_transaction_external(payer_id=None, payee_id=None, amount=None):
     # This URL was mentioned in some contexts as an authorizer mock.
     # It returns: {"message": "Autorizado"}
+    if current_app.config.get('AUTHORIZATION_BATCHING_ENABLED'):
+        # Concurrent transfers are coalesced into batch (or pipelined) authorizer calls
+        payload = {"payer_id": str(payer_id), "payee_id": str(payee_id), "amount": str(amount)}
+        return get_authorization_dispatcher().authorize(payload, timeout=current_app.config.get('AUTHORIZATION_TIMEOUT', 5.0) * 2)
+
     auth_url = current_app.config.get('AUTHORIZATION_SERVICE_URL', 'https://run.mocky.io/v3/5794d450-d2e2-4412-8131-73d0293ac1cc')
     try:
         response = requests.get(auth_url)
@@ -31,11 +44,7 @@ def authorize_transaction_external():
         print(f"External Authorizer ({auth_url}): Request failed: {e}")
         return False # Fail safe: if service is down, consider not authorized
 
-def send_notification_external(payee_id, amount):
-    # This URL was mentioned as a notification mock.
-    # It returns: {"message": true}
-    notify_url = current_app.config.get('NOTIFICATION_SERVICE_URL', 'https://run.mocky.io/v3/54dc2cf1-3add-45b5-b5a9-6bf7e7f1f4a6')
-    payload = {"payee_id": str(payee_id), "amount": str(amount)} # Example payload
+def _post_notification(notify_url, payload, payee_id):
     try:
         response = requests.post(notify_url, json=payload) # Using POST as is common for notifications
         response.raise_for_status()
@@ -50,16 +59,52 @@ def send_notification_external(payee_id, amount):
         print(f"External Notifier ({notify_url}): Request failed: {e}")
         return False # Fail safe: if service is down, consider notification failed
 
+def send_notification_external(payee_id, amount):
+    # This URL was mentioned as a notification mock.
+    # It returns: {"message": true}
+    notify_url = current_app.config.get('NOTIFICATION_SERVICE_URL', 'https://run.mocky.io/v3/54dc2cf1-3add-45b5-b5a9-6bf7e7f1f4a6')
+    payload = {"payee_id": str(payee_id), "amount": str(amount)} # Example payload
+    return _post_notification(notify_url, payload, payee_id)
+
+def send_notification_digest_external(payee_id, count, total, transaction_ids):
+    # Um aviso para vários pagamentos ao mesmo recebedor (mesmo formato, mais count e ids)
+    notify_url = current_app.config.get('NOTIFICATION_DIGEST_URL') or current_app.config.get('NOTIFICATION_SERVICE_URL', 'https://run.mocky.io/v3/54dc2cf1-3add-45b5-b5a9-6bf7e7f1f4a6')
+    payload = {
+        "payee_id": str(payee_id),
+        "amount": str(total),
+        "count": count,
+        "transaction_ids": [str(transaction_id) for transaction_id in transaction_ids],
+    }
+    return _post_notification(notify_url, payload, payee_id)
+
+def notify_payee(transaction_id, payee_id, amount):
+    """Avisa o recebedor de um pagamento concluído; com agregação ligada, o aviso pode sair num digest."""
+    if current_app.config.get('NOTIFICATION_AGGREGATION_ENABLED'):
+        from .notifications import get_notification_aggregator
+        get_notification_aggregator().submit(payee_id, amount, transaction_id)
+        return
+    if not send_notification_external(payee_id, amount):
+        # Log or handle notification failure if necessary, but transaction is already committed.
+        # This is a common pattern: transaction success is primary, notification is secondary.
+        print(f"Warning: Notification failed for transaction {transaction_id} to payee {payee_id}")
+
 def process_transaction(payer_id_str, payee_id_str, amount_str):
+    # Entrada em texto (CLI, agendador, testes): valida com o mesmo schema da rota
     try:
-        payer_id = uuid.UUID(payer_id_str)
-        payee_id = uuid.UUID(payee_id_str)
-        amount = Decimal(amount_str) # Use Decimal for currency
-    except (ValueError, TypeError) as e:
-        return {"error": f"Invalid input format: {str(e)}"}, 400
-
-    if amount <= 0:
-        return {"error": "Transaction amount must be positive."}, 400
+        transfer = TRANSFER_SCHEMA.load({"payer_id": payer_id_str, "payee_id": payee_id_str, "amount": amount_str})
+    except ValidationError as e:
+        return e.to_dict(), 400
+    return execute_transfer(transfer.payer_id, transfer.payee_id, transfer.amount)
+
+def execute_transfer(payer_id, payee_id, amount, transaction_id=None):
+    """
+    Núcleo tipado da transferência: recebe UUID/UUID/Decimal já validados (amount > 0).
+    `transaction_id` fixa o id da Transaction concluída (agendador: permite saber se ela foi gravada).
+    """
+    # Contas particionadas em vários bancos: o roteador de shards assume a transferência
+    router = get_shard_router()
+    if router is not None:
+        return process_sharded_transaction(router, payer_id, payee_id, amount)
 
     # 1. Verify Payer
     # Usar db.session.get() para buscar por ID primário é mais direto se já temos o UUID.
@@ -82,26 +127,31 @@ def process_transaction(payer_id_str, payee_id_str, amount_str):
         return {"error": "Insufficient balance."}, 400
 
     # 4. External Authorization
-    if not authorize_transaction_external(): # MODIFICADO
+    if not authorize_transaction_external(payer.id, payee.id, amount): # MODIFICADO
         # Record failed transaction attempt due to authorization failure
-        transaction = Transaction(
-            payer_id=payer.id,
-            payee_id=payee.id,
-            amount=amount,
-            status=TransactionStatus.FAILED
-        )
-        db.session.add(transaction)
-        db.session.commit()
+        record_failed_attempt(db.session, payer.id, payee.id, amount)
         return {"error": "Transaction not authorized by external service."}, 403
 
     # 5. Perform Transaction
     try:
-        payer.balance -= amount
-        payee.balance += amount
-
-        # Adicionar payer e payee à sessão para garantir que as alterações de saldo sejam salvas.
-        db.session.add(payer)
-        db.session.add(payee)
+        # Incrementos em SQL, não leitura-modificação-escrita: liquidação, estornos e reservas
+        # alteram os mesmos saldos em paralelo e uma escrita de objeto carregado sobrescreveria a deles
+        debited = db.session.execute(
+            update(User)
+            .where(User.id == payer.id, User.balance >= amount)
+            .values(balance=User.balance - amount)
+        ).rowcount
+        if debited != 1:
+            db.session.rollback()
+            return {"error": "Insufficient balance."}, 400 # Saldo consumido desde a verificação acima
+
+        payee_model = type(payee)
+        credited = db.session.execute(
+            update(payee_model).where(payee_model.id == payee.id).values(balance=payee_model.balance + amount)
+        ).rowcount
+        if credited != 1:
+            db.session.rollback()
+            return {"error": "Payee not found."}, 404
 
         transaction = Transaction(
             payer_id=payer.id,
@@ -109,14 +159,15 @@ def process_transaction(payer_id_str, payee_id_str, amount_str):
             amount=amount,
             status=TransactionStatus.COMPLETED
         )
+        if transaction_id is not None:
+            transaction.id = transaction_id
         db.session.add(transaction)
+        record_transaction(db.session, payer.id, payee.id, amount, TransactionStatus.COMPLETED) # Rollups no mesmo commit
         db.session.commit()
+        mark_recent_write(payer.id, payee.id) # Read-your-writes: próximas leituras dessas contas vão ao primário
 
         # 6. External Notification
-        if not send_notification_external(payee.id, amount): # MODIFICADO
-            # Log or handle notification failure if necessary, but transaction is already committed.
-            # This is a common pattern: transaction success is primary, notification is secondary.
-            print(f"Warning: Notification failed for transaction {transaction.id} to payee {payee.id}")
+        notify_payee(transaction.id, payee.id, amount)
 
         return {
             "message": "Transaction completed successfully.",
@@ -127,18 +178,62 @@ def process_transaction(payer_id_str, payee_id_str, amount_str):
     except Exception as e:
         db.session.rollback()
         # Record failed transaction attempt
-        transaction = Transaction(
-            payer_id=payer.id,
-            payee_id=payee.id,
-            amount=amount,
-            status=TransactionStatus.FAILED
-        )
         # We should try to save this failed transaction if possible, but the session might be in a bad state
         try:
-            db.session.add(transaction)
-            db.session.commit()
+            record_failed_attempt(db.session, payer.id, payee.id, amount)
         except Exception as inner_e:
             print(f"Failed to save failed transaction record: {inner_e}")
             # Potentially log this critical failure to save transaction status
 
         return {"error": f"Transaction failed during processing: {str(e)}"}, 500
+
+def _transaction_to_dict(transaction, account_id):
+    return {
+        "id": transaction["id"],
+        "payer_id": transaction["payer_id"],
+        "payee_id": transaction["payee_id"],
+        "amount": transaction["amount"],
+        "status": transaction["status"],
+        "timestamp": transaction["timestamp"],
+        "direction": "out" if transaction["payer_id"] == account_id else "in",
+    }
+
+def _hot_history(session, account_id, since, until, limit):
+    query = session.query(Transaction).filter(or_(Transaction.payer_id == account_id, Transaction.payee_id == account_id))
+    if since is not None:
+        query = query.filter(Transaction.timestamp >= since)
+    if until is not None:
+        query = query.filter(Transaction.timestamp < until)
+    rows = query.order_by(Transaction.timestamp.desc()).limit(limit).all()
+    return [
+        {"id": t.id, "payer_id": t.payer_id, "payee_id": t.payee_id, "amount": t.amount,
+         "status": t.status, "timestamp": t.timestamp}
+        for t in rows
+    ]
+
+def get_transaction_history(account_id, since=None, until=None, limit=100):
+    """
+    Extrato da conta (mais recentes primeiro). A tabela quente é lida primeiro;
+    os segmentos de arquivo só são lidos quando `since` alcança o período
+    arquivado e as linhas quentes não bastam para preencher `limit`, de forma
+    transparente para o chamador.
+    """
+    router = get_shard_router()
+    if router is not None:
+        # Cada transação fica no shard do pagador: recebimentos podem estar em qualquer shard
+        shards = []
+        for index in range(len(router)):
+            with router.session(index) as session:
+                shards.append(_hot_history(session, account_id, since, until, limit))
+        hot = heapq.nlargest(limit, itertools.chain.from_iterable(shards), key=lambda t: t["timestamp"])
+    else:
+        with read_session(account_id) as session:
+            hot = _hot_history(session, account_id, since, until, limit)
+
+    # Arquivo só entra se a tabela quente não preencheu `limit` ou se a linha mais antiga já está no período arquivado
+    if reaches_archive(since) and (len(hot) < limit or reaches_archive(hot[-1]["timestamp"])):
+        seen = {t["id"] for t in hot}
+        archived = (t for t in iter_archived_transactions(account_id, since, until) if t["id"] not in seen)
+        hot = heapq.nlargest(limit, itertools.chain(hot, archived), key=lambda t: t["timestamp"])
+
+    return [_transaction_to_dict(t, account_id) for t in hot]
@@ -0,0 +1,141 @@
+from datetime import datetime
+
+from sqlalchemy import false, func, insert, literal, select, true, update
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, Merchant, Transaction, TransactionStatus, SettlementBatch, MerchantSettlement
+from .sharding import require_unsharded
+
+
+class SettlementWindowConflict(ValueError):
+    pass
+
+
+def _get_or_create_batch(window_start, window_end):
+    batch = SettlementBatch.query.filter_by(window_start=window_start, window_end=window_end).first()
+    if batch is not None:
+        return batch
+
+    overlapping = SettlementBatch.query.filter(
+        SettlementBatch.window_start < window_end, SettlementBatch.window_end > window_start
+    ).first()
+    if overlapping is not None:
+        raise SettlementWindowConflict(
+            f"Window overlaps settlement {overlapping.window_start.isoformat()} - {overlapping.window_end.isoformat()}"
+        )
+
+    batch = SettlementBatch(window_start=window_start, window_end=window_end, status='open')
+    db.session.add(batch)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another sweep created the same window concurrently
+        db.session.rollback()
+        batch = SettlementBatch.query.filter_by(window_start=window_start, window_end=window_end).one()
+    return batch
+
+
+def _compute_lines(batch):
+    """
+    One INSERT ... SELECT ... GROUP BY over the window, committed with the status
+    change. Returns False when a concurrent run computed the batch's lines first.
+    """
+    amount = func.sum(Transaction.amount)
+    lines = (
+        select(
+            literal(batch.id, type_=MerchantSettlement.batch_id.type),
+            Transaction.payee_id,
+            amount,
+            func.count(Transaction.id),
+            false(),
+        )
+        .join(Merchant, Merchant.id == Transaction.payee_id)
+        .where(
+            Transaction.status == TransactionStatus.COMPLETED,
+            Transaction.timestamp >= batch.window_start,
+            Transaction.timestamp < batch.window_end,
+        )
+        .group_by(Transaction.payee_id)
+    )
+    try:
+        db.session.execute(
+            insert(MerchantSettlement).from_select(
+                ['batch_id', 'merchant_id', 'amount', 'tx_count', 'applied'], lines
+            )
+        )
+        merchant_count, total = db.session.execute(
+            select(func.count(), func.coalesce(func.sum(MerchantSettlement.amount), 0))
+            .where(MerchantSettlement.batch_id == batch.id)
+        ).one()
+        batch.merchant_count = merchant_count
+        batch.total_amount = total
+        batch.status = 'applying'
+        db.session.commit()
+    except IntegrityError:
+        # Outra execução gravou as linhas deste lote primeiro e é ela quem aplica os débitos
+        db.session.rollback()
+        return False
+    return True
+
+
+def _apply_chunk(batch, chunk_size):
+    """Debits one chunk of pending payouts and marks them applied in the same commit."""
+    merchant_ids = db.session.execute(
+        select(MerchantSettlement.merchant_id)
+        .where(MerchantSettlement.batch_id == batch.id, MerchantSettlement.applied == false())
+        .limit(chunk_size)
+    ).scalars().all()
+    if not merchant_ids:
+        return 0
+
+    payout = (
+        select(MerchantSettlement.amount)
+        .where(MerchantSettlement.batch_id == batch.id, MerchantSettlement.merchant_id == Merchant.id)
+        .scalar_subquery()
+    )
+    db.session.execute(
+        update(Merchant).where(Merchant.id.in_(merchant_ids)).values(balance=Merchant.balance - payout)
+    )
+    db.session.execute(
+        update(MerchantSettlement)
+        .where(MerchantSettlement.batch_id == batch.id, MerchantSettlement.merchant_id.in_(merchant_ids))
+        .values(applied=true())
+    )
+    db.session.commit()
+    return len(merchant_ids)
+
+
+def run_settlement(window_start, window_end, chunk_size=1000):
+    """
+    Settles merchants' net COMPLETED volume in [window_start, window_end).
+
+    Idempotent per window: a completed batch is returned as is. Resumable: the
+    payout lines are computed in one commit, then applied in chunks that each
+    debit the balances and flag their lines in the same commit, so an
+    interrupted sweep continues where it stopped.
+    """
+    if window_end <= window_start:
+        raise ValueError("window_end must be after window_start")
+    require_unsharded("Settlement")
+
+    batch = _get_or_create_batch(window_start, window_end)
+    if batch.status == 'open' and not _compute_lines(batch):
+        return _summary(batch) # Lote existente, como gravado pela execução concorrente
+
+    if batch.status == 'applying':
+        while _apply_chunk(batch, chunk_size):
+            pass
+        batch.status = 'completed'
+        batch.completed_at = datetime.utcnow()
+        db.session.commit()
+
+    return _summary(batch)
+
+
+def _summary(batch):
+    return {
+        "batch_id": str(batch.id),
+        "status": batch.status,
+        "merchants": batch.merchant_count,
+        "total_amount": str(batch.total_amount),
+    }
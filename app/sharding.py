@@ -0,0 +1,246 @@
+import uuid
+import zlib
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .models import (db, User, Merchant, Transaction, TransactionStatus, UserType,
+                     CrossShardTransfer, ShardTransferCredit)
+
+
+def shard_binds(uris):
+    """SQLALCHEMY_BINDS entries for the configured shard URIs."""
+    return {f"shard_{i}": uri for i, uri in enumerate(uris)}
+
+
+class ShardRouter:
+    """
+    Maps accounts to shards by hashing their UUID.
+
+    Each shard holds the users, merchants and transactions tables; a Transaction
+    lives on its payer's shard. Sessions returned here are plain SQLAlchemy
+    sessions bound to one shard and must be closed by the caller.
+    """
+
+    def __init__(self, engines):
+        self.engines = list(engines)
+
+    def __len__(self):
+        return len(self.engines)
+
+    def shard_for(self, account_id):
+        return zlib.crc32(account_id.bytes) % len(self.engines)
+
+    def session(self, index):
+        return Session(bind=self.engines[index])
+
+    def session_for(self, account_id):
+        return self.session(self.shard_for(account_id))
+
+    def create_all(self):
+        for engine in self.engines:
+            db.metadata.create_all(engine)
+
+
+def get_shard_router():
+    """The app's ShardRouter, or None when SHARD_URIS is not configured."""
+    if not current_app.config.get('SHARD_URIS'):
+        return None
+    router = current_app.extensions.get('shard_router')
+    if router is None:
+        keys = shard_binds(current_app.config['SHARD_URIS']).keys()
+        router = ShardRouter(db.engines[key] for key in keys)
+        router = current_app.extensions.setdefault('shard_router', router)
+    return router
+
+
+class ShardingUnsupported(RuntimeError):
+    """A feature that still reads and writes only the primary database was used with sharding on."""
+
+
+def require_unsharded(feature):
+    if get_shard_router() is not None:
+        raise ShardingUnsupported(
+            f"{feature} is not supported with sharding (SHARD_URIS): accounts and transactions live on the shards.")
+
+
+def find_transaction(router, transaction_id):
+    """A Transaction lives on its payer's shard; without the payer every shard is probed by primary key."""
+    for index in range(len(router)):
+        with router.session(index) as session:
+            transaction = session.get(Transaction, transaction_id)
+            if transaction is not None:
+                session.expunge(transaction)
+                return transaction
+    return None
+
+
+def find_account(session, account_id):
+    return session.get(User, account_id) or session.get(Merchant, account_id)
+
+
+def _debit(session, payer_id, amount):
+    # Conditional update: the balance check and the debit are one atomic statement
+    result = session.execute(
+        update(User)
+        .where(User.id == payer_id, User.user_type == UserType.COMMON, User.balance >= amount)
+        .values(balance=User.balance - amount)
+    )
+    return result.rowcount == 1
+
+
+def _credit(session, payee_id, amount):
+    for model in (User, Merchant):
+        result = session.execute(update(model).where(model.id == payee_id).values(balance=model.balance + amount))
+        if result.rowcount == 1:
+            return True
+    return False
+
+
+def _apply_credit(router, payee_shard, transaction_id, payee_id, amount):
+    """Credits the payee once per transaction. Returns False if the payee no longer exists."""
+    with router.session(payee_shard) as session:
+        if session.get(ShardTransferCredit, transaction_id) is not None:
+            return True
+        if not _credit(session, payee_id, amount):
+            session.rollback()
+            return False
+        session.add(ShardTransferCredit(transaction_id=transaction_id, payee_id=payee_id, amount=amount))
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback() # A concurrent sweeper applied it first
+        return True
+
+
+def _finish(router, payer_shard, transaction_id):
+    with router.session(payer_shard) as session:
+        result = session.execute(
+            update(CrossShardTransfer)
+            .where(CrossShardTransfer.transaction_id == transaction_id, CrossShardTransfer.state == 'debited')
+            .values(state='completed')
+        )
+        if result.rowcount == 1:
+            session.execute(update(Transaction).where(Transaction.id == transaction_id)
+                            .values(status=TransactionStatus.COMPLETED))
+        session.commit()
+
+
+def _compensate(router, payer_shard, transaction):
+    with router.session(payer_shard) as session:
+        result = session.execute(
+            update(CrossShardTransfer)
+            .where(CrossShardTransfer.transaction_id == transaction.id, CrossShardTransfer.state == 'debited')
+            .values(state='compensated')
+        )
+        if result.rowcount == 1:
+            session.execute(update(User).where(User.id == transaction.payer_id)
+                            .values(balance=User.balance + transaction.amount))
+            session.execute(update(Transaction).where(Transaction.id == transaction.id)
+                            .values(status=TransactionStatus.FAILED))
+        session.commit()
+
+
+def process_sharded_transaction(router, payer_id, payee_id, amount):
+    """
+    Sharded counterpart of process_transaction (same validations and responses).
+
+    Same-shard transfers debit, credit and record the Transaction in one commit.
+    Cross-shard transfers run a saga: (1) debit + PENDING Transaction + saga row on
+    the payer shard, (2) idempotent credit on the payee shard, (3) COMPLETED on the
+    payer shard. A crash between steps is finished or compensated by
+    recover_cross_shard_transfers.
+    """
+    from .services import authorize_transaction_external, notify_payee
+
+    payer_shard = router.shard_for(payer_id)
+    payee_shard = router.shard_for(payee_id)
+
+    with router.session(payer_shard) as session:
+        payer = session.query(User).filter_by(id=payer_id, user_type=UserType.COMMON).first()
+        if not payer:
+            return {"error": "Payer not found or is not a common user."}, 404
+        payer_balance = payer.balance
+
+    with router.session(payee_shard) as session:
+        if find_account(session, payee_id) is None:
+            return {"error": "Payee not found."}, 404
+
+    if payer_balance < amount:
+        return {"error": "Insufficient balance."}, 400
+
+    if not authorize_transaction_external(payer_id, payee_id, amount):
+        with router.session(payer_shard) as session:
+            session.add(Transaction(payer_id=payer_id, payee_id=payee_id, amount=amount, status=TransactionStatus.FAILED))
+            session.commit()
+        return {"error": "Transaction not authorized by external service."}, 403
+
+    transaction_id = uuid.uuid4()
+    with router.session(payer_shard) as session:
+        if not _debit(session, payer_id, amount):
+            session.rollback()
+            return {"error": "Insufficient balance."}, 400
+
+        if payer_shard == payee_shard:
+            if not _credit(session, payee_id, amount):
+                # Recebedor removido depois da verificação: desfaz o débito
+                session.rollback()
+                return {"error": "Payee not found."}, 404
+            status = TransactionStatus.COMPLETED
+        else:
+            status = TransactionStatus.PENDING
+            session.add(CrossShardTransfer(transaction_id=transaction_id, payee_shard=payee_shard, state='debited'))
+        session.add(Transaction(id=transaction_id, payer_id=payer_id, payee_id=payee_id, amount=amount, status=status))
+        session.commit()
+
+    if payer_shard != payee_shard:
+        try:
+            if _apply_credit(router, payee_shard, transaction_id, payee_id, amount):
+                _finish(router, payer_shard, transaction_id)
+                status = TransactionStatus.COMPLETED
+        except Exception as e:
+            # Funds are debited and the saga row is durable: the sweeper finishes it
+            print(f"Cross-shard transfer {transaction_id} left for recovery: {e}")
+
+    if status != TransactionStatus.COMPLETED:
+        return {
+            "message": "Transaction accepted; settlement in progress.",
+            "transaction_id": str(transaction_id),
+            "status": status.value
+        }, 202
+
+    notify_payee(transaction_id, payee_id, amount)
+
+    return {
+        "message": "Transaction completed successfully.",
+        "transaction_id": str(transaction_id),
+        "status": status.value
+    }, 200
+
+
+def recover_cross_shard_transfers(router, grace_seconds=60):
+    """
+    Sweeper for sagas stuck after the debit: re-applies the (idempotent) credit and
+    completes them, or refunds the payer when the payee no longer exists.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    summary = {"completed": 0, "compensated": 0}
+    for payer_shard in range(len(router)):
+        with router.session(payer_shard) as session:
+            stuck = (session.query(CrossShardTransfer, Transaction)
+                     .join(Transaction, Transaction.id == CrossShardTransfer.transaction_id)
+                     .filter(CrossShardTransfer.state == 'debited', CrossShardTransfer.updated_at <= cutoff)
+                     .all())
+            session.expunge_all()
+
+        for saga, transaction in stuck:
+            if _apply_credit(router, saga.payee_shard, transaction.id, transaction.payee_id, transaction.amount):
+                _finish(router, payer_shard, transaction.id)
+                summary["completed"] += 1
+            else:
+                _compensate(router, payer_shard, transaction)
+                summary["compensated"] += 1
+    return summary
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from .models import TransactionStatus
+
+# FAILED e CANCELLED nunca mudam. COMPLETED ainda pode virar CANCELLED (estorno),
+# então fica em cache por pouco tempo e é invalidado pelos estornos deste processo.
+IMMUTABLE_STATUSES = frozenset({TransactionStatus.FAILED, TransactionStatus.CANCELLED})
+
+_cache_lock = threading.Lock()
+
+
+class CachedTransaction:
+    __slots__ = ('body', 'etag', 'cache_control', 'expires_at')
+
+    def __init__(self, body, etag, cache_control, expires_at):
+        self.body = body
+        self.etag = etag
+        self.cache_control = cache_control
+        self.expires_at = expires_at
+
+
+class TransactionCache:
+    """
+    LRU of rendered GET /transactions/<id> responses for settled transactions.
+
+    The JSON body is serialized once and kept as bytes, so a hit costs neither
+    a query nor serialization. PENDING transactions are never cached.
+    """
+
+    def __init__(self, max_size=10_000, completed_ttl=60, immutable_max_age=31_536_000):
+        self.max_size = max_size
+        self.completed_ttl = completed_ttl
+        self.immutable_max_age = immutable_max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, transaction_id):
+        with self._lock:
+            entry = self._entries.get(transaction_id)
+            if entry is None:
+                return None
+            if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                del self._entries[transaction_id]
+                return None
+            self._entries.move_to_end(transaction_id)
+            return entry
+
+    def entry_for(self, transaction_id, status, body):
+        """Builds the response metadata for a transaction and caches it if it is settled."""
+        # Strong ETag: id e status determinam a representação (valor, partes e data não mudam)
+        etag = f"{transaction_id.hex}-{status.value}"
+        # private: a resposta expõe as partes e o valor; proxies e CDNs compartilhados não guardam
+        if status in IMMUTABLE_STATUSES:
+            cache_control, expires_at = f"private, max-age={self.immutable_max_age}, immutable", None
+        elif status == TransactionStatus.COMPLETED:
+            cache_control = f"private, max-age={self.completed_ttl}"
+            expires_at = time.monotonic() + self.completed_ttl
+        else:
+            return CachedTransaction(body, etag, "no-cache", None)
+
+        entry = CachedTransaction(body, etag, cache_control, expires_at)
+        with self._lock:
+            self._entries[transaction_id] = entry
+            self._entries.move_to_end(transaction_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, *transaction_ids):
+        with self._lock:
+            for transaction_id in transaction_ids:
+                self._entries.pop(transaction_id, None)
+
+
+def get_transaction_cache():
+    cache = current_app.extensions.get('transaction_cache')
+    if cache is None:
+        with _cache_lock:
+            cache = current_app.extensions.get('transaction_cache')
+            if cache is None:
+                config = current_app.config
+                cache = TransactionCache(
+                    max_size=config.get('TRANSACTION_CACHE_SIZE', 10_000),
+                    completed_ttl=config.get('TRANSACTION_CACHE_COMPLETED_TTL', 60),
+                )
+                current_app.extensions['transaction_cache'] = cache
+    return cache
@@ -0,0 +1,58 @@
+"""
+Micro-benchmark da serialização JSON dos payloads de /transactions e do saldo.
+
+Compara o provider orjson (padrão) com o provider da stdlib do Flask.
+Uso: python benchmarks/bench_json.py [iterações]
+"""
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.json_provider import OrjsonProvider, StdlibJSONProvider
+from app.models import TransactionStatus
+
+
+def _payloads():
+    account_id = uuid.uuid4()
+    now = datetime(2024, 1, 1)
+    balance = {"user_id": account_id, "balance": Decimal("1234.56"), "user_type": "common"}
+    transfer_request = {"payer_id": str(account_id), "payee_id": str(uuid.uuid4()), "amount": "10.00"}
+    transfer_response = {
+        "message": "Transaction successful", "transaction_id": str(uuid.uuid4()),
+        "status": TransactionStatus.COMPLETED.value,
+    }
+    history = {"user_id": account_id, "transactions": [
+        {"id": uuid.uuid4(), "payer_id": account_id, "payee_id": uuid.uuid4(), "amount": Decimal("10.00") + i,
+         "status": TransactionStatus.COMPLETED, "timestamp": now - timedelta(minutes=i), "direction": "out"}
+        for i in range(100)
+    ]}
+    return balance, transfer_request, transfer_response, history
+
+
+def main(iterations=20_000):
+    app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:"})
+    balance, transfer_request, transfer_response, history = _payloads()
+    request_body = StdlibJSONProvider(app).dumps(transfer_request)
+
+    for provider in (StdlibJSONProvider(app), OrjsonProvider(app)):
+        name = type(provider).__name__
+        cases = {
+            "balance dumps": lambda: provider.dumps(balance),
+            "transfer body loads": lambda: provider.loads(request_body),
+            "transfer response dumps": lambda: provider.dumps(transfer_response),
+            "history (100) dumps": lambda: provider.dumps(history),
+        }
+        for case, fn in cases.items():
+            n = iterations // 50 if "history" in case else iterations
+            seconds = timeit.timeit(fn, number=n)
+            print(f"{name:20} {case:25} {seconds / n * 1e6:8.2f} us/op")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,158 @@
+"""
+Vazão do servidor de produção (flask serve / gunicorn) com diferentes
+combinações de workers x threads.
+
+Sobe um autorizador/notificador falso (com latência configurável), popula o
+banco, inicia o servidor para cada configuração e mede requisições por segundo
+de uma mistura de consultas de saldo e transferências.
+
+Uso: python benchmarks/bench_server.py [--database-uri URI] [--duration 10] [--clients 32]
+SQLite serializa escritas; para números representativos use PostgreSQL.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.models import db, User, Merchant
+
+CONFIGURATIONS = [(1, 1), (2, 1), (2, 4), (4, 4), (4, 8)] # (workers, threads)
+
+
+def _start_stub(latency):
+    class Stub(BaseHTTPRequestHandler):
+        def _reply(self, body):
+            time.sleep(latency)
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._reply({"message": "Autorizado"})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self._reply({"message": True})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def _overrides(database_uri, stub_url):
+    return {
+        "SQLALCHEMY_DATABASE_URI": database_uri,
+        "AUTHORIZATION_SERVICE_URL": stub_url,
+        "NOTIFICATION_SERVICE_URL": stub_url,
+        "ADMISSION_ENABLED": False, # Mede o servidor, não o load shedding
+    }
+
+
+def _seed(database_uri, stub_url, payers=200, merchants=20):
+    app = create_app(_overrides(database_uri, stub_url))
+    with app.app_context():
+        users = [User(full_name=f"Bench {i}", cpf=f"{i:011d}", email=f"bench{i}@example.com", password_hash="pw",
+                      balance=Decimal("1000000.00")) for i in range(payers)]
+        shops = [Merchant(full_name=f"Shop {i}", cnpj=f"{i:014d}", email=f"shop{i}@example.com", password_hash="pw")
+                 for i in range(merchants)]
+        db.session.add_all(users + shops)
+        db.session.commit()
+        return [str(u.id) for u in users], [str(m.id) for m in shops]
+
+
+def _serve(database_uri, stub_url, port, workers, threads):
+    from app.server import run_server
+    sys.argv = [sys.argv[0]] # gunicorn lê sys.argv
+    run_server(create_app(_overrides(database_uri, stub_url)), bind=f"127.0.0.1:{port}", workers=workers, threads=threads)
+
+
+def _wait_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(base_url + '/', timeout=1).ok:
+                return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def _load(base_url, payer_ids, merchant_ids, clients, duration, transfer_ratio):
+    counts = {"ok": 0, "error": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        ok = error = 0
+        while time.monotonic() < deadline:
+            payer = random.choice(payer_ids)
+            if random.random() < transfer_ratio:
+                payload = {"payer_id": payer, "payee_id": random.choice(merchant_ids), "amount": "1.00"}
+                response = session.post(base_url + '/transactions', json=payload)
+            else:
+                response = session.get(f"{base_url}/users/{payer}/balance")
+            if response.status_code < 400:
+                ok += 1
+            else:
+                error += 1
+        with lock:
+            counts["ok"] += ok
+            counts["error"] += error
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--transfer-ratio', type=float, default=0.2)
+    parser.add_argument('--authorizer-latency', type=float, default=0.02)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    stub_url = _start_stub(args.authorizer_latency)
+    payer_ids, merchant_ids = _seed(database_uri, stub_url)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    print(f"{'workers':>7} {'threads':>7} {'req/s':>10} {'errors':>7}")
+    for workers, threads in CONFIGURATIONS:
+        server = multiprocessing.Process(target=_serve, args=(database_uri, stub_url, args.port, workers, threads))
+        server.start()
+        try:
+            _wait_ready(base_url)
+            counts = _load(base_url, payer_ids, merchant_ids, args.clients, args.duration, args.transfer_ratio)
+        finally:
+            server.terminate() # SIGTERM: desligamento gracioso do gunicorn
+            server.join()
+        print(f"{workers:>7} {threads:>7} {counts['ok'] / args.duration:>10.1f} {counts['error']:>7}")
+
+
+if __name__ == '__main__':
+    main()
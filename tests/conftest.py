@@ -30,8 +30,7 @@ def app():
     # Por agora, vamos assumir que create_app pode ser modificada ou já lida com isso.
     # Se create_app não aceita config_override diretamente, teremos que ajustar app.config após a criação.
 
-    _app = create_app()
-    _app.config.update(config_override)
+    _app = create_app(config_override) # create_app aplica os overrides antes de db.init_app
 
     # O db.create_all() em create_app pode ser problemático se não estiver no contexto certo
     # ou se quisermos controle mais fino para testes.
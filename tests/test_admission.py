@@ -0,0 +1,70 @@
+import pytest
+import json
+import threading
+import time
+from app.admission import AdmissionController, get_admission_controller
+
+@pytest.fixture
+def fresh_admission(app):
+    """Garante controladores de admissão novos a cada teste."""
+    app.extensions.pop('admission', None)
+    yield
+    app.extensions.pop('admission', None)
+
+def test_admission_allows_up_to_limit():
+    """Testa que requisições dentro do limite são admitidas imediatamente."""
+    controller = AdmissionController(max_limit=2, max_queue=0, queue_timeout=0.01)
+    assert controller.try_acquire()
+    assert controller.try_acquire()
+    assert not controller.try_acquire() # Fila com tamanho 0: rejeita na hora
+    assert controller.stats()['rejected'] == 1
+
+def test_admission_queue_deadline_expires():
+    """Testa que uma requisição na fila é rejeitada quando o prazo expira."""
+    controller = AdmissionController(max_limit=1, max_queue=4, queue_timeout=0.05)
+    assert controller.try_acquire()
+
+    start = time.monotonic()
+    assert not controller.try_acquire()
+    assert time.monotonic() - start >= 0.05
+
+def test_admission_queued_request_gets_released_slot():
+    """Testa que uma requisição em espera é admitida quando uma vaga é liberada."""
+    controller = AdmissionController(max_limit=1, max_queue=4, queue_timeout=2.0)
+    assert controller.try_acquire()
+
+    result = {}
+    waiter = threading.Thread(target=lambda: result.setdefault('admitted', controller.try_acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    controller.release(0.01)
+    waiter.join(timeout=2.0)
+
+    assert result['admitted'] is True
+    assert controller.stats()['in_flight'] == 1
+
+def test_admission_limit_shrinks_when_latency_grows():
+    """Testa que o limite adaptativo diminui com latência acima do alvo."""
+    controller = AdmissionController(max_limit=10, min_limit=2, target_latency=0.1)
+    for _ in range(30):
+        controller.try_acquire()
+        controller.release(1.0) # Latência muito acima do alvo
+    assert controller.stats()['limit'] == 2 # Nunca abaixo do piso
+
+def test_create_transaction_shed_with_503(app, client, fresh_admission, monkeypatch):
+    """Testa que POST /transactions retorna 503 com Retry-After quando saturada."""
+    monkeypatch.setitem(app.config, 'ADMISSION_MAX_CONCURRENCY', 1)
+    monkeypatch.setitem(app.config, 'ADMISSION_MAX_QUEUE', 0)
+
+    with app.app_context():
+        controller = get_admission_controller('main.create_transaction')
+    assert controller.try_acquire() # Ocupa a única vaga
+
+    payload = {"payer_id": "a", "payee_id": "b", "amount": "1.00"}
+    response = client.post('/transactions', data=json.dumps(payload), content_type='application/json')
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+    assert "overloaded" in response.get_json()['error']
+
+    # Health check não é afetado pelo controle de admissão
+    assert client.get('/').status_code == 200
@@ -0,0 +1,131 @@
+import pytest
+import os
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from app.archive import archive_transactions, iter_archived_transactions, load_index, AccountBloom
+from app.models import User, Merchant, Transaction, TransactionStatus
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+
+@pytest.fixture
+def archive_dir(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'ARCHIVE_DIR', str(tmp_path / "archive"))
+    return tmp_path / "archive"
+
+@pytest.fixture
+def history(db):
+    """Pagador com transações antigas (arquiváveis) e recentes."""
+    payer = User(full_name="Archive Payer", cpf="31231231231", email="archive.payer@example.com", password_hash="pw")
+    merchant = Merchant(full_name="Archive Merchant", cnpj="31231231000199", email="archive.merchant@example.com", password_hash="pw")
+    db.session.add_all([payer, merchant])
+    db.session.commit()
+
+    rows = [
+        (NOW - timedelta(days=90), TransactionStatus.COMPLETED, "10.00"),
+        (NOW - timedelta(days=60), TransactionStatus.FAILED, "20.00"),
+        (NOW - timedelta(days=45), TransactionStatus.PENDING, "30.00"), # Não terminal: permanece
+        (NOW - timedelta(days=2), TransactionStatus.COMPLETED, "40.00"),
+    ]
+    for timestamp, status, amount in rows:
+        db.session.add(Transaction(payer_id=payer.id, payee_id=merchant.id, amount=Decimal(amount), status=status, timestamp=timestamp))
+    db.session.commit()
+    return payer, merchant
+
+def test_archive_moves_only_old_terminal_rows(db, archive_dir, history):
+    """Testa que apenas transações finalizadas anteriores ao corte são arquivadas."""
+    payer, _ = history
+    archived = archive_transactions(NOW - timedelta(days=30), batch_size=1)
+    assert archived == 2
+
+    remaining = sorted(t.amount for t in Transaction.query.all())
+    assert remaining == [Decimal("30.00"), Decimal("40.00")]
+
+    index = load_index(str(archive_dir))
+    assert len(index["segments"]) == 2 # Um segmento por lote
+    assert all(os.path.exists(archive_dir / s["file"]) for s in index["segments"])
+
+    records = list(iter_archived_transactions(payer.id, archive_dir=str(archive_dir)))
+    assert sorted(r["amount"] for r in records) == [Decimal("10.00"), Decimal("20.00")]
+    assert {r["status"] for r in records} == {TransactionStatus.COMPLETED, TransactionStatus.FAILED}
+
+def test_archive_bloom_skips_unrelated_accounts(db, archive_dir, history):
+    """Testa que segmentos sem a conta consultada não são lidos."""
+    archive_transactions(NOW - timedelta(days=30))
+    with patch('app.archive.gzip.open') as mock_open:
+        assert list(iter_archived_transactions(uuid.uuid4(), archive_dir=str(archive_dir))) == []
+    mock_open.assert_not_called()
+
+def test_history_reads_archive_transparently(client, db, archive_dir, history):
+    """Testa que o extrato combina tabela quente e arquivo quando o período alcança o arquivo."""
+    payer, _ = history
+    archive_transactions(NOW - timedelta(days=30))
+
+    response = client.get(f'/users/{payer.id}/transactions')
+    assert response.status_code == 200
+    amounts = [t['amount'] for t in response.get_json()['transactions']]
+    assert amounts == ["40.00", "30.00", "20.00", "10.00"] # Mais recentes primeiro
+
+    response = client.get(f'/users/{payer.id}/transactions?since={(NOW - timedelta(days=70)).isoformat()}&limit=2')
+    amounts = [t['amount'] for t in response.get_json()['transactions']]
+    assert amounts == ["40.00", "30.00"]
+
+def test_recent_history_does_not_touch_archive(client, db, archive_dir, history):
+    """Testa que consultas apenas do período quente não abrem o arquivo."""
+    payer, _ = history
+    archive_transactions(NOW - timedelta(days=30))
+    with patch('app.services.iter_archived_transactions') as mock_iter:
+        response = client.get(f'/users/{payer.id}/transactions?since={(NOW - timedelta(days=7)).isoformat()}')
+    mock_iter.assert_not_called()
+    assert [t['direction'] for t in response.get_json()['transactions']] == ["out"]
+
+def test_history_invalid_params(client, db):
+    """Testa validação dos parâmetros do extrato."""
+    assert client.get('/users/not-a-uuid/transactions').status_code == 400
+    assert client.get(f'/users/{uuid.uuid4()}/transactions?since=ontem').status_code == 400
+
+def test_bloom_filter_membership():
+    """Testa que o filtro de Bloom não tem falsos negativos."""
+    ids = [uuid.uuid4() for _ in range(500)]
+    bloom = AccountBloom.for_count(len(ids))
+    for account_id in ids:
+        bloom.add(account_id)
+    decoded = AccountBloom.decode(bloom.bits, bloom.encode())
+    assert all(account_id in decoded for account_id in ids)
+
+def test_archive_command(runner, db, archive_dir, history):
+    """Testa o comando CLI de arquivamento."""
+    result = runner.invoke(args=['archive-transactions', '--older-than-days', '0'])
+    assert result.exit_code == 0
+    assert "Transações arquivadas: 3" in result.output
+
+def test_full_page_from_hot_table_skips_archive(client, db, archive_dir, history):
+    """Testa que, sem `since`, o arquivo não é aberto quando a tabela quente já preenche o limite."""
+    payer, _ = history
+    archive_transactions(NOW - timedelta(days=30))
+    with patch('app.services.iter_archived_transactions') as mock_iter:
+        response = client.get(f'/users/{payer.id}/transactions?limit=1')
+    mock_iter.assert_not_called()
+    assert [t['amount'] for t in response.get_json()['transactions']] == ["40.00"]
+
+    # A transação pendente antiga fica antes do corte: a página de 2 precisa conferir o arquivo
+    response = client.get(f'/users/{payer.id}/transactions?limit=2')
+    assert [t['amount'] for t in response.get_json()['transactions']] == ["40.00", "30.00"]
+
+def test_archived_transaction_is_served_by_id(client, db, archive_dir, history):
+    """Testa que GET /transactions/<id> encontra transações arquivadas, lendo só o segmento candidato."""
+    payer, _ = history
+    old = Transaction.query.filter_by(amount=Decimal("10.00")).one()
+    old_id = old.id
+    archive_transactions(NOW - timedelta(days=30), batch_size=1)
+    assert db.session.get(Transaction, old_id) is None
+
+    response = client.get(f'/transactions/{old_id}')
+    assert response.status_code == 200
+    assert response.get_json()['amount'] == "10.00"
+    assert response.headers['Cache-Control'].startswith("private")
+
+    with patch('app.archive.gzip.open') as mock_open:
+        assert client.get(f'/transactions/{uuid.uuid4()}').status_code == 404
+    mock_open.assert_not_called() # Filtro de ids descarta os dois segmentos
@@ -0,0 +1,127 @@
+import pytest
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from app.models import User, Merchant, Transaction, TransactionStatus, FundsHold
+from app.async_transfers import TransferWorkerPool, finalize_transfer, sweep_expired_holds
+from app.reconciliation import reconcile_balances
+
+@pytest.fixture
+def async_mode(app, monkeypatch):
+    """Modo assíncrono com um pool não iniciado: os testes executam os workers manualmente."""
+    pool = TransferWorkerPool(app, workers=1, queue_size=2)
+    monkeypatch.setitem(app.config, 'ASYNC_TRANSFERS_ENABLED', True)
+    monkeypatch.setitem(app.extensions, 'transfer_workers', pool)
+    return pool
+
+@pytest.fixture
+def accounts(db):
+    funder = User(full_name="Async Funder", cpf="14214214215", email="async.funder@example.com", password_hash="pw", balance=Decimal("-100.00"))
+    payer = User(full_name="Async Payer", cpf="14214214214", email="async.payer@example.com", password_hash="pw", balance=Decimal("100.00"))
+    shop = Merchant(full_name="Async Shop", cnpj="14214214000101", email="async.shop@example.com", password_hash="pw")
+    db.session.add_all([funder, payer, shop])
+    db.session.commit()
+    # Saldo inicial lastreado por uma transação, para a conciliação fechar
+    db.session.add(Transaction(payer_id=funder.id, payee_id=payer.id, amount=Decimal("100.00"), status=TransactionStatus.COMPLETED))
+    db.session.commit()
+    return payer, shop
+
+def _post(client, payer, shop, amount):
+    payload = {"payer_id": str(payer.id), "payee_id": str(shop.id), "amount": amount}
+    return client.post('/transactions', data=json.dumps(payload), content_type='application/json')
+
+@patch('app.services.send_notification_external', return_value=True)
+@patch('app.services.authorize_transaction_external')
+def test_accepts_without_calling_authorizer_then_worker_completes(mock_authorize, mock_notify, client, db, accounts, async_mode):
+    """Testa o 202 com reserva do saldo e a finalização pelo worker."""
+    payer, shop = accounts
+    mock_authorize.return_value = True
+
+    response = _post(client, payer, shop, "30.00")
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body["status"] == TransactionStatus.PENDING.value
+    assert response.headers["Location"] == body["status_url"]
+    mock_authorize.assert_not_called()
+    assert db.session.get(User, payer.id).balance == Decimal("70.00") # Reservado
+    assert reconcile_balances()["discrepancies"] == 0 # Reservas entram na conciliação
+
+    assert finalize_transfer(async_mode._queue.get_nowait()) == TransactionStatus.COMPLETED
+    db.session.expire_all()
+    assert db.session.get(Merchant, shop.id).balance == Decimal("30.00")
+    assert FundsHold.query.count() == 0
+    assert client.get(body["status_url"]).get_json()["status"] == TransactionStatus.COMPLETED.value
+    mock_notify.assert_called_once_with(shop.id, Decimal("30.00"))
+    assert reconcile_balances()["discrepancies"] == 0
+
+@patch('app.services.authorize_transaction_external', return_value=False)
+def test_denied_transfer_releases_reservation(mock_authorize, client, db, accounts, async_mode):
+    """Testa que a recusa do autorizador devolve a reserva."""
+    payer, shop = accounts
+    _post(client, payer, shop, "40.00")
+    assert finalize_transfer(async_mode._queue.get_nowait()) == TransactionStatus.FAILED
+    db.session.expire_all()
+    assert db.session.get(User, payer.id).balance == Decimal("100.00")
+    assert Transaction.query.filter_by(payee_id=shop.id).one().status == TransactionStatus.FAILED
+
+def test_reservations_cannot_overspend(client, db, accounts, async_mode):
+    """Testa que reservas pendentes contam para o saldo disponível."""
+    payer, shop = accounts
+    assert _post(client, payer, shop, "60.00").status_code == 202
+    response = _post(client, payer, shop, "60.00")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Insufficient balance."
+
+def test_full_queue_rejects_before_reserving(client, db, accounts, async_mode):
+    """Testa o 503 quando a fila dos workers está cheia."""
+    payer, shop = accounts
+    for _ in range(2):
+        assert _post(client, payer, shop, "1.00").status_code == 202
+    assert _post(client, payer, shop, "1.00").status_code == 503
+    assert db.session.get(User, payer.id).balance == Decimal("98.00")
+
+def test_sweeper_fails_expired_holds(client, db, accounts, async_mode):
+    """Testa que o sweeper libera reservas expiradas e o worker não finaliza depois."""
+    payer, shop = accounts
+    _post(client, payer, shop, "25.00")
+    assert sweep_expired_holds(now=datetime.utcnow() + timedelta(hours=1)) == 1
+    db.session.expire_all()
+    assert db.session.get(User, payer.id).balance == Decimal("100.00")
+    with patch('app.services.authorize_transaction_external') as mock_authorize:
+        assert finalize_transfer(async_mode._queue.get_nowait()) is None
+        mock_authorize.assert_not_called()
+
+def test_get_transaction_errors(client, db):
+    """Testa ID inválido e transação inexistente na rota de status."""
+    assert client.get('/transactions/abc').status_code == 400
+    assert client.get('/transactions/00000000-0000-0000-0000-000000000000').status_code == 404
+
+@patch('app.services.send_notification_external', return_value=True)
+def test_hold_during_sync_transfer_is_not_overwritten(mock_notify, app, db, accounts, async_mode):
+    """Testa que uma reserva feita em paralelo a uma transferência síncrona do mesmo pagador é preservada."""
+    import threading
+    from app.async_transfers import accept_transfer
+    from app.services import execute_transfer
+
+    payer, shop = accounts
+    payer_id, shop_id = payer.id, shop.id
+
+    def authorize_while_reserving(*args, **kwargs):
+        # A reserva roda em outra thread (outra sessão) entre a leitura e a escrita do saldo
+        def reserve():
+            with app.app_context():
+                accept_transfer(payer_id, shop_id, Decimal("50.00"))
+        worker = threading.Thread(target=reserve)
+        worker.start()
+        worker.join()
+        return True
+
+    with patch('app.services.authorize_transaction_external', side_effect=authorize_while_reserving):
+        _, status_code = execute_transfer(payer_id, shop_id, Decimal("30.00"))
+    assert status_code == 200
+
+    db.session.expire_all()
+    assert db.session.get(User, payer_id).balance == Decimal("20.00") # 100 - 30 - 50 reservados
+    assert FundsHold.query.count() == 1
+    assert reconcile_balances()["discrepancies"] == 0
@@ -0,0 +1,123 @@
+import pytest
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.authorization import AuthorizationDispatcher, HttpAuthorizer
+
+class StubAuthorizerHandler(BaseHTTPRequestHandler):
+    """Autorizador local: GET autoriza uma transferência, POST /batch autoriza um lote."""
+
+    def do_GET(self):
+        self.server.calls.append(('single', 1))
+        self._reply({"message": "Autorizado"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        authorizations = body["authorizations"]
+        self.server.calls.append(('batch', len(authorizations)))
+        # Nega transferências acima de 1000 para verificar o roteamento dos resultados
+        results = [{"message": "Autorizado" if float(a["amount"]) <= 1000 else "Negado"} for a in authorizations]
+        self._reply({"results": results})
+
+    def _reply(self, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_authorizer():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubAuthorizerHandler)
+    server.calls = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _authorize_concurrently(dispatcher, amounts):
+    with ThreadPoolExecutor(max_workers=len(amounts)) as pool:
+        futures = [pool.submit(dispatcher.authorize, {"payer_id": "p", "payee_id": "q", "amount": a}, 5.0) for a in amounts]
+        return [f.result() for f in futures]
+
+def test_dispatcher_coalesces_into_batches(stub_authorizer):
+    """Testa que pedidos concorrentes viram poucas chamadas em lote com resultados corretos."""
+    base_url = f"http://127.0.0.1:{stub_authorizer.server_port}"
+    authorizer = HttpAuthorizer(base_url + "/authorize", batch_url=base_url + "/batch")
+    dispatcher = AuthorizationDispatcher(authorizer, max_batch_size=50, max_wait=0.05)
+
+    amounts = ["10.00"] * 19 + ["5000.00"]
+    results = _authorize_concurrently(dispatcher, amounts)
+
+    assert results == [True] * 19 + [False] # Cada chamador recebe o próprio resultado
+    batch_calls = [size for kind, size in stub_authorizer.calls if kind == 'batch']
+    assert sum(batch_calls) == 20
+    assert len(batch_calls) < 20 # Tráfego ao autorizador não é mais 1:1
+    assert not [c for c in stub_authorizer.calls if c[0] == 'single']
+
+def test_dispatcher_respects_max_batch_size(stub_authorizer):
+    """Testa que nenhum lote excede o tamanho máximo configurado."""
+    base_url = f"http://127.0.0.1:{stub_authorizer.server_port}"
+    authorizer = HttpAuthorizer(base_url + "/authorize", batch_url=base_url + "/batch")
+    dispatcher = AuthorizationDispatcher(authorizer, max_batch_size=4, max_wait=0.05)
+
+    assert all(_authorize_concurrently(dispatcher, ["1.00"] * 12))
+    assert max(size for _, size in stub_authorizer.calls) <= 4
+
+def test_dispatcher_falls_back_to_pipelined_calls(stub_authorizer):
+    """Testa o fallback para chamadas individuais concorrentes sem suporte a lote."""
+    authorizer = HttpAuthorizer(f"http://127.0.0.1:{stub_authorizer.server_port}/authorize")
+    dispatcher = AuthorizationDispatcher(authorizer, max_batch_size=8, max_wait=0.01)
+
+    assert all(_authorize_concurrently(dispatcher, ["1.00"] * 6))
+    assert stub_authorizer.calls == [('single', 1)] * 6
+
+def test_dispatcher_fails_safe_when_authorizer_down():
+    """Testa que falhas de rede resultam em 'não autorizado'."""
+    authorizer = HttpAuthorizer("http://127.0.0.1:9/authorize", batch_url="http://127.0.0.1:9/batch", timeout=0.5)
+    dispatcher = AuthorizationDispatcher(authorizer, max_wait=0.001)
+    assert dispatcher.authorize({"payer_id": "p", "payee_id": "q", "amount": "1.00"}, timeout=5.0) is False
+
+class _SlowBatchAuthorizer:
+    """Autorizador falso com lote lento, contando chamadas simultâneas."""
+    supports_batch = True
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def authorize_batch(self, payloads):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.latency)
+        with self.lock:
+            self.active -= 1
+        return [True] * len(payloads)
+
+def test_dispatcher_keeps_several_batches_in_flight():
+    """Testa que lotes lentos não ficam enfileirados atrás de uma única chamada."""
+    authorizer = _SlowBatchAuthorizer(0.2)
+    dispatcher = AuthorizationDispatcher(authorizer, max_batch_size=2, max_wait=0.01, max_in_flight=4)
+    started = time.monotonic()
+    assert all(_authorize_concurrently(dispatcher, ["1.00"] * 8))
+    assert authorizer.peak > 1
+    assert time.monotonic() - started < 0.6 # Um lote por vez levaria ~0.8s
+    dispatcher.stop()
+
+def test_dispatcher_stop_rejects_new_requests():
+    """Testa que stop() encerra as threads e novos pedidos viram 'não autorizado'."""
+    dispatcher = AuthorizationDispatcher(_SlowBatchAuthorizer(0.0), max_wait=0.001)
+    assert dispatcher.authorize({"amount": "1.00"}, timeout=5.0) is True
+    dispatcher.stop()
+    assert not dispatcher._thread.is_alive()
+    assert dispatcher.authorize({"amount": "1.00"}, timeout=5.0) is False
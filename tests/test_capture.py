@@ -0,0 +1,116 @@
+import pytest
+import json
+from unittest.mock import patch
+from app import create_app, db as _db
+from app.capture import CaptureWriter, iter_capture, list_segments, sanitize
+from app.replay import local_instance, replay_capture, summarize, compare_results, write_results, read_results, unknown_ids
+
+@pytest.fixture
+def capturing_app(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'captured.db'}",
+        "CAPTURE_ENABLED": True,
+        "CAPTURE_DIR": str(tmp_path / "captures"),
+        "CAPTURE_SALT": "test-salt",
+    })
+    yield app
+    with app.app_context():
+        _db.session.remove()
+
+def _capture_session(app):
+    client = app.test_client()
+    payer = client.post('/users', json={"full_name": "Ana Souza", "email": "ana@example.com", "password": "s3cret",
+                                        "document": "12345678901", "user_type": "common"}).get_json()
+    shop = client.post('/users', json={"full_name": "Loja", "email": "loja@example.com", "password": "s3cret",
+                                       "document": "12345678000199", "user_type": "merchant"}).get_json()
+    client.post('/users', json={"full_name": "Ana Dup", "email": "other@example.com", "password": "x",
+                                "document": "12345678901", "user_type": "common"}) # 409: CPF repetido
+    client.post('/transactions', json={"payer_id": payer["id"], "payee_id": shop["id"], "amount": "10.00"})
+    client.get(f"/users/{payer['id']}/balance")
+    client.get('/') # Rota fora de CAPTURE_ENDPOINTS
+    app.extensions['capture_writer'].close()
+    return payer, shop
+
+def test_capture_is_sanitized(capturing_app, tmp_path):
+    """Testa que a captura grava só as rotas configuradas, sem senha, documento, e-mail ou nome reais."""
+    payer, _ = _capture_session(capturing_app)
+    records = list(iter_capture(str(tmp_path / "captures")))
+    assert [r["endpoint"] for r in records] == ['main.create_user'] * 3 + ['main.create_transaction', 'main.get_user_balance']
+
+    raw = "".join(json.dumps(r) for r in records)
+    for secret in ("s3cret", "12345678901", "ana@example.com", "Ana Souza"):
+        assert secret not in raw
+
+    first, duplicate = records[0], records[2]
+    assert first["body"]["password"] == "[redacted]"
+    assert len(first["body"]["document"]) == 11 and first["body"]["document"].isdigit()
+    assert first["body"]["document"] == duplicate["body"]["document"] == first["response"]["cpf"] # Pseudônimo estável
+    assert duplicate["status"] == 409
+    assert first["response"]["id"] == payer["id"] # Ids ficam: o replay os remapeia
+    assert records[-1]["path"] == f"/users/{payer['id']}/balance"
+
+def test_capture_rotation_keeps_newest_segments(tmp_path):
+    """Testa a rotação por tamanho e o limite de segmentos mantidos."""
+    writer = CaptureWriter(str(tmp_path), max_file_bytes=1, max_files=3, flush_records=1)
+    for i in range(5):
+        writer.write({"t": i, "endpoint": "main.home", "path": "/"})
+    writer.close()
+    segments = list_segments(str(tmp_path))
+    assert len(segments) == 3
+    assert [r["t"] for r in iter_capture(str(tmp_path))] == [2, 3, 4]
+
+def test_sanitize_drops_error_details():
+    """Testa que detalhes de exceção (podem conter SQL com valores) não são gravados."""
+    assert sanitize({"error": "x", "details": "INSERT ... 'ana@example.com'"}, b"k") == {"error": "x"}
+    assert sanitize({"document": "12.345"}, b"k") == {"document": "[redacted]"}
+
+def test_replay_reproduces_outcomes_and_compares(capturing_app, tmp_path):
+    """Testa o replay em instância local com ids remapeados e a comparação entre dois replays."""
+    _capture_session(capturing_app)
+    records = list(iter_capture(str(tmp_path / "captures")))
+
+    with local_instance() as base_url:
+        baseline = replay_capture(records, base_url, speed=0, clients=8) # Mesmo CPF/pagador: enviados na ordem capturada
+    # Contas recriadas: CPF repetido continua 409, transferência e saldo acham o pagador (ids remapeados)
+    assert [(r["status"], r["outcome"]) for r in baseline] == [(r["captured_status"], r["captured_outcome"]) for r in baseline]
+    assert baseline[3]["outcome"] == "Insufficient balance."
+    summary = summarize(baseline)
+    assert summary['main.create_user']["count"] == 3
+    assert all(row["mismatches"] == 0 for row in summary.values())
+
+    write_results(str(tmp_path / "a.ndjson.gz"), baseline)
+    candidate = read_results(str(tmp_path / "a.ndjson.gz"))
+    candidate[4] = dict(candidate[4], status=404, outcome="User not found")
+    comparison = compare_results(baseline, candidate)
+    assert [d["seq"] for d in comparison["differences"]] == [4]
+    assert comparison["endpoints"]['main.get_user_balance']["p95_delta_ms"] is not None
+
+def test_replay_traffic_command(capturing_app, runner, tmp_path):
+    """Testa os comandos replay-traffic e compare-replays."""
+    _capture_session(capturing_app)
+    output = tmp_path / "replay.ndjson.gz"
+    result = runner.invoke(args=['replay-traffic', str(tmp_path / "captures"), '--speed', '0', '--output', str(output)])
+    assert result.exit_code == 0, result.output
+    assert "5 requisições capturadas" in result.output
+    result = runner.invoke(args=['compare-replays', str(output), str(output)])
+    assert result.exit_code == 0
+    assert "Resultados divergentes: 0" in result.output
+
+def test_replay_on_empty_database_rejects_pre_existing_ids(capturing_app, runner, tmp_path):
+    """Testa que o replay local sem snapshot recusa capturas que usam contas anteriores à captura."""
+    payer, _ = _capture_session(capturing_app)
+    records = list(iter_capture(str(tmp_path / "captures")))
+    assert unknown_ids(records) == set()
+
+    # Captura parcial: a transferência usa contas criadas antes dela
+    partial = tmp_path / "partial"
+    writer = CaptureWriter(str(partial))
+    for record in records[3:]:
+        writer.write(record)
+    writer.close()
+    assert payer["id"] in unknown_ids(records[3:])
+
+    result = runner.invoke(args=['replay-traffic', str(partial), '--speed', '0'])
+    assert result.exit_code != 0
+    assert "--database-uri" in result.output
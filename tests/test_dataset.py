@@ -0,0 +1,58 @@
+import pytest
+from collections import Counter
+from app.models import User, Merchant, Transaction, TransactionStatus
+from app.dataset import DatasetSpec, generate_dataset
+from app.reconciliation import reconcile_balances
+
+def _snapshot(db):
+    return sorted((str(t.id), str(t.payer_id), str(t.payee_id), t.amount, t.status.value, t.timestamp) for t in Transaction.query.all())
+
+def test_dataset_is_deterministic_and_reconciles(db):
+    """Testa que a mesma semente gera os mesmos dados e que os saldos fecham."""
+    spec = DatasetSpec(users=50, merchants=10, transactions=2_000, seed=7, batch_size=300)
+    summary = generate_dataset(spec)
+    assert summary["transactions"] == 2_000
+    assert User.query.count() == 51 # + conta de funding
+    assert Merchant.query.count() == 10
+    assert Transaction.query.count() == 2_050 # + depósitos iniciais
+    assert reconcile_balances()["discrepancies"] == 0
+    assert User.query.filter(User.balance < 0).count() == 1 # Só a conta de funding fica negativa
+    first = _snapshot(db)
+
+    db.drop_all()
+    db.create_all()
+    generate_dataset(DatasetSpec(users=50, merchants=10, transactions=2_000, seed=7, batch_size=300))
+    assert _snapshot(db) == first
+
+def test_dataset_distributions(db):
+    """Testa a concentração Zipf nos lojistas e a mistura de status."""
+    generate_dataset(DatasetSpec(users=100, merchants=50, transactions=5_000, seed=1))
+    merchant_ids = {m.id for m in Merchant.query.all()}
+    payees = Counter(t.payee_id for t in Transaction.query.all() if t.payee_id in merchant_ids)
+    top = payees.most_common(1)[0][1]
+    assert top > 0.3 * sum(payees.values()) # O lojista mais quente concentra boa parte do volume
+
+    statuses = Counter(t.status for t in Transaction.query.filter(Transaction.timestamp >= '2023-10-01'))
+    assert statuses[TransactionStatus.COMPLETED] > statuses[TransactionStatus.FAILED] > statuses[TransactionStatus.CANCELLED] > 0
+
+def test_generate_dataset_command(runner, db):
+    """Testa o comando CLI."""
+    result = runner.invoke(args=['generate-dataset', '--users', '20', '--merchants', '5', '--transactions', '100'])
+    assert result.exit_code == 0
+    assert "Gerados 20 usuários, 5 lojistas e 100 transações" in result.output
+
+def test_funding_is_split_to_fit_balance_column(db, monkeypatch):
+    """Testa que os depósitos iniciais são divididos entre várias contas de funding dentro do limite do saldo."""
+    monkeypatch.setattr('app.dataset.MAX_BALANCE_CENTS', 20_000_00)
+    summary = generate_dataset(DatasetSpec(users=50, merchants=10, transactions=500, seed=3))
+    funding = User.query.filter(User.full_name.like("Dataset Funding%")).all()
+    assert summary["funding_accounts"] == len(funding) > 1
+    assert all(-user.balance <= 20_000 for user in funding)
+    assert reconcile_balances()["discrepancies"] == 0
+
+def test_dataset_rejects_seeds_outside_document_space(runner, db):
+    """Testa que sementes fora de 0-99 são recusadas (colidiriam nos documentos gerados)."""
+    with pytest.raises(ValueError):
+        DatasetSpec(users=10, merchants=1, transactions=10, seed=107)
+    result = runner.invoke(args=['generate-dataset', '--users', '5', '--seed', '-1'])
+    assert result.exit_code != 0
@@ -0,0 +1,101 @@
+import pytest
+import json
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import patch
+from app.models import User, Transaction, TransactionStatus, AccountDailyRollup
+from app.failure_writer import FailedAttemptWriter
+
+@pytest.fixture
+def writer(app, tmp_path):
+    return FailedAttemptWriter(app, str(tmp_path / "failed.ndjson"), max_buffer=3, batch_size=2)
+
+@pytest.fixture
+def accounts(db):
+    payer = User(full_name="Fail Payer", cpf="91291291291", email="fail.payer@example.com", password_hash="pw", balance=Decimal("100.00"))
+    payee = User(full_name="Fail Payee", cpf="91291291292", email="fail.payee@example.com", password_hash="pw")
+    db.session.add_all([payer, payee])
+    db.session.commit()
+    return payer, payee
+
+@patch('app.services.authorize_transaction_external', return_value=False)
+def test_denied_transfer_is_buffered_then_bulk_written(mock_authorize, app, client, db, accounts, writer, monkeypatch):
+    """Testa que a recusa não grava na requisição e o flush grava registro e rollups."""
+    payer, payee = accounts
+    monkeypatch.setitem(app.config, 'FAILED_WRITER_ENABLED', True)
+    monkeypatch.setitem(app.extensions, 'failed_attempt_writer', writer)
+
+    payload = {"payer_id": str(payer.id), "payee_id": str(payee.id), "amount": "5.00"}
+    for _ in range(3):
+        response = client.post('/transactions', data=json.dumps(payload), content_type='application/json')
+        assert response.status_code == 403
+    assert Transaction.query.count() == 0
+
+    assert writer.flush() is True
+    assert Transaction.query.filter_by(status=TransactionStatus.FAILED).count() == 3
+    rollup = db.session.get(AccountDailyRollup, (payer.id, datetime.utcnow().date()))
+    assert (rollup.tx_count, rollup.failed_count) == (3, 3)
+
+def test_database_outage_spills_and_replays(db, accounts, writer):
+    """Testa o spill em arquivo com o banco fora e o replay quando ele volta."""
+    payer, payee = accounts
+    writer.record(payer.id, payee.id, Decimal("1.00"))
+    writer.record(payer.id, payee.id, Decimal("2.00"))
+
+    with patch.object(writer, '_write', side_effect=RuntimeError("database is down")):
+        assert writer.flush() is False
+    assert writer.spilled == 2
+
+    # Durante o backoff nada vai ao banco: novos registros vão direto para o arquivo
+    writer.record(payer.id, payee.id, Decimal("3.00"))
+    with patch.object(writer, '_write') as mock_write:
+        assert writer.flush() is False
+        mock_write.assert_not_called()
+
+    writer._retry_at = 0.0
+    assert writer.flush() is True
+    amounts = sorted(t.amount for t in Transaction.query.all())
+    assert amounts == [Decimal("1.00"), Decimal("2.00"), Decimal("3.00")]
+
+def test_full_buffer_spills_instead_of_dropping(db, accounts, writer):
+    """Testa que o buffer limitado transborda para o disco sem perder registros."""
+    payer, payee = accounts
+    for _ in range(5):
+        writer.record(payer.id, payee.id, Decimal("1.00"))
+    assert len(writer._buffer) == 3
+    assert writer.spilled == 2
+
+    writer.flush()
+    assert Transaction.query.count() == 5
+
+def test_interrupted_replay_skips_rows_already_written(db, accounts, writer):
+    """Testa que um replay interrompido não duplica registros."""
+    payer, payee = accounts
+    writer.record(payer.id, payee.id, Decimal("1.00"))
+    writer._spill(writer._drain_all())
+    with open(writer.spill_path) as f:
+        line = f.read()
+    with open(writer.spill_path + '.replaying', 'w') as f:
+        f.write(line) # Replay anterior gravou o registro, mas não removeu o arquivo
+    writer.flush()
+    writer.flush()
+    assert Transaction.query.count() == 1
+
+def test_spill_file_is_per_process_and_orphans_are_adopted(db, accounts, writer, tmp_path):
+    """Testa um arquivo de spill por processo e o replay de arquivos deixados por processos encerrados."""
+    import os
+    payer, payee = accounts
+    assert writer.spill_path == str(tmp_path / f"failed.{os.getpid()}.ndjson")
+
+    # Outro writer (outro pid) gravou um registro antes de morrer; um pid vivo não é tocado
+    other = FailedAttemptWriter(writer.app, str(tmp_path / "failed.ndjson"))
+    other.record(payer.id, payee.id, Decimal("4.00"))
+    other._spill(other._drain_all())
+    dead_pid, live_pid = 2 ** 22 + 1, os.getppid()
+    os.replace(other.spill_path, tmp_path / f"failed.{dead_pid}.ndjson")
+    (tmp_path / f"failed.{live_pid}.ndjson").write_text("")
+
+    with patch('app.failure_writer._process_alive', side_effect=lambda pid: pid == live_pid):
+        assert writer.flush() is True
+    assert [t.amount for t in Transaction.query.all()] == [Decimal("4.00")]
+    assert sorted(os.listdir(tmp_path)) == [f"failed.{live_pid}.ndjson"]
@@ -0,0 +1,100 @@
+import pytest
+import json
+import uuid
+from datetime import datetime, timedelta
+from app.models import User, Merchant, UserType, AccountIdentity
+from app.dataset import DatasetSpec, generate_dataset
+
+def _signup(client, document, email, user_type="common"):
+    payload = {"full_name": "Identity", "document": document, "email": email, "password": "pw", "user_type": user_type}
+    return client.post('/users', data=json.dumps(payload), content_type='application/json')
+
+ADMIN = {"X-Admin-Token": "admin-secret"}
+
+@pytest.fixture
+def lookup_token(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'ACCOUNT_LOOKUP_TOKEN', ADMIN["X-Admin-Token"])
+
+def test_signup_is_unique_across_users_and_merchants(client, db):
+    """Testa que o e-mail de um lojista não pode ser reutilizado por um usuário comum (e vice-versa)."""
+    assert _signup(client, "12312312000199", "Shop@Example.com", "merchant").status_code == 201
+    response = _signup(client, "12312312312", "  shop@example.COM ")
+    assert response.status_code == 409
+    assert "CPF or Email already exists" in response.get_json()["error"]
+    assert User.query.count() == 0
+
+    assert _signup(client, "12312312312", "person@example.com").status_code == 201
+    assert _signup(client, "99999999000199", "PERSON@example.com", "merchant").status_code == 409
+    assert AccountIdentity.query.count() == 4
+
+def test_lookup_by_document_and_email(client, db, lookup_token):
+    """Testa GET /accounts/lookup por documento, e-mail e ambos."""
+    merchant_id = _signup(client, "45645645000199", "lookup.shop@example.com", "merchant").get_json()["id"]
+    user_id = _signup(client, "45645645645", "lookup.user@example.com").get_json()["id"]
+
+    data = client.get('/accounts/lookup?document=45645645000199', headers=ADMIN).get_json()
+    assert data == {"accounts": [{"account_id": merchant_id, "account_type": "merchant", "matched_by": ["document"]}]}
+
+    data = client.get('/accounts/lookup?document=45645645645&email=Lookup.User@example.com', headers=ADMIN).get_json()
+    assert data["accounts"] == [{"account_id": user_id, "account_type": "common", "matched_by": ["document", "email"]}]
+
+    data = client.get('/accounts/lookup?document=45645645645&email=lookup.shop@example.com', headers=ADMIN).get_json()
+    assert {a["account_id"] for a in data["accounts"]} == {user_id, merchant_id}
+
+    assert client.get('/accounts/lookup?email=nobody@example.com', headers=ADMIN).status_code == 404
+    assert client.get('/accounts/lookup', headers=ADMIN).status_code == 400
+
+def test_backfill_identities_command(runner, db):
+    """Testa o preenchimento do índice para contas antigas, idempotente e com conflitos reportados."""
+    user = User(full_name="Old User", cpf="78978978978", email="old@example.com", password_hash="pw")
+    shop = Merchant(full_name="Old Shop", cnpj="78978978000199", email="OLD@example.com", password_hash="pw")
+    other = Merchant(full_name="Other Shop", cnpj="78978978000100", email="other@example.com", password_hash="pw")
+    db.session.add_all([user, shop, other])
+    db.session.commit()
+
+    result = runner.invoke(args=['backfill-identities', '--batch-size', '1'])
+    assert result.exit_code == 0
+    assert "Identidades criadas: 5" in result.output # E-mail repetido fica de fora
+    assert "Conflito email old@example.com" in result.output
+    assert db.session.get(AccountIdentity, ("document", "78978978978")).account_id == user.id
+
+    result = runner.invoke(args=['backfill-identities'])
+    assert "Identidades criadas: 0" in result.output
+
+def test_generated_dataset_has_identities(client, db, lookup_token):
+    """Testa que o gerador de dados também popula o índice de identidade."""
+    generate_dataset(DatasetSpec(users=5, merchants=2, transactions=10, seed=3))
+    assert AccountIdentity.query.count() == 2 * (5 + 1 + 2) # + conta de funding
+    assert client.get('/accounts/lookup?email=merchant1.s3@dataset.example', headers=ADMIN).status_code == 200
+
+def test_lookup_requires_admin_token(client, db, app, monkeypatch):
+    """Testa que o lookup fica desligado sem token e recusa chamadas sem o token certo."""
+    _signup(client, "32132132132", "enum@example.com")
+    assert client.get('/accounts/lookup?email=enum@example.com').status_code == 404
+
+    monkeypatch.setitem(app.config, 'ACCOUNT_LOOKUP_TOKEN', ADMIN["X-Admin-Token"])
+    assert client.get('/accounts/lookup?email=enum@example.com').status_code == 403
+    assert client.get('/accounts/lookup?email=enum@example.com', headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get('/accounts/lookup?email=enum@example.com', headers=ADMIN).status_code == 200
+
+def test_backfill_removes_orphan_identities(runner, db):
+    """Testa que identidades sem conta (cadastro que falhou após reservar) são removidas após a carência."""
+    user = User(full_name="Kept", cpf="65465465465", email="kept@example.com", password_hash="pw")
+    db.session.add(user)
+    db.session.commit()
+    old = datetime.utcnow() - timedelta(hours=1)
+    missing_old, missing_new = uuid.uuid4(), uuid.uuid4()
+    db.session.add_all([
+        AccountIdentity(kind="document", value="11122233344", account_id=missing_old, account_type=UserType.COMMON, created_at=old),
+        AccountIdentity(kind="email", value="ghost@example.com", account_id=missing_old, account_type=UserType.COMMON, created_at=old),
+        AccountIdentity(kind="email", value="inflight@example.com", account_id=missing_new, account_type=UserType.COMMON),
+    ])
+    db.session.commit()
+
+    result = runner.invoke(args=['backfill-identities', '--batch-size', '1'])
+    assert result.exit_code == 0
+    assert "Identidades órfãs removidas: 2" in result.output
+    assert "Identidades criadas: 2" in result.output
+    assert db.session.get(AccountIdentity, ("email", "ghost@example.com")) is None
+    assert db.session.get(AccountIdentity, ("email", "inflight@example.com")) is not None # Cadastro pode estar em andamento
+    assert db.session.get(AccountIdentity, ("email", "kept@example.com")).account_id == user.id
@@ -0,0 +1,43 @@
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from app import create_app
+from app.json_provider import OrjsonProvider, StdlibJSONProvider
+from app.models import TransactionStatus
+
+PAYLOAD = {
+    "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+    "amount": Decimal("10.50"),
+    "status": TransactionStatus.COMPLETED,
+    "timestamp": datetime(2024, 1, 2, 3, 4, 5),
+}
+EXPECTED = {
+    "id": "12345678-1234-5678-1234-567812345678",
+    "amount": "10.50",
+    "status": "completed",
+    "timestamp": "2024-01-02T03:04:05",
+}
+
+def test_orjson_provider_is_default(app):
+    """Testa que o app usa o provider orjson e serializa tipos do domínio nativamente."""
+    assert isinstance(app.json, OrjsonProvider)
+    assert app.json.loads(app.json.dumps(PAYLOAD)) == EXPECTED
+
+def test_stdlib_fallback_matches_orjson_output(app):
+    """Testa que o fallback sem orjson produz o mesmo JSON."""
+    fallback = StdlibJSONProvider(app)
+    assert fallback.loads(fallback.dumps(PAYLOAD)) == EXPECTED
+
+def test_fast_provider_can_be_disabled():
+    """Testa a configuração JSON_FAST_PROVIDER=False."""
+    app = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:", "JSON_FAST_PROVIDER": False})
+    assert isinstance(app.json, StdlibJSONProvider)
+
+def test_jsonify_and_get_json_round_trip(app):
+    """Testa jsonify e request.get_json passando pelo provider."""
+    with app.test_request_context('/', method='POST', data='{"amount": "1.00", "n": 2}', content_type='application/json'):
+        from flask import jsonify, request
+        assert request.get_json() == {"amount": "1.00", "n": 2}
+        response = jsonify(PAYLOAD)
+        assert response.mimetype == "application/json"
+        assert response.get_json() == EXPECTED
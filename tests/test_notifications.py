@@ -0,0 +1,119 @@
+import pytest
+import json
+import time
+import uuid
+from decimal import Decimal
+from unittest.mock import patch
+from app.models import User, Merchant
+from app.notifications import NotificationAggregator
+
+@pytest.fixture
+def sent():
+    """Registra os envios (avulsos e digests) na ordem em que saem."""
+    calls = []
+    single = lambda payee_id, amount: calls.append(('single', payee_id, amount)) or True
+    digest = lambda payee_id, count, total, ids: calls.append(('digest', payee_id, count, total, list(ids))) or True
+    with patch('app.services.send_notification_external', side_effect=single), \
+         patch('app.services.send_notification_digest_external', side_effect=digest):
+        yield calls
+
+def test_hot_payee_is_coalesced_and_cold_payee_is_immediate(app, sent):
+    """Testa que o recebedor quente recebe um digest e o de baixo volume, envio imediato."""
+    aggregator = NotificationAggregator(app, window=0.2, lanes=2)
+    aggregator.start()
+    hot, cold = uuid.uuid4(), uuid.uuid4()
+    ids = [uuid.uuid4() for _ in range(100)]
+    for transaction_id in ids:
+        aggregator.submit(hot, Decimal("1.50"), transaction_id)
+    aggregator.submit(cold, Decimal("9.00"), uuid.uuid4())
+    time.sleep(0.1)
+    assert ('single', cold, Decimal("9.00")) in sent # Sem esperar a janela
+    time.sleep(0.3)
+
+    hot_calls = [call for call in sent if call[1] == hot]
+    assert hot_calls == [('single', hot, Decimal("1.50")), ('digest', hot, 99, Decimal("148.50"), ids[1:])]
+    assert aggregator.payee_counters(hot) == {
+        "events": 100, "immediate_sends": 1, "digests_sent": 1, "coalesced_events": 99, "failed_sends": 0,
+    }
+    stats = aggregator.stats()
+    assert stats["events"] == 101 and stats["outbound_calls"] == 3
+    assert stats["top_payees"][0]["payee_id"] == hot
+    aggregator.stop()
+
+def test_max_batch_and_stop_flush_in_order(app, sent):
+    """Testa o digest por contagem e que stop() envia o que restou, preservando a ordem por recebedor."""
+    aggregator = NotificationAggregator(app, window=60, max_batch=10, lanes=3)
+    aggregator.start()
+    payee = uuid.uuid4()
+    ids = [uuid.uuid4() for _ in range(26)]
+    for transaction_id in ids:
+        aggregator.submit(payee, Decimal("1.00"), transaction_id)
+    aggregator.stop()
+
+    assert [call[0] for call in sent] == ['single', 'digest', 'digest', 'digest']
+    assert [call[2] for call in sent[1:]] == [10, 10, 5]
+    assert [i for call in sent[1:] for i in call[4]] == ids[1:]
+
+def test_failed_sends_are_counted(app):
+    """Testa o contador de falhas do notificador."""
+    aggregator = NotificationAggregator(app, window=60)
+    aggregator.start()
+    payee = uuid.uuid4()
+    with patch('app.services.send_notification_external', return_value=False):
+        aggregator.submit(payee, Decimal("1.00"), uuid.uuid4())
+        aggregator.stop()
+    assert aggregator.payee_counters(payee)["failed_sends"] == 1
+
+@patch('app.services.authorize_transaction_external', return_value=True)
+def test_transfers_use_aggregator_when_enabled(mock_authorize, app, client, db, sent, monkeypatch):
+    """Testa que, com a agregação ligada, a transferência não chama o notificador no caminho da requisição."""
+    aggregator = NotificationAggregator(app, window=60)
+    aggregator.start()
+    monkeypatch.setitem(app.config, 'NOTIFICATION_AGGREGATION_ENABLED', True)
+    monkeypatch.setitem(app.extensions, 'notification_aggregator', aggregator)
+    payer = User(full_name="Notif Payer", cpf="15315315315", email="notif.payer@example.com", password_hash="pw", balance=Decimal("100.00"))
+    shop = Merchant(full_name="Notif Shop", cnpj="15315315000101", email="notif.shop@example.com", password_hash="pw")
+    db.session.add_all([payer, shop])
+    db.session.commit()
+
+    for _ in range(5):
+        payload = {"payer_id": str(payer.id), "payee_id": str(shop.id), "amount": "2.00"}
+        response = client.post('/transactions', data=json.dumps(payload), content_type='application/json')
+        assert response.status_code == 200
+    assert client.get('/notifications/stats').get_json()["events"] == 5
+    aggregator.stop()
+    assert [call[0] for call in sent] == ['single', 'digest']
+    assert sent[1][2:4] == (4, Decimal("8.00"))
+
+def test_notification_stats_disabled(client):
+    """Testa que as estatísticas só existem com a agregação ligada."""
+    assert client.get('/notifications/stats').status_code == 404
+
+def test_full_lane_requeues_digest_without_blocking(app, sent):
+    """Testa que, com o lane cheio, o digest volta ao buffer sem bloquear quem submete, mantendo a ordem."""
+    aggregator = NotificationAggregator(app, window=60, max_batch=5, lanes=1, lane_queue_size=1)
+    payee = uuid.uuid4()
+    ids = [uuid.uuid4() for _ in range(12)]
+    started = time.monotonic()
+    for transaction_id in ids: # Threads ainda paradas: o envio avulso ocupa a única vaga do lane
+        aggregator.submit(payee, Decimal("1.00"), transaction_id)
+    assert time.monotonic() - started < 1.0
+    assert aggregator.stats()["requeued_digests"] >= 1
+    assert aggregator.stats()["pending_events"] == 11
+
+    aggregator.start()
+    aggregator.stop()
+    assert sent[0] == ('single', payee, Decimal("1.00"))
+    assert [i for call in sent[1:] for i in call[4]] == ids[1:]
+
+def test_submit_after_stop_sends_inline(app, sent):
+    """Testa que eventos submetidos após stop() são enviados na hora, não presos num digest."""
+    aggregator = NotificationAggregator(app, window=60)
+    aggregator.start()
+    aggregator.stop()
+    payee = uuid.uuid4()
+    with app.app_context():
+        aggregator.submit(payee, Decimal("2.00"), uuid.uuid4())
+        aggregator.submit(payee, Decimal("3.00"), uuid.uuid4())
+    assert sent == [('single', payee, Decimal("2.00")), ('single', payee, Decimal("3.00"))]
+    assert aggregator.stats()["pending_events"] == 0
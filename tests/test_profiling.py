@@ -0,0 +1,101 @@
+import pytest
+import json
+import time
+from decimal import Decimal
+from unittest.mock import patch
+from app import create_app, db as _db
+from app.models import User
+
+TOKEN = "prof-token"
+AUTH = {"X-Profile": TOKEN}
+
+@pytest.fixture
+def profiled_app(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'profiled.db'}",
+        "PROFILING_ENABLED": True,
+        "PROFILING_TOKEN": TOKEN,
+        "PROFILING_INTERVAL": 0.001,
+        "PROFILING_SLOW_QUERY_SECONDS": 0.0, # Toda consulta conta como lenta
+        "PROFILING_OUTPUT_DIR": str(tmp_path / "profiles"),
+    })
+    with app.app_context():
+        payer = User(full_name="Prof Payer", cpf="13213213213", email="prof.payer@example.com", password_hash="pw", balance=Decimal("50.00"))
+        payee = User(full_name="Prof Payee", cpf="13213213214", email="prof.payee@example.com", password_hash="pw")
+        _db.session.add_all([payer, payee])
+        _db.session.commit()
+        ids = (str(payer.id), str(payee.id))
+        yield app, ids
+        _db.session.remove()
+
+def _slow_authorizer(*args):
+    time.sleep(0.05)
+    return True
+
+@patch('app.services.send_notification_external', return_value=True)
+@patch('app.services.authorize_transaction_external', side_effect=_slow_authorizer)
+def test_header_profiles_request_with_stacks_and_sql(mock_authorize, mock_notify, profiled_app, tmp_path):
+    """Testa que o header ativa amostragem de pilha e captura de SQL."""
+    app, (payer_id, payee_id) = profiled_app
+    client = app.test_client()
+    payload = {"payer_id": payer_id, "payee_id": payee_id, "amount": "5.00"}
+    response = client.post('/transactions', data=json.dumps(payload), content_type='application/json', headers=AUTH)
+    assert response.status_code == 200
+    profile_id = response.headers['X-Profile-Id']
+
+    summary = client.get(f'/debug/profiles/{profile_id}', headers=AUTH).get_json()
+    assert summary["path"] == "/transactions"
+    assert summary["samples"] > 0
+    assert summary["sql"]["count"] > 0
+    assert summary["sql"]["slow"]
+
+    collapsed = client.get(f'/debug/profiles/{profile_id}/collapsed', headers=AUTH).get_data(as_text=True)
+    assert "_slow_authorizer" in collapsed
+    assert (tmp_path / "profiles" / f"{profile_id}.collapsed").read_text() == collapsed
+
+def test_requests_without_header_are_not_profiled(profiled_app):
+    """Testa que sem header (e taxa de amostragem zero) nada é perfilado."""
+    app, _ = profiled_app
+    client = app.test_client()
+    assert 'X-Profile-Id' not in client.get('/').headers
+    assert client.get('/debug/profiles', headers=AUTH).get_json() == {"profiles": []}
+
+def test_sample_rate_profiles_without_header(profiled_app, monkeypatch):
+    """Testa a ativação por taxa de amostragem."""
+    app, _ = profiled_app
+    monkeypatch.setitem(app.config, 'PROFILING_SAMPLE_RATE', 1.0)
+    assert 'X-Profile-Id' in app.test_client().get('/').headers
+
+def test_disabled_profiling_registers_nothing(app, client):
+    """Testa que, desligado, não há hooks nem endpoints de depuração."""
+    response = client.get('/', headers={"X-Profile": "1"})
+    assert 'X-Profile-Id' not in response.headers
+    assert client.get('/debug/profiles').status_code == 404
+
+def test_debug_endpoints_require_token(profiled_app, tmp_path):
+    """Testa que /debug/profiles exige o token e não existe quando nenhum token é configurado."""
+    app, _ = profiled_app
+    client = app.test_client()
+    assert client.get('/debug/profiles').status_code == 403
+    assert client.get('/debug/profiles', headers={"X-Profile": "wrong"}).status_code == 403
+
+    tokenless = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'tokenless.db'}",
+        "PROFILING_ENABLED": True,
+    })
+    assert tokenless.test_client().get('/debug/profiles', headers={"X-Profile": "1"}).status_code == 404
+
+def test_header_needs_the_token_to_profile(profiled_app, tmp_path):
+    """Testa que o header só ativa o profiler com o token certo e é ignorado quando não há token."""
+    app, _ = profiled_app
+    assert 'X-Profile-Id' not in app.test_client().get('/', headers={"X-Profile": "wrong"}).headers
+    assert 'X-Profile-Id' in app.test_client().get('/', headers=AUTH).headers
+
+    tokenless = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'tokenless.db'}",
+        "PROFILING_ENABLED": True,
+    })
+    assert 'X-Profile-Id' not in tokenless.test_client().get('/', headers={"X-Profile": "1"}).headers
@@ -0,0 +1,79 @@
+import pytest
+import json
+import uuid
+from unittest.mock import patch
+from app.ratelimit import InMemoryRateLimitBackend
+
+def test_sliding_window_counter_blocks_over_limit():
+    """Testa que o contador bloqueia ao ultrapassar o limite na janela."""
+    backend = InMemoryRateLimitBackend()
+    entry = [("payer:count:60:p1", 60, 2, 1)]
+    assert backend.acquire(entry, now=0)[0]
+    assert backend.acquire(entry, now=1)[0]
+    allowed, retry_after = backend.acquire(entry, now=2)
+    assert not allowed
+    assert retry_after == 58
+
+def test_sliding_window_weights_previous_window():
+    """Testa que a janela anterior é ponderada pelo tempo decorrido."""
+    backend = InMemoryRateLimitBackend()
+    entry = [("k", 60, 4, 1)]
+    for t in range(4):
+        assert backend.acquire(entry, now=50 + t)[0]
+    # Logo no início da próxima janela, a anterior ainda pesa quase 100%
+    assert not backend.acquire(entry, now=61)[0]
+    # Na metade da janela seguinte, metade da anterior (2) + 0 atual: cabem mais 2
+    assert backend.acquire(entry, now=90)[0]
+    assert backend.acquire(entry, now=90)[0]
+    assert not backend.acquire(entry, now=90)[0]
+    # Duas janelas depois, o histórico é descartado
+    assert backend.acquire(entry, now=200)[0]
+
+def test_acquire_is_all_or_nothing():
+    """Testa que nenhum contador é cobrado quando uma das regras rejeita."""
+    backend = InMemoryRateLimitBackend()
+    count_rule = ("payer:count:60:p1", 60, 10, 1)
+    assert not backend.acquire([count_rule, ("payer:amount:60:p1", 60, 100, 500)], now=0)[0]
+    # A regra de contagem não foi cobrada pela tentativa rejeitada
+    for _ in range(10):
+        assert backend.acquire([count_rule], now=1)[0]
+    assert not backend.acquire([count_rule], now=1)[0]
+
+def test_backend_memory_is_bounded():
+    """Testa que o número de chaves mantidas é limitado."""
+    backend = InMemoryRateLimitBackend(max_keys=3)
+    for i in range(10):
+        backend.acquire([(f"k{i}", 60, 5, 1)], now=0)
+    assert len(backend._counters) == 3
+
+@patch('app.routes.execute_transfer')
+def test_create_transaction_rejected_before_service(mock_process, app, client, monkeypatch):
+    """Testa que a rota retorna 429 sem chamar o serviço quando o limite é excedido."""
+    mock_process.return_value = ({"message": "ok"}, 200)
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_RULES', [('payer', 'count', 2, 60), ('payer', 'amount', '100.00', 60)])
+    monkeypatch.setitem(app.extensions, 'rate_limit_backend', InMemoryRateLimitBackend())
+
+    payer_1, payer_2, payee = (str(uuid.uuid4()) for _ in range(3))
+    payload = {"payer_id": payer_1, "payee_id": payee, "amount": "10.00"}
+    for _ in range(2):
+        response = client.post('/transactions', data=json.dumps(payload), content_type='application/json')
+        assert response.status_code == 200
+
+    response = client.post('/transactions', data=json.dumps(payload), content_type='application/json')
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert mock_process.call_count == 2
+
+    # Limite de valor: outro pagador não consegue transferir acima de 100.00 na janela
+    big_payload = {"payer_id": payer_2, "payee_id": payee, "amount": "150.00"}
+    response = client.post('/transactions', data=json.dumps(big_payload), content_type='application/json')
+    assert response.status_code == 429
+
+def test_backend_interface_is_abstract():
+    """Testa que um backend sem acquire não pode ser instanciado."""
+    from app.ratelimit import RateLimitBackend
+    class Incomplete(RateLimitBackend):
+        pass
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,68 @@
+import pytest
+import csv
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from app.archive import archive_transactions
+from app.models import User, Merchant, Transaction, TransactionStatus
+from app.reconciliation import reconcile_balances
+
+@pytest.fixture
+def ledger(db):
+    """Contas cujos saldos batem com as transações concluídas, exceto a do lojista."""
+    alice = User(full_name="Alice", cpf="51251251251", email="alice@example.com", password_hash="pw", balance=Decimal("-60.25"))
+    bob = User(full_name="Bob", cpf="51251251252", email="bob@example.com", password_hash="pw", balance=Decimal("10.00"))
+    shop = Merchant(full_name="Shop", cnpj="51251251000199", email="shop@example.com", password_hash="pw", balance=Decimal("99.99"))
+    db.session.add_all([alice, bob, shop])
+    db.session.commit()
+
+    old = datetime.utcnow() - timedelta(days=90)
+    rows = [
+        (alice, bob, "10.00", TransactionStatus.COMPLETED, old),
+        (alice, shop, "50.25", TransactionStatus.COMPLETED, datetime.utcnow()),
+        (alice, shop, "500.00", TransactionStatus.FAILED, datetime.utcnow()), # Não conta
+        (bob, shop, "7.00", TransactionStatus.PENDING, datetime.utcnow()),    # Não conta
+    ]
+    for payer, payee, amount, status, timestamp in rows:
+        db.session.add(Transaction(payer_id=payer.id, payee_id=payee.id, amount=Decimal(amount), status=status, timestamp=timestamp))
+    db.session.commit()
+    return alice, bob, shop
+
+def test_reconcile_reports_only_mismatched_accounts(db, ledger, tmp_path):
+    """Testa que apenas a conta divergente aparece no relatório."""
+    _, _, shop = ledger
+    report = tmp_path / "report.csv"
+    summary = reconcile_balances(chunk_size=1, output_path=str(report)) # Lotes mínimos exercitam o streaming
+
+    assert summary == {"accounts": 3, "discrepancies": 1, "orphan_payer_cents": 0, "orphan_payee_cents": 0}
+    with open(report) as f:
+        rows = list(csv.DictReader(f))
+    assert rows == [{
+        "account_id": str(shop.id), "account_type": "merchant",
+        "balance": "99.99", "expected_balance": "50.25", "difference": "49.74",
+    }]
+
+def test_reconcile_includes_archived_transactions(app, db, ledger, tmp_path, monkeypatch):
+    """Testa que transações arquivadas continuam contando na conciliação."""
+    monkeypatch.setitem(app.config, 'ARCHIVE_DIR', str(tmp_path / "archive"))
+    assert archive_transactions(datetime.utcnow() - timedelta(days=30)) == 1
+
+    assert reconcile_balances()["discrepancies"] == 1
+    assert reconcile_balances(include_archive=False)["discrepancies"] == 3
+
+def test_reconcile_flags_orphan_transactions(db, ledger):
+    """Testa que transações de contas inexistentes são contabilizadas à parte."""
+    alice, _, _ = ledger
+    db.session.add(Transaction(payer_id=alice.id, payee_id=uuid.uuid4(), amount=Decimal("1.50"), status=TransactionStatus.COMPLETED))
+    # Mesmo valor no sentido oposto: não pode anular o órfão acima
+    db.session.add(Transaction(payer_id=uuid.uuid4(), payee_id=alice.id, amount=Decimal("1.50"), status=TransactionStatus.COMPLETED))
+    db.session.commit()
+    summary = reconcile_balances()
+    assert summary["orphan_payee_cents"] == 150
+    assert summary["orphan_payer_cents"] == 150
+
+def test_reconcile_command_exit_code(runner, db, ledger, tmp_path):
+    """Testa que o comando CLI sinaliza divergências pelo código de saída."""
+    result = runner.invoke(args=['reconcile', '--output', str(tmp_path / "r.csv")])
+    assert result.exit_code == 1
+    assert "divergências: 1" in result.output
@@ -0,0 +1,92 @@
+import pytest
+from decimal import Decimal
+from sqlalchemy.orm import Session
+from app import create_app
+from app.models import User, db as _db
+from app.replicas import ReplicaRouter, get_replica_router, mark_recent_write, attach_write_marker
+
+@pytest.fixture
+def replica_app(tmp_path):
+    """App com primário e uma réplica, ambos arquivos SQLite separados."""
+    lag = {"replica_0": 0.0}
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'primary.db'}",
+        "READ_REPLICA_URIS": [f"sqlite:///{tmp_path / 'replica.db'}"],
+        "READ_REPLICA_LAG_PROBE": lambda bind_key: lag[bind_key],
+    })
+    with app.app_context():
+        _db.metadata.create_all(_db.engines["replica_0"])
+    app.replica_lag = lag
+    yield app
+    # db é global: remove o metadata do bind para não afetar o app de teste da sessão
+    _db.metadatas.pop("replica_0", None)
+
+def _seed(app, balance_primary, balance_replica):
+    """Cria a mesma conta no primário e na réplica com saldos diferentes (réplica atrasada)."""
+    with app.app_context():
+        user = User(full_name="Replica User", cpf="12312312312", email="replica@example.com",
+                    password_hash="pw", balance=Decimal(balance_primary))
+        _db.session.add(user)
+        _db.session.commit()
+        with Session(bind=_db.engines["replica_0"]) as replica:
+            replica.add(User(id=user.id, full_name=user.full_name, cpf=user.cpf, email=user.email,
+                             password_hash="pw", balance=Decimal(balance_replica)))
+            replica.commit()
+        return user.id
+
+def test_balance_reads_from_replica(replica_app):
+    """Testa que a consulta de saldo é servida pela réplica."""
+    user_id = _seed(replica_app, "100.00", "90.00")
+    response = replica_app.test_client().get(f'/users/{user_id}/balance')
+    assert response.status_code == 200
+    assert response.get_json()['balance'] == "90.00"
+
+def test_balance_sticky_after_own_write(replica_app):
+    """Testa read-your-writes: após escrita da conta, a leitura vai ao primário."""
+    user_id = _seed(replica_app, "100.00", "90.00")
+    with replica_app.app_context():
+        mark_recent_write(user_id)
+    response = replica_app.test_client().get(f'/users/{user_id}/balance')
+    assert response.get_json()['balance'] == "100.00"
+
+def test_balance_falls_back_to_primary_when_replica_lags(replica_app):
+    """Testa que uma réplica atrasada além do limite não é usada."""
+    user_id = _seed(replica_app, "100.00", "90.00")
+    replica_app.replica_lag["replica_0"] = 60.0
+    response = replica_app.test_client().get(f'/users/{user_id}/balance')
+    assert response.get_json()['balance'] == "100.00"
+
+def test_router_without_replicas_uses_primary(app):
+    """Testa que sem réplicas configuradas toda leitura vai ao primário."""
+    with app.app_context():
+        assert get_replica_router().choose_bind(("any",)) is None
+
+def test_router_round_robin_and_sticky_expiry(monkeypatch):
+    """Testa o rodízio entre réplicas e a expiração da aderência ao primário."""
+    router = ReplicaRouter(["replica_0", "replica_1"], sticky_seconds=10)
+    assert [router.choose_bind() for _ in range(4)] == ["replica_0", "replica_1", "replica_0", "replica_1"]
+
+    clock = [1000.0]
+    monkeypatch.setattr("app.replicas.time.monotonic", lambda: clock[0])
+    router.mark_written("acc")
+    assert router.choose_bind(("acc",)) is None
+    clock[0] += 11
+    assert router.choose_bind(("acc",)) is not None
+
+def test_write_marker_keeps_reads_on_primary_across_workers(replica_app):
+    """Testa que o marcador de escrita enviado pelo cliente vale mesmo sem a aderência deste processo."""
+    user_id = _seed(replica_app, "100.00", "90.00")
+    with replica_app.test_request_context():
+        mark_recent_write(user_id)
+        response = attach_write_marker(replica_app.response_class())
+    marker = response.headers['X-Last-Write']
+    assert 'last_write=' in response.headers['Set-Cookie']
+    # Outro worker: aderência por processo vazia, só o marcador do cliente
+    replica_app.extensions.pop('replica_router')
+
+    client = replica_app.test_client()
+    assert client.get(f'/users/{user_id}/balance', headers={'X-Last-Write': marker}).get_json()['balance'] == "100.00"
+    assert client.get(f'/users/{user_id}/balance').get_json()['balance'] == "90.00"
+    stale = f"{float(marker) - 60:.3f}"
+    assert client.get(f'/users/{user_id}/balance', headers={'X-Last-Write': stale}).get_json()['balance'] == "90.00"
@@ -0,0 +1,134 @@
+import pytest
+import json
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from app.models import User, Merchant, Transaction, TransactionStatus
+from app.reconciliation import reconcile_balances
+from app.reversals import cancel_transactions_bulk
+
+START = datetime(2024, 7, 1)
+
+@pytest.fixture
+def incident(db):
+    """Dois pagadores com pagamentos a um lojista afetado e a outro não afetado."""
+    alice = User(full_name="Alice R", cpf="71271271271", email="alice.r@example.com", password_hash="pw")
+    bob = User(full_name="Bob R", cpf="71271271272", email="bob.r@example.com", password_hash="pw")
+    bad_shop = Merchant(full_name="Bad Shop", cnpj="71271271000101", email="bad.shop@example.com", password_hash="pw")
+    good_shop = Merchant(full_name="Good Shop", cnpj="71271271000102", email="good.shop@example.com", password_hash="pw")
+    db.session.add_all([alice, bob, bad_shop, good_shop])
+    db.session.commit()
+
+    rows = [
+        (alice, bad_shop, "10.00", TransactionStatus.COMPLETED, START + timedelta(minutes=1)),
+        (alice, bad_shop, "15.00", TransactionStatus.COMPLETED, START + timedelta(minutes=2)),
+        (bob, bad_shop, "7.50", TransactionStatus.COMPLETED, START + timedelta(minutes=3)),
+        (bob, bad_shop, "99.00", TransactionStatus.FAILED, START + timedelta(minutes=4)),
+        (alice, good_shop, "20.00", TransactionStatus.COMPLETED, START + timedelta(minutes=5)),
+    ]
+    for payer, payee, amount, status, timestamp in rows:
+        db.session.add(Transaction(payer_id=payer.id, payee_id=payee.id, amount=Decimal(amount), status=status, timestamp=timestamp))
+        if status == TransactionStatus.COMPLETED:
+            payee.balance += Decimal(amount)
+            payer.balance -= Decimal(amount)
+    db.session.commit()
+    return alice, bob, bad_shop, good_shop
+
+def test_cancel_single_transaction(client, db, incident):
+    """Testa o estorno de uma transação concluída e a recusa de um segundo estorno."""
+    alice, _, bad_shop, _ = incident
+    transaction = Transaction.query.filter_by(payee_id=bad_shop.id, amount=Decimal("10.00")).one()
+
+    response = client.post(f'/transactions/{transaction.id}/cancel')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == TransactionStatus.CANCELLED.value
+    assert db.session.get(User, alice.id).balance == Decimal("-35.00") # -45 + 10
+    assert db.session.get(Merchant, bad_shop.id).balance == Decimal("22.50")
+
+    response = client.post(f'/transactions/{transaction.id}/cancel')
+    assert response.status_code == 409
+
+def test_cancel_single_errors(client, db, incident):
+    """Testa transação inexistente, falha (não cancelável) e ID inválido."""
+    assert client.post(f'/transactions/{uuid.uuid4()}/cancel').status_code == 404
+    failed = Transaction.query.filter_by(status=TransactionStatus.FAILED).one()
+    assert client.post(f'/transactions/{failed.id}/cancel').status_code == 409
+    assert client.post('/transactions/abc/cancel').status_code == 400
+
+def test_bulk_cancel_by_merchant(client, db, incident):
+    """Testa o estorno em massa agrupado por conta, em lotes."""
+    alice, bob, bad_shop, good_shop = incident
+    payload = {"merchant_id": str(bad_shop.id), "batch_size": 2}
+    response = client.post('/transactions/cancel-bulk', data=json.dumps(payload), content_type='application/json')
+
+    assert response.status_code == 200
+    assert response.get_json() == {"cancelled": 3, "amount": "32.50", "batches": 2}
+    assert db.session.get(Merchant, bad_shop.id).balance == Decimal("0.00")
+    assert db.session.get(Merchant, good_shop.id).balance == Decimal("20.00")
+    assert db.session.get(User, alice.id).balance == Decimal("-20.00")
+    assert db.session.get(User, bob.id).balance == Decimal("0.00")
+    assert Transaction.query.filter_by(status=TransactionStatus.CANCELLED).count() == 3
+    assert reconcile_balances()["discrepancies"] == 0
+
+def test_bulk_cancel_by_window(client, db, incident):
+    """Testa o filtro por janela de tempo."""
+    payload = {"start": START.isoformat(), "end": (START + timedelta(minutes=2, seconds=30)).isoformat()}
+    response = client.post('/transactions/cancel-bulk', data=json.dumps(payload), content_type='application/json')
+    assert response.get_json()["cancelled"] == 2
+
+def test_bulk_cancel_rejects_non_positive_batch_size(client, db, incident):
+    """Testa que batch_size 0 ou negativo é recusado (LIMIT -1 no SQLite cancelaria tudo num lote)."""
+    alice, bob, bad_shop, good_shop = incident
+    for batch_size in (0, -1):
+        payload = {"merchant_id": str(bad_shop.id), "batch_size": batch_size}
+        response = client.post('/transactions/cancel-bulk', data=json.dumps(payload), content_type='application/json')
+        assert response.status_code == 400
+    assert Transaction.query.filter_by(status=TransactionStatus.CANCELLED).count() == 0
+    with pytest.raises(ValueError):
+        cancel_transactions_bulk(merchant_id=bad_shop.id, batch_size=-1)
+
+def test_bulk_cancel_requires_filter(client, db):
+    """Testa que o estorno em massa exige um filtro."""
+    response = client.post('/transactions/cancel-bulk', data=json.dumps({"start": START.isoformat()}), content_type='application/json')
+    assert response.status_code == 400
+
+def test_cancel_command_reports_progress(runner, db, incident):
+    """Testa o comando CLI com relatório de progresso por lote."""
+    _, _, bad_shop, _ = incident
+    result = runner.invoke(args=['cancel-transactions', '--merchant-id', str(bad_shop.id), '--batch-size', '1'])
+    assert result.exit_code == 0
+    assert result.output.count("canceladas") == 3
+    assert "Canceladas: 3 em 3 lotes, total 32.50" in result.output
+
+def test_cancel_during_transfer_keeps_both_updates(app, client, db, incident):
+    """Testa que um estorno concorrente a uma transferência para o mesmo lojista não é sobrescrito."""
+    import threading
+    from unittest.mock import patch
+    from app.reversals import cancel_transaction
+
+    _, _, bad_shop, _ = incident
+    carol = User(full_name="Carol R", cpf="71271271273", email="carol.r@example.com", password_hash="pw", balance=Decimal("100.00"))
+    db.session.add(carol)
+    db.session.commit()
+    carol_id, shop_id = carol.id, bad_shop.id
+    reversed_id = Transaction.query.filter_by(payee_id=shop_id, amount=Decimal("10.00")).one().id
+
+    def authorize_while_cancelling(*args, **kwargs):
+        # O estorno roda em outra thread (outra sessão) entre a leitura e a escrita dos saldos
+        def cancel():
+            with app.app_context():
+                cancel_transaction(reversed_id)
+        worker = threading.Thread(target=cancel)
+        worker.start()
+        worker.join()
+        return True
+
+    with patch('app.services.authorize_transaction_external', side_effect=authorize_while_cancelling), \
+            patch('app.services.send_notification_external', return_value=True):
+        payload = {"payer_id": str(carol_id), "payee_id": str(shop_id), "amount": "5.00"}
+        response = client.post('/transactions', data=json.dumps(payload), content_type='application/json')
+    assert response.status_code == 200
+
+    db.session.expire_all()
+    assert db.session.get(Merchant, shop_id).balance == Decimal("27.50") # 32.50 - 10.00 + 5.00
+    assert db.session.get(User, carol_id).balance == Decimal("95.00")
@@ -0,0 +1,77 @@
+import pytest
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from app.models import User, Merchant, Transaction, TransactionStatus, AccountDailyRollup, HourlyRollup
+from app.rollups import record_transaction, rebuild_rollups
+
+@pytest.fixture
+def accounts(db):
+    payer = User(full_name="Rollup Payer", cpf="41241241241", email="rollup.payer@example.com", password_hash="pw", balance=Decimal("500.00"))
+    merchant = Merchant(full_name="Rollup Merchant", cnpj="41241241000199", email="rollup.merchant@example.com", password_hash="pw")
+    db.session.add_all([payer, merchant])
+    db.session.commit()
+    return payer, merchant
+
+@patch('app.services.send_notification_external', return_value=True)
+@patch('app.services.authorize_transaction_external')
+def test_rollups_maintained_by_process_transaction(mock_authorize, mock_notify, client, db, accounts):
+    """Testa que cada transferência atualiza os rollups no mesmo commit."""
+    payer, merchant = accounts
+    payload = {"payer_id": str(payer.id), "payee_id": str(merchant.id), "amount": "100.00"}
+
+    mock_authorize.return_value = True
+    client.post('/transactions', data=json.dumps(payload), content_type='application/json')
+    client.post('/transactions', data=json.dumps(payload), content_type='application/json')
+    mock_authorize.return_value = False
+    client.post('/transactions', data=json.dumps(payload), content_type='application/json')
+
+    today = datetime.utcnow().date()
+    payer_rollup = db.session.get(AccountDailyRollup, (payer.id, today))
+    assert payer_rollup.tx_count == 3
+    assert payer_rollup.failed_count == 1
+    assert payer_rollup.sum_out == Decimal("200.00")
+
+    merchant_rollup = db.session.get(AccountDailyRollup, (merchant.id, today))
+    assert merchant_rollup.sum_in == Decimal("200.00")
+
+    response = client.get(f'/reports/accounts/{merchant.id}/daily')
+    assert response.status_code == 200
+    day = response.get_json()['days'][0]
+    assert day == {"day": today.isoformat(), "tx_count": 3, "failed_count": 1, "sum_in": "200.00", "sum_out": "0.00"}
+
+    response = client.get('/reports/failure-rate')
+    hours = response.get_json()['hours']
+    assert sum(h['tx_count'] for h in hours) == 3
+    assert hours[-1]['failure_rate'] == pytest.approx(1 / 3, abs=1e-4)
+
+def test_record_transaction_rolls_back_with_session(db, accounts):
+    """Testa que os contadores não sobrevivem a um rollback da transação."""
+    payer, merchant = accounts
+    record_transaction(db.session, payer.id, merchant.id, Decimal("10.00"), TransactionStatus.COMPLETED)
+    db.session.rollback()
+    assert db.session.query(AccountDailyRollup).count() == 0
+
+def test_rebuild_rollups_from_history(db, accounts):
+    """Testa o recálculo dos rollups a partir das transações existentes."""
+    payer, merchant = accounts
+    when = datetime(2024, 3, 10, 15, 30)
+    rows = [(TransactionStatus.COMPLETED, "10.00"), (TransactionStatus.COMPLETED, "5.50"),
+            (TransactionStatus.FAILED, "99.00"), (TransactionStatus.PENDING, "1.00")]
+    for status, amount in rows:
+        db.session.add(Transaction(payer_id=payer.id, payee_id=merchant.id, amount=Decimal(amount), status=status, timestamp=when))
+    db.session.commit()
+
+    assert rebuild_rollups() == {"accounts_days": 2, "hours": 1}
+    rollup = db.session.get(AccountDailyRollup, (payer.id, when.date()))
+    assert (rollup.tx_count, rollup.failed_count, rollup.sum_out) == (3, 1, Decimal("15.50"))
+    hourly = db.session.get(HourlyRollup, datetime(2024, 3, 10, 15))
+    assert hourly.volume == Decimal("15.50")
+
+def test_reports_validate_ranges(client, db):
+    """Testa validação de parâmetros dos relatórios."""
+    assert client.get('/reports/accounts/xyz/daily').status_code == 400
+    assert client.get('/reports/failure-rate?from=ontem').status_code == 400
+    start = datetime(2024, 1, 1)
+    assert client.get(f'/reports/failure-rate?from={start.isoformat()}&to={(start + timedelta(days=60)).isoformat()}').status_code == 400
@@ -0,0 +1,226 @@
+import pytest
+import json
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import ANY, patch
+from app.models import User, Merchant, ScheduledTransfer, TransactionStatus
+from app.scheduler import TransferScheduler
+
+NOW = datetime(2024, 8, 1, 12, 0)
+
+@pytest.fixture
+def accounts(db):
+    payer = User(full_name="Sched Payer", cpf="81281281281", email="sched.payer@example.com", password_hash="pw", balance=Decimal("500.00"))
+    payee = Merchant(full_name="Sched Shop", cnpj="81281281000101", email="sched.shop@example.com", password_hash="pw")
+    db.session.add_all([payer, payee])
+    db.session.commit()
+    return payer, payee
+
+def _schedule(db, payer, payee, run_at, interval_seconds=None, remaining_runs=1):
+    schedule = ScheduledTransfer(payer_id=payer.id, payee_id=payee.id, amount=Decimal("10.00"), next_run_at=run_at,
+                                 interval_seconds=interval_seconds, remaining_runs=remaining_runs)
+    db.session.add(schedule)
+    db.session.commit()
+    return schedule
+
+def _ok(*args, **kwargs):
+    return {"transaction_id": str(uuid.uuid4())}, 200
+
+def test_due_schedule_runs_exactly_once_across_restarts(app, db, accounts):
+    """Testa que um agendamento vencido executa uma vez, mesmo com um novo agendador (reinício)."""
+    payer, payee = accounts
+    schedule = _schedule(db, payer, payee, NOW - timedelta(minutes=1))
+
+    with patch('app.scheduler.execute_transfer', side_effect=_ok) as mock_process:
+        assert TransferScheduler(app).run_pending(NOW) == 1
+        assert TransferScheduler(app).run_pending(NOW) == 0 # Reinício não reexecuta
+        mock_process.assert_called_once_with(payer.id, payee.id, Decimal("10.00"), transaction_id=ANY)
+
+    db.session.refresh(schedule)
+    assert schedule.status == TransactionStatus.COMPLETED
+    assert schedule.run_count == 1
+    assert schedule.last_transaction_id is not None
+
+def test_recurring_schedule_skips_missed_occurrences(app, db, accounts):
+    """Testa que um agendamento recorrente avança sem reexecutar ocorrências perdidas."""
+    payer, payee = accounts
+    schedule = _schedule(db, payer, payee, NOW - timedelta(hours=2, minutes=30), interval_seconds=3600, remaining_runs=3)
+
+    with patch('app.scheduler.execute_transfer', side_effect=_ok) as mock_process:
+        scheduler = TransferScheduler(app, window_seconds=3600)
+        assert scheduler.run_pending(NOW) == 1
+        assert mock_process.call_count == 1
+
+    db.session.refresh(schedule)
+    assert schedule.next_run_at == NOW + timedelta(minutes=30)
+    assert schedule.remaining_runs == 2
+    assert schedule.status == TransactionStatus.PENDING
+    assert (schedule.next_run_at, schedule.id) in scheduler._heap # Próxima ocorrência já está na janela
+
+def test_failed_one_shot_is_marked_failed(app, db, accounts):
+    """Testa que a falha de uma execução única fica registrada no agendamento."""
+    payer, payee = accounts
+    schedule = _schedule(db, payer, payee, NOW)
+
+    with patch('app.scheduler.execute_transfer', return_value=({"error": "Insufficient balance."}, 400)):
+        TransferScheduler(app).run_pending(NOW)
+
+    db.session.refresh(schedule)
+    assert schedule.status == TransactionStatus.FAILED
+    assert schedule.last_error == "Insufficient balance."
+
+def test_window_bounds_loaded_schedules(app, db, accounts):
+    """Testa que só agendamentos dentro da janela (e até max_loaded) ficam em memória."""
+    payer, payee = accounts
+    for minutes in (1, 2, 3):
+        _schedule(db, payer, payee, NOW + timedelta(minutes=minutes))
+    _schedule(db, payer, payee, NOW + timedelta(days=1))
+
+    scheduler = TransferScheduler(app, window_seconds=600, max_loaded=2)
+    scheduler.load_window(NOW)
+    assert len(scheduler._heap) == 2
+    assert scheduler._loaded_until == NOW + timedelta(minutes=2)
+
+def test_scheduled_transfer_routes(client, db, accounts):
+    """Testa criação, consulta e cancelamento via API."""
+    payer, payee = accounts
+    payload = {"payer_id": str(payer.id), "payee_id": str(payee.id), "amount": "25.00",
+               "run_at": (NOW + timedelta(days=1)).isoformat(), "interval_seconds": 86400, "max_runs": 12}
+    response = client.post('/scheduled-transfers', data=json.dumps(payload), content_type='application/json')
+    assert response.status_code == 201
+    schedule_id = response.get_json()["id"]
+    assert response.get_json()["remaining_runs"] == 12
+
+    assert client.get(f'/scheduled-transfers/{schedule_id}').get_json()["status"] == TransactionStatus.PENDING.value
+    response = client.delete(f'/scheduled-transfers/{schedule_id}')
+    assert response.get_json()["status"] == TransactionStatus.CANCELLED.value
+    assert client.delete(f'/scheduled-transfers/{schedule_id}').status_code == 409
+
+def test_scheduled_transfer_validation(client, db, accounts):
+    """Testa validação de campos e de pagador."""
+    payer, payee = accounts
+    base = {"payer_id": str(payer.id), "payee_id": str(payee.id), "amount": "25.00", "run_at": NOW.isoformat()}
+    assert client.post('/scheduled-transfers', data=json.dumps({**base, "amount": "-1"}), content_type='application/json').status_code == 400
+    assert client.post('/scheduled-transfers', data=json.dumps({**base, "interval_seconds": 5}), content_type='application/json').status_code == 400
+    assert client.post('/scheduled-transfers', data=json.dumps({**base, "payer_id": str(payee.id)}), content_type='application/json').status_code == 404
+    assert client.post('/scheduled-transfers', data=json.dumps({**base, "payee_id": str(uuid.uuid4())}), content_type='application/json').status_code == 404
+
+def test_run_at_with_offset_is_stored_as_utc(client, db, accounts):
+    """Testa que run_at com fuso é convertido para UTC sem fuso antes de gravar."""
+    payer, payee = accounts
+    payload = {"payer_id": str(payer.id), "payee_id": str(payee.id), "amount": "25.00", "run_at": "2024-08-01T09:00:00-03:00"}
+    response = client.post('/scheduled-transfers', data=json.dumps(payload), content_type='application/json')
+    assert response.status_code == 201
+    schedule = db.session.get(ScheduledTransfer, uuid.UUID(response.get_json()["id"]))
+    assert schedule.next_run_at == datetime(2024, 8, 1, 12, 0)
+
+def test_final_run_is_running_until_transfer_commits(app, db, accounts):
+    """Testa que a execução única fica RUNNING durante a transferência e só então vira COMPLETED."""
+    payer, payee = accounts
+    schedule = _schedule(db, payer, payee, NOW)
+    seen = []
+
+    def process(*args, **kwargs):
+        seen.append(db.session.get(ScheduledTransfer, schedule.id).status)
+        return _ok()
+
+    with patch('app.scheduler.execute_transfer', side_effect=process):
+        TransferScheduler(app).run_pending(NOW)
+    assert seen == [TransactionStatus.RUNNING]
+    db.session.refresh(schedule)
+    assert schedule.status == TransactionStatus.COMPLETED
+    assert schedule.leased_at is None
+
+def test_expired_lease_is_recovered(app, db, accounts):
+    """Testa a recuperação de um lease expirado: reexecuta se a transferência não foi gravada, conclui se foi."""
+    from app.models import Transaction
+    payer, payee = accounts
+    lost = _schedule(db, payer, payee, NOW)
+    done = _schedule(db, payer, payee, NOW - timedelta(minutes=1))
+
+    # Processo morre após o claim: nenhuma das duas chega ao fim
+    claimed = TransferScheduler(app)._claim([lost.id, done.id], NOW)
+    reserved = {schedule_id: transaction_id for schedule_id, _, _, _, transaction_id, _ in claimed}
+    db.session.refresh(lost)
+    assert lost.leased_transaction_id == reserved[lost.id] # Gravado junto com o lease
+    # A transferência de `done` foi gravada antes da queda, com o id reservado
+    transfer = Transaction(id=reserved[done.id], payer_id=payer.id, payee_id=payee.id, amount=Decimal("10.00"),
+                           status=TransactionStatus.COMPLETED)
+    # Transferência manual com os mesmos dados não conclui `lost`
+    db.session.add_all([transfer, Transaction(payer_id=payer.id, payee_id=payee.id, amount=Decimal("10.00"),
+                                              status=TransactionStatus.COMPLETED)])
+    db.session.commit()
+    assert {s.status for s in ScheduledTransfer.query.all()} == {TransactionStatus.RUNNING}
+
+    scheduler = TransferScheduler(app, lease_seconds=0)
+    with patch('app.scheduler.execute_transfer', side_effect=_ok) as mock_process:
+        assert scheduler.run_pending(NOW) == 1
+    # A reexecução reutiliza o id reservado: um commit tardio da execução perdida conflitaria
+    mock_process.assert_called_once_with(payer.id, payee.id, Decimal("10.00"), transaction_id=reserved[lost.id])
+
+    db.session.refresh(lost)
+    db.session.refresh(done)
+    assert (lost.status, lost.run_count, lost.remaining_runs) == (TransactionStatus.COMPLETED, 1, 0)
+    assert (done.status, done.last_transaction_id) == (TransactionStatus.COMPLETED, transfer.id)
+
+@patch('app.services.send_notification_external', return_value=True)
+@patch('app.services.authorize_transaction_external', return_value=True)
+def test_final_run_writes_the_reserved_transaction_id(mock_authorize, mock_notify, app, db, accounts):
+    """Testa que a transferência da execução final é gravada com o id reservado no claim."""
+    from app.models import Transaction
+    payer, payee = accounts
+    schedule = _schedule(db, payer, payee, NOW)
+    scheduler = TransferScheduler(app)
+    claimed = scheduler._claim([schedule.id], NOW)
+    db.session.execute(ScheduledTransfer.__table__.update().values(leased_at=NOW - timedelta(hours=1)))
+    db.session.commit()
+
+    scheduler.lease = timedelta(seconds=0)
+    assert scheduler.run_pending(NOW) == 1
+    db.session.refresh(schedule)
+    assert schedule.status == TransactionStatus.COMPLETED
+    assert schedule.last_transaction_id == claimed[0][4]
+    assert db.session.get(Transaction, claimed[0][4]).status == TransactionStatus.COMPLETED
+
+def test_error_in_one_run_does_not_lose_the_rest_of_the_batch(app, db, accounts):
+    """Testa que uma exceção na transferência de um item é registrada e o restante do lote executa."""
+    payer, payee = accounts
+    first = _schedule(db, payer, payee, NOW - timedelta(minutes=2))
+    recurring = _schedule(db, payer, payee, NOW - timedelta(minutes=1), interval_seconds=3600, remaining_runs=None)
+    last = _schedule(db, payer, payee, NOW)
+    recurring.amount, last.amount = Decimal("11.00"), Decimal("12.00")
+    db.session.commit()
+    outcomes = {Decimal("10.00"): RuntimeError("database is locked"), Decimal("11.00"): RuntimeError("boom")}
+
+    def process(payer_id, payee_id, amount, **kwargs):
+        if amount in outcomes:
+            raise outcomes[amount]
+        return _ok()
+
+    with patch('app.scheduler.execute_transfer', side_effect=process) as mock_process:
+        assert TransferScheduler(app, batch_size=3).run_pending(NOW) == 3
+    assert mock_process.call_count == 3
+
+    for schedule in (first, recurring, last):
+        db.session.refresh(schedule)
+    assert first.status == TransactionStatus.FAILED
+    assert "database is locked" in first.last_error
+    assert first.leased_at is None
+    assert (recurring.status, recurring.run_count) == (TransactionStatus.PENDING, 1)
+    assert "boom" in recurring.last_error
+    assert last.status == TransactionStatus.COMPLETED
+
+def test_scheduled_transfer_schema_errors(client, db, accounts):
+    """Testa as mensagens do schema declarativo para campos faltando, formato e recorrência."""
+    payer, payee = accounts
+    base = {"payer_id": str(payer.id), "payee_id": str(payee.id), "amount": "25.00", "run_at": NOW.isoformat()}
+
+    def post(payload):
+        return client.post('/scheduled-transfers', data=json.dumps(payload), content_type='application/json')
+
+    response = post({key: value for key, value in base.items() if key != "run_at"})
+    assert response.get_json() == {"error": "Missing fields: payer_id, payee_id, amount and run_at are required.", "field": "run_at"}
+    assert post({**base, "run_at": "tomorrow"}).get_json()["field"] == "run_at"
+    assert post({**base, "interval_seconds": True}).get_json()["field"] == "interval_seconds"
+    assert post({**base, "max_runs": 3}).get_json() == {"error": "max_runs must be positive and requires interval_seconds.", "field": "max_runs"}
@@ -0,0 +1,47 @@
+import pytest
+import json
+import uuid
+from decimal import Decimal
+from app.models import UserType
+from app.schemas import USER_SCHEMA, TRANSFER_SCHEMA, ValidationError
+
+def test_transfer_schema_converts_in_one_pass():
+    """Testa que o schema devolve valores tipados (UUID, Decimal)."""
+    payer_id, payee_id = uuid.uuid4(), uuid.uuid4()
+    transfer = TRANSFER_SCHEMA.load({"payer_id": str(payer_id), "payee_id": str(payee_id), "amount": 10.1})
+    assert transfer == (payer_id, payee_id, Decimal("10.1")) # Float passa por str(): sem ruído binário
+
+@pytest.mark.parametrize("amount, message", [
+    ("0", "Transaction amount must be positive."),
+    ("NaN", "Invalid input format"),
+    ("abc", "Invalid input format"),
+])
+def test_transfer_schema_rejects_bad_amounts(amount, message):
+    """Testa valores inválidos, incluindo NaN e texto."""
+    with pytest.raises(ValidationError) as exc:
+        TRANSFER_SCHEMA.load({"payer_id": str(uuid.uuid4()), "payee_id": str(uuid.uuid4()), "amount": amount})
+    assert message in exc.value.message
+    assert exc.value.field == "amount"
+
+def test_missing_fields_take_precedence_over_format():
+    """Testa que campos faltando são reportados antes de erros de formato."""
+    with pytest.raises(ValidationError) as exc:
+        TRANSFER_SCHEMA.load({"payer_id": "not-a-uuid", "amount": "1"})
+    assert exc.value.message.startswith("Missing fields")
+
+def test_user_schema_normalizes_user_type():
+    """Testa a conversão de user_type para o enum e a validação do documento."""
+    account = USER_SCHEMA.load({"full_name": "A", "email": "a@example.com", "password": "pw",
+                                "document": "12345678901234", "user_type": "MERCHANT"})
+    assert account.user_type is UserType.MERCHANT
+
+def test_routes_return_consistent_400_payload(client, db):
+    """Testa o corpo padrão dos erros 400 nas rotas."""
+    response = client.post('/transactions', data=json.dumps({"payer_id": "x", "payee_id": str(uuid.uuid4()), "amount": "1"}),
+                           content_type='application/json')
+    assert response.status_code == 400
+    assert response.get_json()["field"] == "payer_id"
+
+    response = client.post('/users', data="not json", content_type='application/json')
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid input"}
@@ -0,0 +1,47 @@
+import pytest
+from unittest.mock import patch
+from app.server import build_options, drain, warm_up
+
+def test_build_options_uses_config_and_overrides(app, monkeypatch):
+    """Testa a montagem das opções do gunicorn a partir da configuração."""
+    monkeypatch.setitem(app.config, 'SERVER_WORKERS', 3)
+    options = build_options(app)
+    assert (options['workers'], options['threads'], options['worker_class']) == (3, 4, 'gthread')
+    assert options['preload_app'] is True
+
+    options = build_options(app, bind='127.0.0.1:9000', workers=1, threads=1)
+    assert (options['bind'], options['workers'], options['worker_class']) == ('127.0.0.1:9000', 1, 'sync')
+
+def test_warm_up_builds_singletons_before_traffic(app, db, monkeypatch):
+    """Testa que o aquecimento cria os singletons preguiçosos do worker."""
+    for key in ('admission', 'rate_limit_backend', 'transaction_cache'):
+        monkeypatch.delitem(app.extensions, key, raising=False)
+    monkeypatch.setitem(app.config, 'FAILED_WRITER_ENABLED', True)
+
+    with patch('app.failure_writer.FailedAttemptWriter.start'):
+        warm_up(app)
+    assert 'main.create_transaction' in app.extensions['admission']
+    assert 'rate_limit_backend' in app.extensions
+    assert 'transaction_cache' in app.extensions
+    assert 'failed_attempt_writer' in app.extensions
+    monkeypatch.delitem(app.extensions, 'failed_attempt_writer')
+
+def test_drain_stops_background_components(app, monkeypatch):
+    """Testa que o desligamento drena workers assíncronos e o writer de falhas."""
+    class Component:
+        stopped = False
+        def stop(self):
+            self.stopped = True
+
+    workers, writer = Component(), Component()
+    monkeypatch.setitem(app.extensions, 'transfer_workers', workers)
+    monkeypatch.setitem(app.extensions, 'failed_attempt_writer', writer)
+    drain(app)
+    assert workers.stopped and writer.stopped
+
+def test_serve_command_without_gunicorn(runner):
+    """Testa a mensagem clara quando o gunicorn não está instalado."""
+    with patch.dict('sys.modules', {'gunicorn': None, 'gunicorn.app': None, 'gunicorn.app.base': None}):
+        result = runner.invoke(args=['serve'])
+    assert result.exit_code != 0
+    assert "gunicorn is not installed" in result.output
@@ -168,3 +168,31 @@ def test_process_transaction_notification_fails(mock_authorize, mock_notify, app
     db.session.refresh(updated_payee_user) # Adicionado refresh
     assert updated_payer.balance == Decimal("180.00") # 200 - 20
     assert updated_payee_user.balance == Decimal("70.00") # 50 + 20
+
+def _concurrent_debit(model, account_id, amount):
+    """Simula outro processo (ex.: liquidação) alterando o saldo entre a leitura e a escrita da transferência."""
+    from sqlalchemy import update
+
+    def authorize(*args, **kwargs):
+        app_db.session.execute(update(model).where(model.id == account_id).values(balance=model.balance - Decimal(amount)),
+                               execution_options={"synchronize_session": False})
+        return True
+    return authorize
+
+@patch('app.services.send_notification_external', return_value=True)
+def test_process_transaction_keeps_concurrent_balance_updates(mock_notify, app, db, service_payer, service_payee_merchant):
+    """Testa que a transferência aplica incrementos e não sobrescreve um débito concorrente do recebedor."""
+    with patch('app.services.authorize_transaction_external', side_effect=_concurrent_debit(Merchant, service_payee_merchant.id, "60.00")):
+        result, status_code = process_transaction(str(service_payer.id), str(service_payee_merchant.id), "20.00")
+    assert status_code == 200
+    db.session.expire_all()
+    assert db.session.get(User, service_payer.id).balance == Decimal("180.00")
+    assert db.session.get(Merchant, service_payee_merchant.id).balance == Decimal("60.00") # 100 - 60 + 20
+
+def test_process_transaction_rechecks_balance_on_debit(app, db, service_payer, service_payee_user):
+    """Testa que o débito condicional recusa quando o saldo foi consumido após a verificação inicial."""
+    with patch('app.services.authorize_transaction_external', side_effect=_concurrent_debit(User, service_payer.id, "190.00")):
+        result, status_code = process_transaction(str(service_payer.id), str(service_payee_user.id), "20.00")
+    assert status_code == 400
+    assert result == {"error": "Insufficient balance."}
+    assert Transaction.query.count() == 0
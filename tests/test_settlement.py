@@ -0,0 +1,120 @@
+import pytest
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from app.models import User, Merchant, Transaction, TransactionStatus, SettlementBatch, MerchantSettlement
+from app import settlement
+from app.settlement import run_settlement, SettlementWindowConflict, _apply_chunk
+from app.reconciliation import reconcile_balances
+
+DAY = datetime(2024, 5, 20)
+
+@pytest.fixture
+def sales(db):
+    """Dois lojistas com vendas no dia, fora do dia e com falha."""
+    buyer = User(full_name="Buyer", cpf="61261261261", email="buyer@example.com", password_hash="pw", balance=Decimal("0.00"))
+    shop_a = Merchant(full_name="Shop A", cnpj="61261261000101", email="shop.a@example.com", password_hash="pw")
+    shop_b = Merchant(full_name="Shop B", cnpj="61261261000102", email="shop.b@example.com", password_hash="pw")
+    db.session.add_all([buyer, shop_a, shop_b])
+    db.session.commit()
+
+    rows = [
+        (shop_a, "100.00", TransactionStatus.COMPLETED, DAY + timedelta(hours=1)),
+        (shop_a, "50.00", TransactionStatus.COMPLETED, DAY + timedelta(hours=23)),
+        (shop_a, "70.00", TransactionStatus.FAILED, DAY + timedelta(hours=2)),     # Não liquida
+        (shop_a, "30.00", TransactionStatus.COMPLETED, DAY + timedelta(days=1)),   # Dia seguinte
+        (shop_b, "20.00", TransactionStatus.COMPLETED, DAY + timedelta(hours=5)),
+    ]
+    for merchant, amount, status, timestamp in rows:
+        db.session.add(Transaction(payer_id=buyer.id, payee_id=merchant.id, amount=Decimal(amount), status=status, timestamp=timestamp))
+        if status == TransactionStatus.COMPLETED:
+            buyer.balance -= Decimal(amount)
+            merchant.balance += Decimal(amount)
+    db.session.commit()
+    return shop_a, shop_b
+
+def test_settlement_debits_net_volume_per_merchant(db, sales):
+    """Testa que cada lojista é liquidado pelo volume concluído na janela."""
+    shop_a, shop_b = sales
+    summary = run_settlement(DAY, DAY + timedelta(days=1))
+
+    assert summary["status"] == "completed"
+    assert summary["merchants"] == 2
+    assert Decimal(summary["total_amount"]) == Decimal("170.00")
+    assert db.session.get(Merchant, shop_a.id).balance == Decimal("30.00") # Resta a venda do dia seguinte
+    assert db.session.get(Merchant, shop_b.id).balance == Decimal("0.00")
+    assert reconcile_balances()["discrepancies"] == 0 # Repasses entram na conciliação
+
+def test_settlement_is_idempotent_per_window(db, sales):
+    """Testa que reexecutar a mesma janela não debita duas vezes."""
+    shop_a, _ = sales
+    first = run_settlement(DAY, DAY + timedelta(days=1))
+    second = run_settlement(DAY, DAY + timedelta(days=1))
+    assert first["batch_id"] == second["batch_id"]
+    assert db.session.get(Merchant, shop_a.id).balance == Decimal("30.00")
+    assert SettlementBatch.query.count() == 1
+
+def test_settlement_resumes_after_interruption(db, sales):
+    """Testa que um lote interrompido continua de onde parou."""
+    shop_a, shop_b = sales
+    calls = {"n": 0}
+
+    def crash_after_first_chunk(batch, chunk_size):
+        calls["n"] += 1
+        if calls["n"] > 1:
+            raise RuntimeError("processo encerrado")
+        return _apply_chunk(batch, chunk_size)
+
+    with patch('app.settlement._apply_chunk', side_effect=crash_after_first_chunk):
+        with pytest.raises(RuntimeError):
+            run_settlement(DAY, DAY + timedelta(days=1), chunk_size=1)
+    db.session.rollback()
+    assert MerchantSettlement.query.filter_by(applied=True).count() == 1
+
+    summary = run_settlement(DAY, DAY + timedelta(days=1), chunk_size=1)
+    assert summary["status"] == "completed"
+    assert db.session.get(Merchant, shop_a.id).balance == Decimal("30.00")
+    assert db.session.get(Merchant, shop_b.id).balance == Decimal("0.00")
+
+def test_concurrent_settlement_returns_existing_batch(app, db, sales):
+    """Testa que a execução que perde a corrida ao gravar as linhas devolve o lote existente, sem erro nem débito duplo."""
+    shop_a, shop_b = sales
+    get_or_create = settlement._get_or_create_batch
+    results = []
+
+    def racing_get_or_create(window_start, window_end):
+        batch = get_or_create(window_start, window_end)
+        if results or threading.current_thread() is not threading.main_thread():
+            return batch # A execução rival segue o caminho normal
+        assert batch.status == 'open'
+
+        def rival():
+            with app.app_context():
+                results.append(run_settlement(window_start, window_end))
+        worker = threading.Thread(target=rival)
+        worker.start()
+        worker.join()
+        return batch # Ainda 'open' nesta sessão
+
+    with patch('app.settlement._get_or_create_batch', side_effect=racing_get_or_create):
+        summary = run_settlement(DAY, DAY + timedelta(days=1))
+
+    assert results[0]["status"] == "completed"
+    assert summary["batch_id"] == results[0]["batch_id"]
+    assert summary["status"] == "completed"
+    db.session.expire_all()
+    assert db.session.get(Merchant, shop_a.id).balance == Decimal("30.00")
+    assert db.session.get(Merchant, shop_b.id).balance == Decimal("0.00")
+
+def test_settlement_rejects_overlapping_window(db, sales):
+    """Testa que janelas sobrepostas a um lote existente são recusadas."""
+    run_settlement(DAY, DAY + timedelta(days=1))
+    with pytest.raises(SettlementWindowConflict):
+        run_settlement(DAY + timedelta(hours=12), DAY + timedelta(days=1, hours=12))
+
+def test_settle_command(runner, db, sales):
+    """Testa o comando CLI de liquidação diária."""
+    result = runner.invoke(args=['settle', '--date', DAY.strftime('%Y-%m-%d')])
+    assert result.exit_code == 0
+    assert "2 lojistas, total 170.00" in result.output
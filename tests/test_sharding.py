@@ -0,0 +1,226 @@
+import pytest
+import json
+import uuid
+from decimal import Decimal
+from unittest.mock import patch
+from app import create_app
+from app.models import User, Merchant, Transaction, TransactionStatus, CrossShardTransfer, ShardTransferCredit, db as _db
+from app.sharding import get_shard_router, recover_cross_shard_transfers
+
+SHARDS = 3
+
+@pytest.fixture
+def sharded_app(tmp_path):
+    """App com contas particionadas em 3 arquivos SQLite."""
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'primary.db'}",
+        "SHARD_URIS": [f"sqlite:///{tmp_path / f'shard_{i}.db'}" for i in range(SHARDS)],
+    })
+    with app.app_context():
+        yield app
+    # db é global: remove os metadatas dos binds para não afetar o app de teste da sessão
+    for i in range(SHARDS):
+        _db.metadatas.pop(f"shard_{i}", None)
+
+def _id_on_shard(router, shard):
+    while True:
+        candidate = uuid.uuid4()
+        if router.shard_for(candidate) == shard:
+            return candidate
+
+def _create_account(router, shard, model=User, balance="0.00"):
+    account_id = _id_on_shard(router, shard)
+    suffix = account_id.hex[:11]
+    with router.session(shard) as session:
+        if model is User:
+            session.add(User(id=account_id, full_name="Shard User", cpf=str(account_id.int)[:11],
+                             email=f"{suffix}@example.com", password_hash="pw", balance=Decimal(balance)))
+        else:
+            session.add(Merchant(id=account_id, full_name="Shard Merchant", cnpj=str(account_id.int)[:14],
+                                 email=f"{suffix}@example.com", password_hash="pw", balance=Decimal(balance)))
+        session.commit()
+    return account_id
+
+def _balance(router, account_id, model=User):
+    with router.session_for(account_id) as session:
+        return session.get(model, account_id).balance
+
+def test_create_user_lands_on_hashed_shard(sharded_app):
+    """Testa que o cadastro grava a conta no shard dado pelo hash do UUID."""
+    client = sharded_app.test_client()
+    payload = {"full_name": "Sharded", "document": "11122233344", "email": "sharded@example.com", "password": "pw", "user_type": "common"}
+    response = client.post('/users', data=json.dumps(payload), content_type='application/json')
+    assert response.status_code == 201
+    user_id = uuid.UUID(response.get_json()['id'])
+
+    router = get_shard_router()
+    with router.session_for(user_id) as session:
+        assert session.get(User, user_id) is not None
+
+    # Unicidade verificada em todos os shards
+    response = client.post('/users', data=json.dumps(payload), content_type='application/json')
+    assert response.status_code == 409
+
+    balance = client.get(f'/users/{user_id}/balance')
+    assert balance.get_json()['balance'] == "0.00"
+
+@patch('app.services.send_notification_external', return_value=True)
+@patch('app.services.authorize_transaction_external', return_value=True)
+def test_same_shard_transfer(mock_authorize, mock_notify, sharded_app):
+    """Testa transferência no mesmo shard (um único commit, sem saga)."""
+    router = get_shard_router()
+    payer = _create_account(router, 0, balance="100.00")
+    payee = _create_account(router, 0)
+
+    payload = {"payer_id": str(payer), "payee_id": str(payee), "amount": "30.00"}
+    response = sharded_app.test_client().post('/transactions', data=json.dumps(payload), content_type='application/json')
+    assert response.status_code == 200
+    assert _balance(router, payer) == Decimal("70.00")
+    assert _balance(router, payee) == Decimal("30.00")
+    with router.session(0) as session:
+        assert session.query(CrossShardTransfer).count() == 0
+
+@patch('app.services.send_notification_external', return_value=True)
+@patch('app.services.authorize_transaction_external', return_value=True)
+def test_cross_shard_transfer(mock_authorize, mock_notify, sharded_app):
+    """Testa transferência entre shards concluída pela saga."""
+    router = get_shard_router()
+    payer = _create_account(router, 0, balance="100.00")
+    payee = _create_account(router, 1, model=Merchant)
+
+    payload = {"payer_id": str(payer), "payee_id": str(payee), "amount": "40.00"}
+    response = sharded_app.test_client().post('/transactions', data=json.dumps(payload), content_type='application/json')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == TransactionStatus.COMPLETED.value
+
+    assert _balance(router, payer) == Decimal("60.00")
+    assert _balance(router, payee, Merchant) == Decimal("40.00")
+    transaction_id = uuid.UUID(response.get_json()['transaction_id'])
+    with router.session(0) as session:
+        assert session.get(Transaction, transaction_id).status == TransactionStatus.COMPLETED
+        assert session.get(CrossShardTransfer, transaction_id).state == 'completed'
+
+@patch('app.services.send_notification_external', return_value=True)
+@patch('app.services.authorize_transaction_external', return_value=True)
+def test_interrupted_cross_shard_transfer_is_recovered(mock_authorize, mock_notify, sharded_app):
+    """Testa que o sweeper conclui uma saga interrompida após o débito, sem crédito duplicado."""
+    router = get_shard_router()
+    payer = _create_account(router, 0, balance="100.00")
+    payee = _create_account(router, 2)
+
+    payload = {"payer_id": str(payer), "payee_id": str(payee), "amount": "25.00"}
+    with patch('app.sharding._apply_credit', side_effect=RuntimeError("shard 2 offline")):
+        response = sharded_app.test_client().post('/transactions', data=json.dumps(payload), content_type='application/json')
+    assert response.status_code == 202
+    assert _balance(router, payer) == Decimal("75.00")
+    assert _balance(router, payee) == Decimal("0.00")
+
+    assert recover_cross_shard_transfers(router, grace_seconds=-60) == {"completed": 1, "compensated": 0}
+    assert recover_cross_shard_transfers(router, grace_seconds=-60) == {"completed": 0, "compensated": 0}
+    assert _balance(router, payee) == Decimal("25.00")
+    with router.session(2) as session:
+        assert session.query(ShardTransferCredit).count() == 1
+
+@patch('app.services.authorize_transaction_external', return_value=True)
+def test_recovery_compensates_when_payee_is_gone(mock_authorize, sharded_app):
+    """Testa a compensação (estorno ao pagador) quando o recebedor não existe mais."""
+    router = get_shard_router()
+    payer = _create_account(router, 1, balance="50.00")
+    payee = _create_account(router, 2)
+
+    with patch('app.sharding._apply_credit', side_effect=RuntimeError("timeout")):
+        payload = {"payer_id": str(payer), "payee_id": str(payee), "amount": "20.00"}
+        sharded_app.test_client().post('/transactions', data=json.dumps(payload), content_type='application/json')
+
+    with router.session(2) as session:
+        session.delete(session.get(User, payee))
+        session.commit()
+
+    assert recover_cross_shard_transfers(router, grace_seconds=-60) == {"completed": 0, "compensated": 1}
+    assert _balance(router, payer) == Decimal("50.00")
+    with router.session(1) as session:
+        assert session.query(Transaction).one().status == TransactionStatus.FAILED
+
+def test_recover_transfers_command(sharded_app):
+    """Testa o comando CLI do sweeper."""
+    result = sharded_app.test_cli_runner().invoke(args=['recover-transfers', '--grace-seconds', '0'])
+    assert result.exit_code == 0
+    assert "Concluídas: 0" in result.output
+
+@patch('app.services.authorize_transaction_external', return_value=True)
+def test_same_shard_credit_failure_rolls_back_debit(mock_authorize, sharded_app):
+    """Testa que, se o crédito no mesmo shard falha, o débito do pagador é desfeito."""
+    router = get_shard_router()
+    payer = _create_account(router, 0, balance="100.00")
+    payee = _create_account(router, 0)
+
+    with patch('app.sharding._credit', return_value=False):
+        payload = {"payer_id": str(payer), "payee_id": str(payee), "amount": "30.00"}
+        response = sharded_app.test_client().post('/transactions', data=json.dumps(payload), content_type='application/json')
+    assert response.status_code == 404
+    assert _balance(router, payer) == Decimal("100.00")
+    assert _balance(router, payee) == Decimal("0.00")
+
+@patch('app.services.send_notification_external', return_value=True)
+@patch('app.services.authorize_transaction_external', return_value=True)
+def test_transaction_lookup_and_history_span_shards(mock_authorize, mock_notify, sharded_app):
+    """Testa consulta da transação e extrato do recebedor quando a transação está no shard do pagador."""
+    router = get_shard_router()
+    payer = _create_account(router, 1, balance="50.00")
+    payee = _create_account(router, 2)
+    client = sharded_app.test_client()
+
+    payload = {"payer_id": str(payer), "payee_id": str(payee), "amount": "20.00"}
+    transaction_id = client.post('/transactions', data=json.dumps(payload), content_type='application/json').get_json()['transaction_id']
+
+    response = client.get(f'/transactions/{transaction_id}')
+    assert response.status_code == 200
+    assert response.get_json()['payee_id'] == str(payee)
+
+    history = client.get(f'/users/{payee}/transactions')
+    assert [t['id'] for t in history.get_json()['transactions']] == [transaction_id]
+
+def test_primary_only_features_are_rejected(sharded_app):
+    """Testa que cancelamento e arquivamento recusam com erro claro quando há shards."""
+    client = sharded_app.test_client()
+    response = client.post(f'/transactions/{uuid.uuid4()}/cancel')
+    assert response.status_code == 501
+    assert "SHARD_URIS" in response.get_json()['error']
+
+    result = sharded_app.test_cli_runner().invoke(args=['archive-transactions'])
+    assert result.exit_code != 0
+    assert "not supported with sharding" in result.output
+
+def test_rollups_are_rejected_with_shards(sharded_app):
+    """Testa que relatórios e rebuild de rollups recusam com shards em vez de responder vazio ou apagar a tabela."""
+    client = sharded_app.test_client()
+    assert client.get(f'/reports/accounts/{uuid.uuid4()}/daily').status_code == 501
+    response = client.get('/reports/failure-rate')
+    assert response.status_code == 501
+    assert "SHARD_URIS" in response.get_json()['error']
+
+    result = sharded_app.test_cli_runner().invoke(args=['rebuild-rollups'])
+    assert result.exit_code != 0
+    assert "not supported with sharding" in result.output
+
+def test_scheduled_transfers_are_rejected_with_shards(sharded_app):
+    """Testa que agendamentos recusam com shards: a tabela e o agendador ficam no banco principal."""
+    payload = {"payer_id": str(uuid.uuid4()), "payee_id": str(uuid.uuid4()), "amount": "1.00", "run_at": "2024-08-01T12:00:00"}
+    response = sharded_app.test_client().post('/scheduled-transfers', json=payload)
+    assert response.status_code == 501
+    assert "SHARD_URIS" in response.get_json()['error']
+
+    result = sharded_app.test_cli_runner().invoke(args=['run-scheduler'])
+    assert result.exit_code != 0
+    assert "not supported with sharding" in result.output
+
+def test_async_transfers_with_shards_are_rejected(tmp_path):
+    """Testa que a configuração recusa transferências assíncronas junto com shards."""
+    with pytest.raises(ValueError):
+        create_app({
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'primary.db'}",
+            "SHARD_URIS": [f"sqlite:///{tmp_path / 'shard_0.db'}"],
+            "ASYNC_TRANSFERS_ENABLED": True,
+        })
@@ -0,0 +1,73 @@
+import pytest
+from decimal import Decimal
+from unittest.mock import patch
+from app.models import User, Merchant, Transaction, TransactionStatus
+from app.transaction_cache import TransactionCache
+
+@pytest.fixture
+def cache(app, monkeypatch):
+    cache = TransactionCache(max_size=2, completed_ttl=60)
+    monkeypatch.setitem(app.extensions, 'transaction_cache', cache)
+    return cache
+
+@pytest.fixture
+def make_transaction(db):
+    payer = User(full_name="Cache Payer", cpf="15215215215", email="cache.payer@example.com", password_hash="pw", balance=Decimal("-10.00"))
+    shop = Merchant(full_name="Cache Shop", cnpj="15215215000101", email="cache.shop@example.com", password_hash="pw", balance=Decimal("10.00"))
+    db.session.add_all([payer, shop])
+    db.session.commit()
+
+    def make(status):
+        transaction = Transaction(payer_id=payer.id, payee_id=shop.id, amount=Decimal("10.00"), status=status)
+        db.session.add(transaction)
+        db.session.commit()
+        return transaction
+    return make
+
+def test_failed_transaction_is_immutable_and_served_from_cache(client, db, cache, make_transaction):
+    """Testa ETag forte, Cache-Control longo e resposta sem consulta ao banco."""
+    transaction = make_transaction(TransactionStatus.FAILED)
+    response = client.get(f'/transactions/{transaction.id}')
+    assert response.status_code == 200
+    assert "immutable" in response.headers["Cache-Control"]
+    etag = response.headers["ETag"]
+    assert not etag.startswith('W/')
+
+    with patch('app.routes.db.session.get') as mock_get:
+        cached = client.get(f'/transactions/{transaction.id}')
+        mock_get.assert_not_called()
+    assert cached.get_json() == response.get_json()
+
+    revalidated = client.get(f'/transactions/{transaction.id}', headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+
+def test_pending_transaction_is_revalidated_not_cached(client, db, cache, make_transaction):
+    """Testa que transações PENDING não entram no cache e exigem revalidação."""
+    transaction = make_transaction(TransactionStatus.PENDING)
+    response = client.get(f'/transactions/{transaction.id}')
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert cache.get(transaction.id) is None
+
+    transaction.status = TransactionStatus.FAILED
+    db.session.commit()
+    response = client.get(f'/transactions/{transaction.id}', headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 200 # Mudou de estado: novo ETag
+    assert response.get_json()["status"] == TransactionStatus.FAILED.value
+
+def test_cancellation_invalidates_cached_completed_transaction(client, db, cache, make_transaction):
+    """Testa que o estorno remove a transação COMPLETED do cache."""
+    transaction = make_transaction(TransactionStatus.COMPLETED)
+    response = client.get(f'/transactions/{transaction.id}')
+    assert response.headers["Cache-Control"] == "private, max-age=60"
+    assert cache.get(transaction.id) is not None
+
+    assert client.post(f'/transactions/{transaction.id}/cancel').status_code == 200
+    assert client.get(f'/transactions/{transaction.id}').get_json()["status"] == TransactionStatus.CANCELLED.value
+
+def test_cache_is_bounded(db, cache, make_transaction, app):
+    """Testa o limite do LRU."""
+    transactions = [make_transaction(TransactionStatus.FAILED) for _ in range(3)]
+    for transaction in transactions:
+        cache.entry_for(transaction.id, transaction.status, b"{}")
+    assert cache.get(transactions[0].id) is None
+    assert cache.get(transactions[2].id) is not None